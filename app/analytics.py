@@ -0,0 +1,238 @@
+"""
+Guild analytics aggregated in the database.
+
+get_guild_analytics() used to load every Character of a guild and count them in
+Python. The analytics are now built from per-guild counters (GuildAnalyticsCounter
+rows, see character_counters()) whose number depends on the number of distinct
+levels, classes, races and specs - not on the number of members:
+
+- (level, class) counts: class, level, level-by-class and level 60 breakdowns
+- race counts
+- (class, spec) counts of level 60 characters
+- spec counts
+- totals: members, item level sum/count, characters with profiles
+
+The syncs keep the counters current by applying the counter difference of every
+character they add, change or remove (cost proportional to churn). Guilds whose
+counters were never built (guild.counters_rebuilt_at is None) are counted with
+the equivalent GROUP BY queries instead (recompute_counters()), which is also
+what check_analytics_counters.py compares the stored counters against.
+
+Only the top level 60 PvP killers are loaded as Character rows. The returned dict
+has the same keys as before; 'characters' is a query that is only run if iterated.
+
+Syncs store the result as a GuildAnalyticsSnapshot (serialize_analytics) in the
+transaction that changes the guild's data, so page views only read the snapshot
+(restore_analytics). A snapshot is current while its data_version matches
+guild.data_version and its format_version matches ANALYTICS_SNAPSHOT_VERSION.
+"""
+import json
+from collections import Counter
+from app import db
+from app.models import Character, GuildAnalyticsCounter
+
+MAX_LEVEL = 60
+
+# Bump when the stored analytics format changes; older snapshots are rebuilt on read
+ANALYTICS_SNAPSHOT_VERSION = 1
+
+# Character fields kept for PvP players in snapshots and cached leaderboards
+TOP_PVP_FIELDS = ('id', 'name', 'level', 'character_class', 'avatar_url', 'honorable_kills', 'pvp_rank')
+
+# Character fields the analytics counters depend on
+COUNTER_FIELDS = ('level', 'character_class', 'race', 'spec_name', 'average_item_level', 'gender')
+
+
+def _or_unknown(column):
+    """SQL for `value or 'Unknown'` (NULL and empty string both become 'Unknown')"""
+    return db.func.coalesce(db.func.nullif(column, ''), 'Unknown')
+
+
+def counter_values(character):
+    """The COUNTER_FIELDS of a character, as a dict"""
+    return {field: getattr(character, field) for field in COUNTER_FIELDS}
+
+
+def character_counters(values):
+    """
+    What one character adds to its guild's counters: Counter of (dimension, bucket)
+    -> amount, from a dict of its COUNTER_FIELDS. Same rules as recompute_counters().
+    """
+    level = values['level'] or 0
+    class_name = values['character_class'] or 'Unknown'
+    counters = Counter({
+        ('members', ''): 1,
+        ('level_class', f'{level}|{class_name}'): 1,
+        ('race', values['race'] or 'Unknown'): 1,
+    })
+    if values['spec_name']:
+        counters[('spec', values['spec_name'])] = 1
+    if level == MAX_LEVEL:
+        counters[('level_60_class_spec', f"{class_name}|{values['spec_name'] or 'Unknown'}")] = 1
+    if values['average_item_level']:
+        counters[('item_level', 'sum')] = values['average_item_level']
+        counters[('item_level', 'count')] = 1
+    if values['average_item_level'] or values['gender']:
+        counters[('profiles', '')] = 1
+    return counters
+
+
+def recompute_counters(guild_id):
+    """A guild's counters counted from scratch with GROUP BY queries"""
+    in_guild = Character.guild_id == guild_id
+    level = db.func.coalesce(Character.level, 0)
+    character_class = _or_unknown(Character.character_class)
+    counters = Counter()
+
+    for char_level, class_name, count in db.session.query(
+        level, character_class, db.func.count()
+    ).filter(in_guild).group_by(level, character_class):
+        counters[('members', '')] += count
+        counters[('level_class', f'{char_level}|{class_name}')] = count
+
+    race = _or_unknown(Character.race)
+    for race_name, count in db.session.query(race, db.func.count()).filter(in_guild).group_by(race):
+        counters[('race', race_name)] = count
+
+    for spec_name, count in db.session.query(Character.spec_name, db.func.count()).filter(
+        in_guild, Character.spec_name.isnot(None), Character.spec_name != ''
+    ).group_by(Character.spec_name):
+        counters[('spec', spec_name)] = count
+
+    spec = _or_unknown(Character.spec_name)
+    for class_name, spec_name, count in db.session.query(
+        character_class, spec, db.func.count()
+    ).filter(in_guild, Character.level == MAX_LEVEL).group_by(character_class, spec):
+        counters[('level_60_class_spec', f'{class_name}|{spec_name}')] = count
+
+    has_item_level = db.and_(Character.average_item_level.isnot(None), Character.average_item_level != 0)
+    has_gender = db.and_(Character.gender.isnot(None), Character.gender != '')
+    item_level_sum, item_level_count, chars_with_profiles = db.session.query(
+        db.func.sum(db.case((has_item_level, Character.average_item_level), else_=0)),
+        db.func.count(db.case((has_item_level, 1))),
+        db.func.count(db.case((db.or_(has_item_level, has_gender), 1)))
+    ).filter(in_guild).one()
+    counters[('item_level', 'sum')] = item_level_sum or 0
+    counters[('item_level', 'count')] = item_level_count
+    counters[('profiles', '')] = chars_with_profiles
+
+    # Stored counters never keep zero rows
+    return +counters
+
+
+def load_counters(guild_id):
+    """A guild's stored GuildAnalyticsCounter rows as a Counter"""
+    return Counter({
+        (dimension, bucket): value for dimension, bucket, value in db.session.query(
+            GuildAnalyticsCounter.dimension, GuildAnalyticsCounter.bucket, GuildAnalyticsCounter.value
+        ).filter(GuildAnalyticsCounter.guild_id == guild_id)
+    })
+
+
+def compute_guild_analytics(guild):
+    """Analytics dict for a guild (see GuildService.get_guild_analytics)"""
+    if guild.counters_rebuilt_at is not None:
+        counters = load_counters(guild.id)
+    else:
+        counters = recompute_counters(guild.id)
+    return analytics_from_counters(guild, counters)
+
+
+def _buckets(counters, dimension):
+    """(bucket, value) pairs of one dimension, sorted by bucket"""
+    return sorted((bucket, value) for (name, bucket), value in counters.items() if name == dimension)
+
+
+def analytics_from_counters(guild, counters):
+    """Analytics dict from a guild's counters (plus one query for the top PvP killers)"""
+    # Level x class: everything the class and level charts need
+    class_distribution = {}
+    level_distribution = {}
+    level_class_distribution = {}
+    level_60_by_class = {}
+    all_classes = set()
+    level_class = []
+    for bucket, count in _buckets(counters, 'level_class'):
+        char_level, class_name = bucket.split('|', 1)
+        level_class.append((int(char_level), class_name, count))
+    for char_level, class_name, count in sorted(level_class):
+        class_distribution[class_name] = class_distribution.get(class_name, 0) + count
+        level_distribution[char_level] = level_distribution.get(char_level, 0) + count
+        if char_level == MAX_LEVEL:
+            level_60_by_class[class_name] = count
+        else:
+            # The stacked level-by-class chart leaves out level 60
+            all_classes.add(class_name)
+            level_class_distribution.setdefault(char_level, {})[class_name] = count
+
+    race_distribution = dict(_buckets(counters, 'race'))
+    spec_distribution = dict(_buckets(counters, 'spec'))
+
+    level_60_class_spec = {}
+    for bucket, count in _buckets(counters, 'level_60_class_spec'):
+        class_name, spec_name = bucket.split('|', 1)
+        level_60_class_spec.setdefault(class_name, {})[spec_name] = count
+
+    total_members = counters[('members', '')]
+    item_level_count = counters[('item_level', 'count')]
+    chars_with_profiles = counters[('profiles', '')]
+    avg_ilvl = counters[('item_level', 'sum')] / item_level_count if item_level_count else 0
+
+    total_60s = sum(level_60_by_class.values())
+    level_60_percentages = {}
+    if total_60s > 0:
+        for class_name, count in level_60_by_class.items():
+            level_60_percentages[class_name] = round((count / total_60s) * 100, 1)
+
+    in_guild = Character.guild_id == guild.id
+    top_pvp_60 = Character.query.filter(
+        in_guild, Character.level == MAX_LEVEL, Character.honorable_kills > 0
+    ).order_by(Character.honorable_kills.desc(), Character.id).limit(5).all()
+
+    data_completeness = round((chars_with_profiles / total_members * 100), 1) if total_members else 0
+
+    return {
+        'guild': guild,
+        'total_members': total_members,
+        'class_distribution': class_distribution,
+        'race_distribution': race_distribution,
+        'level_distribution': level_distribution,
+        'level_class_distribution': level_class_distribution,
+        'all_classes': sorted(all_classes),
+        'level_60_count': total_60s,
+        'level_60_by_class': level_60_by_class,
+        'level_60_percentages': level_60_percentages,
+        'level_60_class_spec': level_60_class_spec,
+        'average_item_level': round(avg_ilvl, 2),
+        'top_pvp_60': top_pvp_60,
+        'spec_distribution': spec_distribution,
+        'characters': Character.query.filter(in_guild),
+        'data_completeness': data_completeness,
+        'chars_with_profiles': chars_with_profiles
+    }
+
+
+def serialize_analytics(analytics):
+    """JSON text of an analytics dict for a snapshot (without the guild and characters)"""
+    data = {key: value for key, value in analytics.items() if key not in ('guild', 'characters')}
+    data['top_pvp_60'] = [pvp_player_dict(player) for player in analytics['top_pvp_60']]
+    return json.dumps(data)
+
+
+def pvp_player_dict(character):
+    """The TOP_PVP_FIELDS of a character (templates read dicts and Characters the same way)"""
+    return {field: getattr(character, field) for field in TOP_PVP_FIELDS}
+
+
+def restore_analytics(guild, data):
+    """
+    Analytics dict from decoded snapshot JSON. Level keys become integers again, and
+    the top PvP killers stay dicts with the TOP_PVP_FIELDS.
+    """
+    data['level_distribution'] = {int(level): count for level, count in data['level_distribution'].items()}
+    data['level_class_distribution'] = {
+        int(level): classes for level, classes in data['level_class_distribution'].items()
+    }
+    data['guild'] = guild
+    data['characters'] = Character.query.filter(Character.guild_id == guild.id)
+    return data
@@ -1,20 +1,157 @@
+import os
+import random
+import threading
+import time
 import requests
 import unicodedata
-from datetime import datetime, timedelta
+from collections import namedtuple
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from flask import current_app
+from requests.adapters import HTTPAdapter
 from urllib.parse import quote
+from app.token_cache import get_token_cache
+from app.rate_limiter import get_rate_limiter, bucket_for_endpoint, RateLimitWaitExceeded
+
+# Per-character profile endpoints fetched by the detail sync
+CHARACTER_ENDPOINTS = ('profile', 'specializations', 'character-media', 'pvp-summary')
+
+# Result of a conditional request: data is None when the server answered 304 Not Modified
+ConditionalResult = namedtuple('ConditionalResult', ['data', 'etag', 'last_modified', 'not_modified'])
+
+class BattleNetAPIError(Exception):
+    """
+    Error talking to the Battle.net API.
+    
+    Attributes:
+        status_code: HTTP status (None for connection errors)
+        retryable: True if repeating the same request may succeed
+        retry_after: Seconds the server asked us to wait (Retry-After), if any
+    """
+    def __init__(self, message, status_code=None, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+class BattleNetNotFoundError(BattleNetAPIError):
+    """404 - character/guild does not exist or is not indexed by the API"""
+
+class BattleNetAuthError(BattleNetAPIError):
+    """401/403 - credentials rejected or token expired"""
+
+class BattleNetRateLimitError(BattleNetAPIError):
+    """429 - quota exceeded (or our own limiter gave up waiting)"""
+
+class BattleNetServerError(BattleNetAPIError):
+    """5xx - transient server-side failure"""
+
+class BattleNetConnectionError(BattleNetAPIError):
+    """Network failure or timeout before a response was received"""
+
+def _parse_retry_after(value):
+    """Parse a Retry-After header (delta-seconds or HTTP date) into seconds"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def error_from_response(response, message_prefix='API request failed'):
+    """Build the typed BattleNetAPIError for a non-success response"""
+    status = response.status_code
+    message = f"{message_prefix}: {status} - {response.text}"
+    retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+    
+    if status == 404:
+        return BattleNetNotFoundError(message, status)
+    if status in (401, 403):
+        # A 401 usually means the cached token expired early; one retry with a fresh token is worthwhile
+        return BattleNetAuthError(message, status, retryable=(status == 401))
+    if status == 429:
+        return BattleNetRateLimitError(message, status, retryable=True, retry_after=retry_after)
+    if status >= 500:
+        return BattleNetServerError(message, status, retryable=True, retry_after=retry_after)
+    return BattleNetAPIError(message, status)
+
+class RetryPolicy:
+    """
+    Central retry policy for Battle.net calls: jittered exponential backoff
+    ("full jitter") that honours Retry-After, and never retries errors that
+    cannot succeed (404, 400, 403, ...).
+    """
+    def __init__(self, max_attempts, base_delay, max_delay, max_retry_after):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+    
+    @classmethod
+    def from_config(cls):
+        return cls(
+            max_attempts=current_app.config.get('API_MAX_RETRIES', 3),
+            base_delay=current_app.config.get('API_RETRY_DELAY', 1.0),
+            max_delay=current_app.config.get('API_RETRY_MAX_DELAY', 30.0),
+            max_retry_after=current_app.config.get('API_RETRY_AFTER_MAX', 120.0)
+        )
+    
+    def delay_for(self, attempt, error):
+        """Seconds to wait before retry number `attempt` (0-based), or None to give up"""
+        if not getattr(error, 'retryable', False) or attempt >= self.max_attempts - 1:
+            return None
+        
+        backoff = min(self.max_delay, self.base_delay * (2 ** attempt))
+        delay = random.uniform(0, backoff)
+        
+        if error.retry_after is not None:
+            if error.retry_after > self.max_retry_after:
+                return None  # Server wants us gone for longer than a sync can afford to wait
+            delay = max(delay, error.retry_after)
+        return delay
+    
+    def call(self, send, description):
+        """Run `send()` until it succeeds, raises a non-retryable error or attempts run out"""
+        attempt = 0
+        while True:
+            try:
+                return send()
+            except BattleNetAPIError as e:
+                delay = self.delay_for(attempt, e)
+                if delay is None:
+                    raise
+                current_app.logger.warning(
+                    f"API error for {description} (attempt {attempt + 1}/{self.max_attempts}): {str(e)[:200]}. "
+                    f"Retrying in {delay:.1f}s..."
+                )
+                time.sleep(delay)
+                attempt += 1
 
 class BattleNetAPI:
+    # Pooled keep-alive HTTP session shared by every instance in this process.
+    # A new BattleNetAPI() is built per web request and per Celery task, so the
+    # session lives on the class to reuse TCP/TLS connections across all of them.
+    _session = None
+    _session_pid = None
+    _session_lock = threading.Lock()
+    
     def __init__(self):
         self.client_id = current_app.config['BNET_CLIENT_ID']
         self.client_secret = current_app.config['BNET_CLIENT_SECRET']
         self.region = current_app.config['BNET_REGION']
         self.access_token = None
-        self.token_expires = None
         
-        # API endpoints based on region
-        self.oauth_url = f'https://{self.region}.battle.net/oauth/token'
-        self.api_base = f'https://{self.region}.api.blizzard.com'
+        self.timeout = current_app.config.get('API_REQUEST_TIMEOUT', 30.0)
+        self.retry_policy = RetryPolicy.from_config()
+        
+        # API endpoints based on region (overridable to point at a local mock server)
+        self.oauth_url = current_app.config.get('BNET_OAUTH_URL') or f'https://{self.region}.battle.net/oauth/token'
+        self.api_base = current_app.config.get('BNET_API_BASE_URL') or f'https://{self.region}.api.blizzard.com'
         
         # For Classic Anniversary/Era (1.14.x), use 'classic1x' namespace
         # For regular Classic (Cataclysm), use 'classic' namespace
@@ -22,53 +159,153 @@ class BattleNetAPI:
         self.namespace = f'profile-classic1x-{self.region}'
         self.namespace_static = f'static-classic1x-{self.region}'
     
-    def get_access_token(self):
-        """Obtain OAuth access token from Battle.net"""
-        if self.access_token and self.token_expires and datetime.now() < self.token_expires:
-            return self.access_token
+    @classmethod
+    def _get_session(cls):
+        """
+        Return the process-wide pooled session, creating it on first use.
+        The session is rebuilt after a fork (Celery prefork, gunicorn workers)
+        so that child processes never share sockets with their parent.
+        """
+        pid = os.getpid()
+        if cls._session is not None and cls._session_pid == pid:
+            return cls._session
         
+        with cls._session_lock:
+            if cls._session is None or cls._session_pid != pid:
+                pool_connections = current_app.config.get('API_POOL_CONNECTIONS', 4)
+                pool_maxsize = current_app.config.get('API_POOL_MAXSIZE', 10)
+                
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=pool_connections,  # Number of hosts to keep pools for
+                    pool_maxsize=pool_maxsize,  # Keep-alive connections kept per host
+                    pool_block=False
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                
+                if not current_app.config.get('API_KEEPALIVE', True):
+                    # Benchmark/debug switch: force a new connection per request
+                    session.headers['Connection'] = 'close'
+                
+                cls._session = session
+                cls._session_pid = pid
+                current_app.logger.debug(
+                    f"Created pooled Battle.net HTTP session (pool_connections={pool_connections}, pool_maxsize={pool_maxsize})"
+                )
+        return cls._session
+    
+    @classmethod
+    def close_session(cls):
+        """Close the shared session and release its pooled connections"""
+        with cls._session_lock:
+            if cls._session is not None:
+                cls._session.close()
+            cls._session = None
+            cls._session_pid = None
+    
+    def get_access_token(self):
+        """Obtain OAuth access token from Battle.net (shared by all instances via the token cache)"""
+        self.access_token = get_token_cache(self.oauth_url, self.client_id).get_token(self._request_access_token)
+        return self.access_token
+    
+    def _request_access_token(self):
+        """Request a new OAuth token. Returns (access_token, expires_in_seconds)."""
         current_app.logger.info("Requesting new Battle.net OAuth token...")
-        response = requests.post(
-            self.oauth_url,
-            auth=(self.client_id, self.client_secret),
-            data={'grant_type': 'client_credentials'}
-        )
         
-        if response.status_code == 200:
-            data = response.json()
-            self.access_token = data['access_token']
-            # Set expiration to 5 minutes before actual expiration for safety
-            self.token_expires = datetime.now() + timedelta(seconds=data['expires_in'] - 300)
-            current_app.logger.info("✅ OAuth token obtained successfully")
-            return self.access_token
-        else:
-            current_app.logger.error(f"Failed to get access token: {response.status_code} - {response.text}")
-            raise Exception(f"Failed to get access token: {response.status_code} - {response.text}")
-    
-    def _make_request(self, endpoint, params=None):
-        """Make authenticated request to Battle.net API"""
-        token = self.get_access_token()
+        def send():
+            try:
+                response = self._get_session().post(
+                    self.oauth_url,
+                    auth=(self.client_id, self.client_secret),
+                    data={'grant_type': 'client_credentials'},
+                    timeout=self.timeout
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                raise BattleNetConnectionError(f"OAuth connection error: {e}", retryable=True) from e
+            
+            if response.status_code != 200:
+                current_app.logger.error(f"Failed to get access token: {response.status_code} - {response.text}")
+                error = error_from_response(response, 'Failed to get access token')
+                if isinstance(error, BattleNetAuthError):
+                    error.retryable = False  # Bad client credentials will not fix themselves
+                raise error
+            return response
+        
+        data = self.retry_policy.call(send, 'OAuth token request').json()
+        current_app.logger.info("✅ OAuth token obtained successfully")
+        return data['access_token'], data['expires_in']
+    
+    def _make_request(self, endpoint, params=None, validators=None):
+        """
+        Make authenticated request to Battle.net API.
+        
+        Transient failures (5xx, 429, connection errors, an expired token) are retried
+        according to the client's RetryPolicy; anything else raises a typed
+        BattleNetAPIError straight away.
         
+        When `validators` is given (a dict with optional 'etag' and 'last_modified' keys,
+        possibly empty) the request is made conditional and a ConditionalResult is returned
+        instead of the parsed JSON, so callers can tell a 304 Not Modified apart.
+        """
         if params is None:
             params = {}
         
         params['locale'] = 'en_US'
         
-        headers = {
-            'Authorization': f'Bearer {token}'
-        }
-        
         url = f"{self.api_base}{endpoint}"
-        current_app.logger.debug(f"API Request: {url} with params {params}")
         
-        response = requests.get(url, headers=headers, params=params)
+        def send():
+            token = self.get_access_token()
+            headers = {
+                'Authorization': f'Bearer {token}'
+            }
+            
+            if validators:
+                if validators.get('etag'):
+                    headers['If-None-Match'] = validators['etag']
+                if validators.get('last_modified'):
+                    headers['If-Modified-Since'] = validators['last_modified']
+            
+            current_app.logger.debug(f"API Request: {url} with params {params}")
+            
+            # Take a token from the shared quota bucket before every API call
+            try:
+                get_rate_limiter().acquire(bucket_for_endpoint(endpoint))
+            except RateLimitWaitExceeded as e:
+                raise BattleNetRateLimitError(str(e)) from e
+            
+            try:
+                response = self._get_session().get(url, headers=headers, params=params, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                raise BattleNetConnectionError(f"API connection error for {endpoint}: {e}", retryable=True) from e
+            
+            if response.status_code == 304 and validators is not None:
+                current_app.logger.debug(f"API Response: 304 Not Modified")
+                return ConditionalResult(
+                    None,
+                    response.headers.get('ETag') or validators.get('etag'),
+                    response.headers.get('Last-Modified') or validators.get('last_modified'),
+                    True
+                )
+            elif response.status_code == 200:
+                current_app.logger.debug(f"API Response: {response.status_code} OK")
+                if validators is not None:
+                    return ConditionalResult(
+                        response.json(),
+                        response.headers.get('ETag'),
+                        response.headers.get('Last-Modified'),
+                        False
+                    )
+                return response.json()
+            else:
+                if response.status_code == 401:
+                    # Token was revoked or expired early - make the next call fetch a new one
+                    get_token_cache(self.oauth_url, self.client_id).invalidate(token)
+                current_app.logger.debug(f"API Response: {response.status_code} - {response.text[:200]}")
+                raise error_from_response(response)
         
-        if response.status_code == 200:
-            current_app.logger.debug(f"API Response: {response.status_code} OK")
-            return response.json()
-        else:
-            current_app.logger.debug(f"API Response: {response.status_code} - {response.text[:200]}")
-            raise Exception(f"API request failed: {response.status_code} - {response.text}")
+        return self.retry_policy.call(send, endpoint)
     
     def _normalize_character_name(self, name):
         """
@@ -94,14 +331,14 @@ class BattleNetAPI:
         params = {'namespace': self.namespace}
         return self._make_request(endpoint, params)
     
-    def get_character_profile(self, realm_slug, character_name_slug):
+    def get_character_profile(self, realm_slug, character_name_slug, validators=None):
         """Get character profile summary"""
         # Normalize the character name
         normalized_name = self._normalize_character_name(character_name_slug)
         endpoint = f"/profile/wow/character/{realm_slug}/{normalized_name}"
         params = {'namespace': self.namespace}
         current_app.logger.debug(f"Fetching profile for character: {character_name_slug} (normalized: {normalized_name})")
-        return self._make_request(endpoint, params)
+        return self._make_request(endpoint, params, validators)
     
     def get_character_equipment(self, realm_slug, character_name_slug):
         """Get character equipment"""
@@ -110,26 +347,26 @@ class BattleNetAPI:
         params = {'namespace': self.namespace}
         return self._make_request(endpoint, params)
     
-    def get_character_specializations(self, realm_slug, character_name_slug):
+    def get_character_specializations(self, realm_slug, character_name_slug, validators=None):
         """Get character specializations"""
         normalized_name = self._normalize_character_name(character_name_slug)
         endpoint = f"/profile/wow/character/{realm_slug}/{normalized_name}/specializations"
         params = {'namespace': self.namespace}
-        return self._make_request(endpoint, params)
+        return self._make_request(endpoint, params, validators)
     
-    def get_character_media(self, realm_slug, character_name_slug):
+    def get_character_media(self, realm_slug, character_name_slug, validators=None):
         """Get character media (avatar, renders)"""
         normalized_name = self._normalize_character_name(character_name_slug)
         endpoint = f"/profile/wow/character/{realm_slug}/{normalized_name}/character-media"
         params = {'namespace': self.namespace}
-        return self._make_request(endpoint, params)
+        return self._make_request(endpoint, params, validators)
     
-    def get_character_pvp_summary(self, realm_slug, character_name_slug):
+    def get_character_pvp_summary(self, realm_slug, character_name_slug, validators=None):
         """Get character PvP summary (honorable kills, pvp rank)"""
         normalized_name = self._normalize_character_name(character_name_slug)
         endpoint = f"/profile/wow/character/{realm_slug}/{normalized_name}/pvp-summary"
         params = {'namespace': self.namespace}
-        return self._make_request(endpoint, params)
+        return self._make_request(endpoint, params, validators)
     
     def get_primary_spec_from_talents(self, spec_data):
 
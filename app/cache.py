@@ -0,0 +1,130 @@
+"""
+Versioned response cache for guild pages.
+
+Cached values are keyed by guild ID plus guild.data_version, which every sync
+that changes a guild's data bumps when it commits its result (see
+GuildService._bump_data_version).
+A sync therefore makes all older entries unreachable at once; nothing has to be
+deleted and no TTL has to guess how long data stays valid. Entries still get
+CACHE_TTL_SECONDS in Redis, only so unreachable versions are eventually evicted.
+
+- Values are JSON (the callers cache plain dicts and lists, never ORM objects).
+- Entries live in Redis, shared by every gunicorn worker. Without Redis each
+  process falls back to a small in-memory LRU of CACHE_LOCAL_MAX_ENTRIES.
+- Hits and misses are counted per namespace (see get_metrics()).
+"""
+import json
+import threading
+from collections import OrderedDict
+from flask import current_app
+from app.redis_client import get_redis, report_redis_error, RedisError
+
+KEY_PREFIX = 'guildcache'
+
+
+class VersionedCache:
+    """Guild data cache keyed by (namespace, guild ID, data version, params)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local_entries = OrderedDict()  # key -> JSON text, least recently used first
+        self.metrics = {}  # namespace -> {'hits': n, 'misses': n}
+
+    def get_or_compute(self, namespace, guild_id, data_version, compute, params=None):
+        """
+        Return the cached value for this guild version, or compute() and cache it.
+
+        Args:
+            namespace: What is cached ('analytics', 'pvp', 'raid_roster', ...)
+            guild_id: Database ID of the guild
+            data_version: The guild's current data_version
+            compute: Callable returning a JSON-serializable value
+            params: Optional string distinguishing variants (e.g. a level bracket)
+        """
+        if not current_app.config.get('CACHE_ENABLED', True):
+            return compute()
+
+        key = self._key(namespace, guild_id, data_version, params)
+        text = self._get(key)
+        if text is not None:
+            self._record(namespace, hit=True)
+            return json.loads(text)
+
+        self._record(namespace, hit=False)
+        value = compute()
+        self._set(key, json.dumps(value))
+        return value
+
+    def get_metrics(self):
+        """Hit/miss counters for this process and, when Redis is available, for all processes"""
+        with self.lock:
+            metrics = {
+                'process': {namespace: dict(values) for namespace, values in self.metrics.items()}
+            }
+
+        client = get_redis()
+        if client is not None:
+            try:
+                shared = {}
+                for field, count in client.hgetall(f'{KEY_PREFIX}:metrics').items():
+                    namespace, counter = field.decode('utf-8').rsplit(':', 1)
+                    shared.setdefault(namespace, {'hits': 0, 'misses': 0})[counter] = int(count)
+                metrics['all_processes'] = shared
+            except RedisError as e:
+                report_redis_error(e)
+        return metrics
+
+    def _key(self, namespace, guild_id, data_version, params):
+        key = f'{KEY_PREFIX}:{namespace}:{guild_id}:v{data_version}'
+        return f'{key}:{params}' if params else key
+
+    def _get(self, key):
+        client = get_redis()
+        if client is not None:
+            try:
+                text = client.get(key)
+                return text.decode('utf-8') if text is not None else None
+            except RedisError as e:
+                report_redis_error(e)
+
+        with self.lock:
+            text = self.local_entries.get(key)
+            if text is not None:
+                self.local_entries.move_to_end(key)
+            return text
+
+    def _set(self, key, text):
+        client = get_redis()
+        if client is not None:
+            try:
+                client.set(key, text, ex=current_app.config.get('CACHE_TTL_SECONDS', 86400))
+                return
+            except RedisError as e:
+                report_redis_error(e)
+
+        max_entries = current_app.config.get('CACHE_LOCAL_MAX_ENTRIES', 256)
+        with self.lock:
+            self.local_entries[key] = text
+            self.local_entries.move_to_end(key)
+            while len(self.local_entries) > max_entries:
+                self.local_entries.popitem(last=False)
+
+    def _record(self, namespace, hit):
+        counter = 'hits' if hit else 'misses'
+        with self.lock:
+            self.metrics.setdefault(namespace, {'hits': 0, 'misses': 0})[counter] += 1
+
+        client = get_redis()
+        if client is not None:
+            try:
+                client.hincrby(f'{KEY_PREFIX}:metrics', f'{namespace}:{counter}', 1)
+            except RedisError as e:
+                report_redis_error(e)
+
+
+_cache = VersionedCache()
+
+
+def get_cache():
+    """Return the process-wide guild data cache"""
+    return _cache
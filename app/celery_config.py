@@ -57,6 +57,34 @@ def make_celery(app_name=__name__):
                     'expires': 3600,  # Task expires if not run within 1 hour
                 }
             },
+            'refresh-stale-characters': {
+                'task': 'app.tasks.refresh_characters_scheduled',
+                'schedule': crontab(minute=30),  # Hourly, away from the 3 AM full sync
+                'options': {
+                    'expires': 1800,
+                }
+            },
+            'check-analytics-counters': {
+                'task': 'app.tasks.check_analytics_counters',
+                'schedule': crontab(hour=5, minute=0),  # Daily, after the 3 AM syncs
+                'options': {
+                    'expires': 3600,
+                }
+            },
+            'prune-unindexed-characters': {
+                'task': 'app.tasks.prune_unindexed_characters',
+                'schedule': crontab(hour=4, minute=0),  # Daily, after the 3 AM syncs refreshed live entries
+                'options': {
+                    'expires': 3600,
+                }
+            },
+            'retry-failed-characters': {
+                'task': 'app.tasks.retry_failed_characters',
+                'schedule': 300.0,  # Every 5 minutes
+                'options': {
+                    'expires': 300,  # Skip if the previous run is still queued
+                }
+            },
         },
     )
     
@@ -1,5 +1,6 @@
 from app import db
 from datetime import datetime
+import json
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -30,11 +31,69 @@ class Guild(db.Model):
     realm = db.Column(db.String(100), nullable=False)
     faction = db.Column(db.String(20))
     member_count = db.Column(db.Integer)
+    roster_hash = db.Column(db.String(64))  # Fingerprint of the last synced roster (member IDs, levels, ranks)
+    data_version = db.Column(db.Integer, nullable=False, default=0)  # Bumped by every sync commit that changes the guild's data
+    counters_rebuilt_at = db.Column(db.DateTime)  # Last full rebuild of the analytics counters (None = not maintained yet)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow)
     members = db.relationship('Character', backref='guild', lazy=True)
     history_logs = db.relationship('GuildMemberHistory', backref='guild', lazy=True, order_by='GuildMemberHistory.timestamp.desc()')
     progression_logs = db.relationship('CharacterProgressionHistory', backref='guild', lazy=True, order_by='CharacterProgressionHistory.timestamp.desc()')
 
+class GuildAnalyticsSnapshot(db.Model):
+    """Precomputed guild analytics, stored by the sync that last changed the guild's data"""
+    id = db.Column(db.Integer, primary_key=True)
+    guild_id = db.Column(db.Integer, db.ForeignKey('guild.id'), nullable=False, unique=True, index=True)
+    data_version = db.Column(db.Integer, nullable=False)  # guild.data_version the analytics were computed at
+    format_version = db.Column(db.Integer, nullable=False)  # ANALYTICS_SNAPSHOT_VERSION of the stored JSON
+    data = db.Column(db.Text, nullable=False)  # JSON analytics dict (see app/analytics.py)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<GuildAnalyticsSnapshot guild={self.guild_id} v{self.data_version}>'
+
+class GuildAnalyticsCounter(db.Model):
+    """One analytics counter of a guild, kept current by the syncs (see app/analytics.py)"""
+    __table_args__ = (
+        db.UniqueConstraint('guild_id', 'dimension', 'bucket', name='uq_guild_analytics_counter'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    guild_id = db.Column(db.Integer, db.ForeignKey('guild.id'), nullable=False)
+    dimension = db.Column(db.String(30), nullable=False)  # 'level_class', 'race', 'spec', 'level_60_class_spec', ...
+    bucket = db.Column(db.String(120), nullable=False)  # e.g. '60|Warrior' for level_class
+    value = db.Column(db.Integer, nullable=False)
+    
+    def __repr__(self):
+        return f'<GuildAnalyticsCounter guild={self.guild_id} {self.dimension}[{self.bucket}]={self.value}>'
+
+class GuildDailyRollup(db.Model):
+    """One row of guild metrics per guild per day (UTC), for trend charts"""
+    __table_args__ = (
+        # Also serves the date-range queries of the trends API
+        db.UniqueConstraint('guild_id', 'day', name='uq_guild_daily_rollup'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    guild_id = db.Column(db.Integer, db.ForeignKey('guild.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    member_count = db.Column(db.Integer, nullable=False)
+    level_60_count = db.Column(db.Integer, nullable=False)
+    average_item_level = db.Column(db.Float, nullable=False)  # Over members with a known item level
+    class_distribution = db.Column(db.Text, nullable=False)  # JSON {class: members}
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat(),
+            'member_count': self.member_count,
+            'level_60_count': self.level_60_count,
+            'average_item_level': self.average_item_level,
+            'class_distribution': json.loads(self.class_distribution)
+        }
+    
+    def __repr__(self):
+        return f'<GuildDailyRollup guild={self.guild_id} {self.day}>'
+
 class GuildMemberHistory(db.Model):
     """Track member additions and removals from guilds"""
     id = db.Column(db.Integer, primary_key=True)
@@ -50,6 +109,11 @@ class GuildMemberHistory(db.Model):
 
 class CharacterProgressionHistory(db.Model):
     """Track character level and item level progression over time"""
+    __table_args__ = (
+        # Latest-entry lookups per character during roster sync
+        db.Index('ix_progression_character_guild_timestamp', 'character_id', 'guild_id', 'timestamp'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     character_id = db.Column(db.Integer, db.ForeignKey('character.id'), nullable=False)
     guild_id = db.Column(db.Integer, db.ForeignKey('guild.id'), nullable=False)
@@ -61,6 +125,53 @@ class CharacterProgressionHistory(db.Model):
     def __repr__(self):
         return f'<CharacterProgressionHistory char_id={self.character_id} level={self.character_level} ilvl={self.average_item_level} at {self.timestamp}>'
 
+class CharacterEndpointState(db.Model):
+    """HTTP validators (ETag / Last-Modified) and last fetch time per character and Battle.net profile endpoint"""
+    __table_args__ = (
+        db.UniqueConstraint('character_id', 'endpoint', name='uq_character_endpoint_state'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    character_id = db.Column(db.Integer, db.ForeignKey('character.id'), nullable=False, index=True)
+    endpoint = db.Column(db.String(30), nullable=False)  # 'profile', 'specializations', 'character-media', 'pvp-summary'
+    etag = db.Column(db.String(200))
+    last_modified = db.Column(db.String(100))  # HTTP date string, sent back verbatim as If-Modified-Since
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    checked_at = db.Column(db.DateTime)  # Last fetch of this endpoint (200 or 304); see ENDPOINT_TTL_*_HOURS
+    
+    def __repr__(self):
+        return f'<CharacterEndpointState char_id={self.character_id} {self.endpoint}>'
+
+class CharacterSyncRetry(db.Model):
+    """Characters whose detail fetch failed, queued for a retry with backoff"""
+    id = db.Column(db.Integer, primary_key=True)
+    character_id = db.Column(db.Integer, db.ForeignKey('character.id'), nullable=False, unique=True, index=True)
+    reason = db.Column(db.String(500))  # Error message of the last failed attempt
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, index=True)  # Not retried before this time
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<CharacterSyncRetry char_id={self.character_id} attempts={self.attempts} next={self.next_attempt_at}>'
+
+class UnindexedCharacter(db.Model):
+    """Negative cache for characters whose profile endpoint answered 404 (not indexed by Battle.net)"""
+    __table_args__ = (
+        db.UniqueConstraint('realm_slug', 'name', name='uq_unindexed_character'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    realm_slug = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False)  # Lowercase character name
+    level = db.Column(db.Integer)  # Roster level when the 404 was seen; a level change triggers a re-probe
+    first_seen = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_checked = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<UnindexedCharacter {self.name}-{self.realm_slug} until {self.expires_at}>'
+
 class Task(db.Model):
     """Track background task status for guild syncs and other long-running operations"""
     id = db.Column(db.Integer, primary_key=True)
@@ -69,6 +180,8 @@ class Task(db.Model):
     status = db.Column(db.String(20), nullable=False, default='PENDING')  # PENDING, STARTED, SUCCESS, FAILURE, RETRY
     guild_id = db.Column(db.Integer, db.ForeignKey('guild.id'), nullable=True)
     progress = db.Column(db.Integer, default=0)  # 0-100 percentage
+    shards_total = db.Column(db.Integer)  # Sharded character syncs: number of shard subtasks
+    shards_done = db.Column(db.Integer, default=0)  # Shards finished so far (incremented atomically)
     current_step = db.Column(db.String(200))  # Current operation description
     result_message = db.Column(db.Text)  # Success message
     error_message = db.Column(db.Text)  # Error details if failed
@@ -85,6 +198,8 @@ class Task(db.Model):
             'status': self.status,
             'guild_id': self.guild_id,
             'progress': self.progress,
+            'shards_total': self.shards_total,
+            'shards_done': self.shards_done,
             'current_step': self.current_step,
             'result_message': self.result_message,
             'error_message': self.error_message,
@@ -97,9 +212,27 @@ class Task(db.Model):
     def __repr__(self):
         return f'<Task {self.celery_id} {self.task_type} {self.status}>'
 
+class SyncCheckpoint(db.Model):
+    """Progress of a character detail sync, so retries and re-runs resume where it stopped"""
+    id = db.Column(db.Integer, primary_key=True)
+    guild_id = db.Column(db.Integer, db.ForeignKey('guild.id'), nullable=False, index=True)
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=True, index=True)
+    full_guild = db.Column(db.Boolean, default=True, nullable=False)  # False for runs limited to some characters
+    shard = db.Column(db.Integer)  # Shard index within a sharded task (NULL for unsharded runs)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    remaining_ids = db.Column(db.Text)  # JSON list of character IDs still to process (NULL until the run starts)
+    last_character_id = db.Column(db.Integer)
+    counters = db.Column(db.Text)  # JSON: changed, unchanged, failed, skipped, unindexed_skipped
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    completed_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<SyncCheckpoint guild={self.guild_id} task={self.task_id} shard={self.shard} last_char={self.last_character_id}>'
+
 class Character(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    bnet_id = db.Column(db.BigInteger, index=True)  # Battle.net character ID
+    bnet_id = db.Column(db.BigInteger, unique=True, index=True)  # Battle.net character ID
     name = db.Column(db.String(100), nullable=False)
     realm = db.Column(db.String(100), nullable=False)
     level = db.Column(db.Integer)
@@ -116,9 +249,15 @@ class Character(db.Model):
     avatar_url = db.Column(db.String(500))  # Character avatar image URL from Battle.net media endpoint
     honorable_kills = db.Column(db.Integer)  # Total honorable kills from PvP combat
     pvp_rank = db.Column(db.Integer)  # Classic WoW honor rank (0-14)
+    roster_hash = db.Column(db.String(40))  # Fingerprint of this member's roster fields at the last roster sync
+    profile_digest = db.Column(db.String(40))  # Digest of the profile fields written by the last detail sync
+    details_checked_at = db.Column(db.DateTime)  # Last successful detail fetch, changed or not
+    checked_level = db.Column(db.Integer)  # Roster level at that fetch; a difference makes the character due
     last_updated = db.Column(db.DateTime, default=datetime.utcnow)
     guild_id = db.Column(db.Integer, db.ForeignKey('guild.id'), nullable=True)
     progression_history = db.relationship('CharacterProgressionHistory', backref='character', lazy=True, order_by='CharacterProgressionHistory.timestamp.desc()', cascade='all, delete-orphan')
+    endpoint_states = db.relationship('CharacterEndpointState', backref='character', lazy=True, cascade='all, delete-orphan')
+    sync_retry = db.relationship('CharacterSyncRetry', backref='character', uselist=False, lazy=True, cascade='all, delete-orphan')
     
     def to_dict(self):
         return {
@@ -5,7 +5,8 @@ Uses GPT-4o to analyze guild rosters and suggest optimal raid groups.
 
 from openai import AzureOpenAI
 from flask import current_app
-from app.models import Character
+from app.models import Guild, Character
+from app.cache import get_cache
 import json
 
 
@@ -32,19 +33,26 @@ class RaidComposerService:
         return self.client
     
     def get_level_60_characters(self, guild_id):
-        """Get all level 60 characters for a guild"""
-        characters = Character.query.filter_by(
-            guild_id=guild_id,
-            level=60
-        ).all()
+        """Get all level 60 characters for a guild (cached per guild data version)"""
+        guild = Guild.query.get(guild_id)
+        if guild is None:
+            return []
         
-        return [{
-            'name': char.name,
-            'class': char.character_class,
-            'spec': char.spec_name,
-            'item_level': char.average_item_level or 0,
-            'equipped_ilvl': char.equipped_item_level or 0
-        } for char in characters]
+        def compute():
+            characters = Character.query.filter_by(
+                guild_id=guild_id,
+                level=60
+            ).all()
+            
+            return [{
+                'name': char.name,
+                'class': char.character_class,
+                'spec': char.spec_name,
+                'item_level': char.average_item_level or 0,
+                'equipped_ilvl': char.equipped_item_level or 0
+            } for char in characters]
+        
+        return get_cache().get_or_compute('raid_roster', guild.id, guild.data_version, compute)
     
     def suggest_raid_composition(self, guild_id, raid_size=40, raid_type='General'):
         """
@@ -0,0 +1,210 @@
+"""
+Token-bucket rate limiter for Battle.net API calls.
+
+Blizzard enforces per-second and per-hour quotas per API client, across every
+process that uses the client credentials. Celery's task rate limit only throttles
+tasks inside one worker, so every HTTP call made by BattleNetAPI takes a token here
+first:
+
+- Separate buckets for the profile (/profile/...) and data (/data/...) namespaces,
+  each with a per-second and a per-hour limit.
+- Buckets live in Redis and are updated by a Lua script, so all gunicorn and
+  Celery processes draw from the same quota. Without Redis each process falls back
+  to its own in-memory buckets.
+- Time spent waiting for tokens is recorded per bucket (see get_metrics()).
+"""
+import hashlib
+import threading
+import time
+from flask import current_app
+from app.redis_client import get_redis, report_redis_error, RedisError
+
+BUCKETS = ('profile', 'data')
+
+
+class RateLimitWaitExceeded(Exception):
+    """A call waited longer than API_RATE_LIMIT_MAX_WAIT for a token"""
+
+# Takes one token from every bucket in KEYS[1..n-1] or none at all.
+# ARGV holds (tokens per millisecond, capacity) pairs for each bucket.
+# Returns 0 when granted, otherwise the milliseconds until a token is available.
+ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local bucket_count = #KEYS - 1
+local tokens = {}
+local wait = 0
+
+for i = 1, bucket_count do
+    local rate = tonumber(ARGV[(i - 1) * 2 + 1])
+    local capacity = tonumber(ARGV[(i - 1) * 2 + 2])
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local available = tonumber(state[1]) or capacity
+    local last = tonumber(state[2]) or now
+    available = math.min(capacity, available + math.max(0, now - last) * rate)
+    tokens[i] = available
+    if available < 1 then
+        wait = math.max(wait, math.ceil((1 - available) / rate))
+    end
+end
+
+for i = 1, bucket_count do
+    local rate = tonumber(ARGV[(i - 1) * 2 + 1])
+    local capacity = tonumber(ARGV[(i - 1) * 2 + 2])
+    if wait == 0 then
+        tokens[i] = tokens[i] - 1
+    end
+    redis.call('HSET', KEYS[i], 'tokens', tostring(tokens[i]), 'ts', now)
+    redis.call('PEXPIRE', KEYS[i], math.ceil(capacity / rate) + 1000)
+end
+
+if wait == 0 then
+    redis.call('HINCRBY', KEYS[#KEYS], 'acquired', 1)
+end
+return wait
+"""
+
+
+class RateLimiter:
+    """Shared token buckets for the Battle.net API quota"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local_buckets = {}  # (bucket, window) -> [tokens, last_refill_monotonic]
+        self.metrics = {bucket: {'acquired': 0, 'throttled': 0, 'wait_seconds': 0.0} for bucket in BUCKETS}
+        self.script = None
+        self.script_client = None
+
+    def acquire(self, bucket):
+        """Block until a token is available in `bucket`. Returns seconds spent waiting."""
+        if not current_app.config.get('API_RATE_LIMIT_ENABLED', True):
+            return 0.0
+
+        limits = self._limits(bucket)
+        max_wait = current_app.config.get('API_RATE_LIMIT_MAX_WAIT', 120.0)
+        started = None
+
+        while True:
+            wait = self._try_acquire(bucket, limits)
+            if wait <= 0:
+                break
+            if started is None:
+                started = time.monotonic()
+            waited = time.monotonic() - started
+            if waited + wait > max_wait:
+                self._record(bucket, waited, granted=False)
+                raise RateLimitWaitExceeded(f"Rate limiter wait exceeded {max_wait}s for '{bucket}' API bucket")
+            # Sleep in short slices so soft time limits can still interrupt the task
+            time.sleep(min(wait, 1.0))
+
+        waited = time.monotonic() - started if started is not None else 0.0
+        self._record(bucket, waited, granted=True)
+        if waited > 0:
+            current_app.logger.debug(f"Rate limiter: waited {waited:.3f}s for '{bucket}' API bucket")
+        return waited
+
+    def get_metrics(self):
+        """Limiter metrics for this process and, when Redis is available, for all processes"""
+        with self.lock:
+            metrics = {
+                'process': {bucket: dict(values) for bucket, values in self.metrics.items()}
+            }
+
+        client = get_redis()
+        if client is not None:
+            try:
+                shared = {}
+                for bucket in BUCKETS:
+                    raw = client.hgetall(self._key(bucket, 'metrics'))
+                    shared[bucket] = {
+                        'acquired': int(raw.get(b'acquired', 0)),
+                        'throttled': int(raw.get(b'throttled', 0)),
+                        'wait_seconds': round(float(raw.get(b'wait_seconds', 0.0)), 3),
+                    }
+                metrics['all_processes'] = shared
+            except RedisError as e:
+                report_redis_error(e)
+        return metrics
+
+    def _limits(self, bucket):
+        """[(tokens per second, capacity), ...] for the per-second and per-hour windows"""
+        prefix = f'API_RATE_LIMIT_{bucket.upper()}'
+        per_second = float(current_app.config.get(f'{prefix}_PER_SECOND', 20))
+        per_hour = float(current_app.config.get(f'{prefix}_PER_HOUR', 6000))
+        return [(per_second, max(per_second, 1.0)), (per_hour / 3600.0, max(per_hour, 1.0))]
+
+    def _key(self, bucket, suffix):
+        client_hash = hashlib.sha1(str(current_app.config.get('BNET_CLIENT_ID')).encode('utf-8')).hexdigest()[:12]
+        return f"bnet:ratelimit:{client_hash}:{bucket}:{suffix}"
+
+    def _try_acquire(self, bucket, limits):
+        """Take one token. Returns 0 on success, otherwise seconds to wait before retrying."""
+        client = get_redis()
+        if client is not None:
+            try:
+                if self.script is None or self.script_client is not client:
+                    self.script = client.register_script(ACQUIRE_SCRIPT)
+                    self.script_client = client
+                args = []
+                for rate, capacity in limits:
+                    args.extend([rate / 1000.0, capacity])
+                wait_ms = self.script(
+                    keys=[self._key(bucket, 'second'), self._key(bucket, 'hour'), self._key(bucket, 'metrics')],
+                    args=args
+                )
+                return int(wait_ms) / 1000.0
+            except RedisError as e:
+                report_redis_error(e)
+
+        return self._try_acquire_local(bucket, limits)
+
+    def _try_acquire_local(self, bucket, limits):
+        """In-process fallback used when Redis is unavailable (limits apply per process)"""
+        now = time.monotonic()
+        with self.lock:
+            states = []
+            wait = 0.0
+            for window, (rate, capacity) in enumerate(limits):
+                state = self.local_buckets.setdefault((bucket, window), [capacity, now])
+                state[0] = min(capacity, state[0] + (now - state[1]) * rate)
+                state[1] = now
+                states.append(state)
+                if state[0] < 1:
+                    wait = max(wait, (1 - state[0]) / rate)
+            if wait == 0:
+                for state in states:
+                    state[0] -= 1
+            return wait
+
+    def _record(self, bucket, waited, granted):
+        with self.lock:
+            values = self.metrics[bucket]
+            if granted:
+                values['acquired'] += 1
+            if waited > 0:
+                values['throttled'] += 1
+                values['wait_seconds'] += waited
+
+        if waited > 0:
+            client = get_redis()
+            if client is not None:
+                try:
+                    pipe = client.pipeline()
+                    pipe.hincrby(self._key(bucket, 'metrics'), 'throttled', 1)
+                    pipe.hincrbyfloat(self._key(bucket, 'metrics'), 'wait_seconds', waited)
+                    pipe.execute()
+                except RedisError as e:
+                    report_redis_error(e)
+
+
+_rate_limiter = RateLimiter()
+
+
+def get_rate_limiter():
+    """Return the process-wide rate limiter"""
+    return _rate_limiter
+
+
+def bucket_for_endpoint(endpoint):
+    """Map an API path to its rate limit bucket"""
+    return 'profile' if endpoint.startswith('/profile/') else 'data'
@@ -0,0 +1,64 @@
+"""
+Shared Redis connection for cross-process coordination between gunicorn and
+Celery workers (OAuth token cache, rate limiting, response caching).
+
+Redis is optional for everything that uses this module: callers get None when
+it is not configured or has recently been unreachable, and fall back to
+in-process behaviour.
+"""
+import os
+import threading
+import time
+from flask import current_app
+
+try:
+    import redis
+    from redis import RedisError
+except ImportError:  # redis is in requirements.txt, but keep the web app usable without it
+    redis = None
+    RedisError = Exception  # Never raised: get_redis() returns None without the client library
+
+# Seconds to stop using Redis after a connection failure
+REDIS_BACKOFF_SECONDS = 30
+
+_client = None
+_client_pid = None
+_unavailable_until = 0.0
+_lock = threading.Lock()
+
+
+def get_redis():
+    """Return the shared Redis client, or None if Redis is disabled or unavailable"""
+    global _client, _client_pid
+
+    if redis is None:
+        return None
+
+    url = current_app.config.get('REDIS_URL')
+    if not url or time.monotonic() < _unavailable_until:
+        return None
+
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _lock:
+        if _client is None or _client_pid != pid:
+            _client = redis.Redis.from_url(
+                url,
+                socket_connect_timeout=current_app.config.get('REDIS_SOCKET_TIMEOUT', 1.0),
+                socket_timeout=current_app.config.get('REDIS_SOCKET_TIMEOUT', 1.0),
+                health_check_interval=30
+            )
+            _client_pid = pid
+    return _client
+
+
+def report_redis_error(error):
+    """Stop using Redis for a short while after a connection error"""
+    global _unavailable_until
+    _unavailable_until = time.monotonic() + REDIS_BACKOFF_SECONDS
+    current_app.logger.warning(
+        f"Redis unavailable ({error}); using in-process fallback for {REDIS_BACKOFF_SECONDS}s"
+    )
+
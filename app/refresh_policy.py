@@ -0,0 +1,176 @@
+"""
+Refresh policy: decides which characters a detail sync should re-fetch, most
+valuable first, so the Battle.net API budget goes to the data the dashboards show.
+
+Each character gets a refresh interval from its recent activity (last_login_timestamp):
+
+- Logged in within the last day: every CHARACTER_REFRESH_ACTIVE_HOURS
+- Logged in within the last week: every CHARACTER_REFRESH_RECENT_HOURS
+- Otherwise (inactive alts, unknown login): every CHARACTER_REFRESH_INACTIVE_HOURS
+
+Max-level characters (CHARACTER_REFRESH_MAX_LEVEL) are refreshed twice as often.
+A character is due once the time since its last detail fetch (details_checked_at)
+exceeds its interval; priority is that staleness as a multiple of the interval.
+Characters never fetched, or whose roster level changed since the last fetch, are
+always due and come first. A detail sync also stamps characters it only probed or
+skipped (404, unindexed, failed), so those cannot keep the never-fetched bonus and
+crowd out the rest of the roster every hour. Stamps younger than the shortest
+interval are left alone, so repeated syncs do not rewrite every character row.
+
+Within a refresh, EndpointPolicy decides which Battle.net endpoints to call: each
+endpoint has a TTL (ENDPOINT_TTL_<NAME>_HOURS, 0 = every time) measured from its
+last fetch (character_endpoint_state.checked_at), and an optional minimum character
+level (ENDPOINT_MIN_LEVEL_<NAME>) below which it is not called at all.
+"""
+from datetime import datetime, timedelta
+from flask import current_app
+from app.bnet_api import CHARACTER_ENDPOINTS
+
+ACTIVE_WINDOW = timedelta(days=1)
+RECENT_WINDOW = timedelta(days=7)
+
+# Added to the priority of characters that must be fetched regardless of staleness
+NEVER_CHECKED_BONUS = 1000.0
+LEVEL_CHANGED_BONUS = 100.0
+
+# Config name part of each endpoint's ENDPOINT_TTL_*_HOURS / ENDPOINT_MIN_LEVEL_* settings
+ENDPOINT_SETTING_NAMES = {
+    'profile': 'PROFILE',
+    'specializations': 'SPECIALIZATIONS',
+    'character-media': 'MEDIA',
+    'pvp-summary': 'PVP',
+}
+
+DEFAULT_ENDPOINT_TTL_HOURS = {
+    'profile': 0,  # Level, item level and last login - always fetched
+    'specializations': 24,
+    'character-media': 168,  # Avatars almost never change
+    'pvp-summary': 24,
+}
+
+DEFAULT_ENDPOINT_MIN_LEVEL = {
+    'pvp-summary': 10,
+}
+
+
+class RefreshPolicy:
+    """Ranks characters by how much a detail refresh is worth"""
+
+    def __init__(self, active_hours=6, recent_hours=24, inactive_hours=168, max_level=60):
+        self.intervals = {
+            'active': timedelta(hours=active_hours),
+            'recent': timedelta(hours=recent_hours),
+            'inactive': timedelta(hours=inactive_hours),
+        }
+        self.max_level = max_level
+
+    @classmethod
+    def from_config(cls, config=None):
+        """Build the policy from the CHARACTER_REFRESH_* settings"""
+        config = config if config is not None else current_app.config
+        return cls(
+            active_hours=config.get('CHARACTER_REFRESH_ACTIVE_HOURS', 6),
+            recent_hours=config.get('CHARACTER_REFRESH_RECENT_HOURS', 24),
+            inactive_hours=config.get('CHARACTER_REFRESH_INACTIVE_HOURS', 168),
+            max_level=config.get('CHARACTER_REFRESH_MAX_LEVEL', 60),
+        )
+
+    def activity_tier(self, character, now):
+        """'active', 'recent' or 'inactive' from the character's last login"""
+        if not character.last_login_timestamp:
+            return 'inactive'
+        last_login = datetime.utcfromtimestamp(character.last_login_timestamp / 1000)
+        if now - last_login <= ACTIVE_WINDOW:
+            return 'active'
+        if now - last_login <= RECENT_WINDOW:
+            return 'recent'
+        return 'inactive'
+
+    def interval(self, character, now):
+        """How often this character should be refreshed"""
+        interval = self.intervals[self.activity_tier(character, now)]
+        if self.max_level and (character.level or 0) >= self.max_level:
+            interval = interval / 2
+        return interval
+
+    def shortest_interval(self):
+        """The shortest refresh interval any character can get"""
+        interval = min(self.intervals.values())
+        return interval / 2 if self.max_level else interval
+
+    def priority(self, character, now=None):
+        """
+        Refresh priority of a character; 1.0 or more means it is due.
+        Staleness as a multiple of the refresh interval, plus a bonus for characters
+        never fetched or whose roster level changed since the last fetch.
+        """
+        now = now or datetime.utcnow()
+        if character.details_checked_at is None:
+            return NEVER_CHECKED_BONUS
+
+        staleness = (now - character.details_checked_at) / self.interval(character, now)
+        if character.checked_level is not None and character.level != character.checked_level:
+            staleness += LEVEL_CHANGED_BONUS
+        return staleness
+
+    def select(self, characters, limit=None, now=None):
+        """Due characters, highest priority first, at most `limit` of them"""
+        now = now or datetime.utcnow()
+        ranked = []
+        for character in characters:
+            score = self.priority(character, now)
+            if score >= 1.0:
+                ranked.append((score, character))
+        ranked.sort(key=lambda item: (-item[0], item[1].id))
+        selected = [character for _, character in ranked]
+        return selected[:limit] if limit else selected
+
+
+class EndpointPolicy:
+    """Per-endpoint freshness TTLs and minimum levels for character detail fetches"""
+
+    def __init__(self, ttl_hours=None, min_levels=None):
+        ttl_hours = dict(DEFAULT_ENDPOINT_TTL_HOURS, **(ttl_hours or {}))
+        self.ttls = {endpoint: timedelta(hours=hours) for endpoint, hours in ttl_hours.items() if hours}
+        self.min_levels = dict(DEFAULT_ENDPOINT_MIN_LEVEL, **(min_levels or {}))
+
+    @classmethod
+    def from_config(cls, config=None):
+        """Build the policy from the ENDPOINT_TTL_*_HOURS / ENDPOINT_MIN_LEVEL_* settings"""
+        config = config if config is not None else current_app.config
+        ttl_hours = {}
+        min_levels = {}
+        for endpoint, name in ENDPOINT_SETTING_NAMES.items():
+            if f'ENDPOINT_TTL_{name}_HOURS' in config:
+                ttl_hours[endpoint] = config[f'ENDPOINT_TTL_{name}_HOURS']
+            if f'ENDPOINT_MIN_LEVEL_{name}' in config:
+                min_levels[endpoint] = config[f'ENDPOINT_MIN_LEVEL_{name}']
+        return cls(ttl_hours, min_levels)
+
+    def tracks_fetch_time(self, endpoint):
+        """
+        Whether the endpoint's last fetch time matters: only endpoints with a TTL are
+        skipped based on it, the others are called on every refresh anyway
+        """
+        return endpoint in self.ttls
+
+    def endpoints_to_skip(self, level, checked_at, now=None):
+        """
+        Endpoints not worth calling for a character right now.
+
+        Args:
+            level: The character's roster level
+            checked_at: Dict of endpoint -> datetime of its last fetch (missing = never)
+        """
+        now = now or datetime.utcnow()
+        skip = set()
+        for endpoint in CHARACTER_ENDPOINTS:
+            min_level = self.min_levels.get(endpoint)
+            if min_level and (level or 0) < min_level:
+                skip.add(endpoint)
+                continue
+            ttl = self.ttls.get(endpoint)
+            last_fetch = checked_at.get(endpoint)
+            if ttl and last_fetch is not None and now - last_fetch < ttl:
+                skip.add(endpoint)
+        return skip
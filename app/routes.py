@@ -4,7 +4,7 @@ from app.services import GuildService
 from app.raid_composer import RaidComposerService
 from app.models import Guild, Character, GuildMemberHistory, CharacterProgressionHistory, Task
 from app import db
-from datetime import datetime
+from datetime import datetime, timedelta
 
 main_bp = Blueprint('main', __name__)
 
@@ -299,6 +299,30 @@ def api_guild_analytics(guild_id):
         'spec_distribution': analytics['spec_distribution']
     })
 
+@main_bp.route('/api/guild/<int:guild_id>/trends')
+def api_guild_trends(guild_id):
+    """
+    API endpoint for daily guild metrics (member count, level 60 count, average
+    item level, class mix) between ?start= and ?end= (YYYY-MM-DD, default: last 30 days)
+    """
+    guild = Guild.query.get_or_404(guild_id)
+    
+    try:
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if 'end' in request.args else datetime.utcnow().date()
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if 'start' in request.args else end - timedelta(days=29)
+    except ValueError:
+        return jsonify({'error': 'Invalid date. Use YYYY-MM-DD.'}), 400
+    if start > end:
+        return jsonify({'error': 'start must not be after end'}), 400
+    
+    service = GuildService()
+    return jsonify({
+        'guild_name': guild.name,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'days': service.get_guild_trends(guild_id, start, end)
+    })
+
 @main_bp.route('/api/guild/<int:guild_id>/characters')
 def api_guild_characters(guild_id):
     """API endpoint for guild characters"""
@@ -315,11 +339,8 @@ def raid_composer(guild_id):
     composer_service = RaidComposerService()
     is_configured = composer_service.is_configured()
     
-    # Get level 60 count
-    level_60_count = Character.query.filter_by(
-        guild_id=guild_id,
-        level=60
-    ).count()
+    # Level 60 count from the (cached) raid roster
+    level_60_count = len(composer_service.get_level_60_characters(guild_id))
     
     return render_template('raid_composer.html',
                          guild=guild,
@@ -382,6 +403,20 @@ def api_recent_tasks():
     tasks = Task.query.order_by(Task.created_at.desc()).limit(limit).all()
     return jsonify([task.to_dict() for task in tasks])
 
+@main_bp.route('/api/rate-limiter/metrics')
+@login_required
+def api_rate_limiter_metrics():
+    """API endpoint for Battle.net rate limiter metrics (tokens taken, time spent waiting)"""
+    from app.rate_limiter import get_rate_limiter
+    return jsonify(get_rate_limiter().get_metrics())
+
+@main_bp.route('/api/cache/metrics')
+@login_required
+def api_cache_metrics():
+    """API endpoint for guild data cache metrics (hits and misses per namespace)"""
+    from app.cache import get_cache
+    return jsonify(get_cache().get_metrics())
+
 @main_bp.route('/tasks')
 @login_required
 def task_list():
@@ -419,49 +454,12 @@ def pvp_leaderboard(guild_id):
     
     min_level, max_level = brackets[bracket]
     
-    # Get top 10 players by honorable kills in this bracket
-    top_players = Character.query.filter_by(guild_id=guild_id)\
-        .filter(Character.level >= min_level)\
-        .filter(Character.level <= max_level)\
-        .filter(Character.honorable_kills.isnot(None))\
-        .filter(Character.honorable_kills > 0)\
-        .order_by(Character.honorable_kills.desc().nullslast())\
-        .limit(10)\
-        .all()
-    
-    # Get top players by class (top 1 from each class)
-    class_leaders = {}
-    character_classes = db.session.query(Character.character_class)\
-        .filter_by(guild_id=guild_id)\
-        .filter(Character.level >= min_level)\
-        .filter(Character.level <= max_level)\
-        .filter(Character.honorable_kills.isnot(None))\
-        .filter(Character.honorable_kills > 0)\
-        .filter(Character.character_class.isnot(None))\
-        .distinct()\
-        .all()
-    
-    for (class_name,) in character_classes:
-        if class_name:
-            top_in_class = Character.query.filter_by(guild_id=guild_id, character_class=class_name)\
-                .filter(Character.level >= min_level)\
-                .filter(Character.level <= max_level)\
-                .filter(Character.honorable_kills.isnot(None))\
-                .filter(Character.honorable_kills > 0)\
-                .order_by(Character.honorable_kills.desc().nullslast())\
-                .first()
-            
-            if top_in_class:
-                class_leaders[class_name] = top_in_class
-    
-    # Sort class leaders by honorable kills (descending)
-    class_leaders = dict(sorted(class_leaders.items(), 
-                                key=lambda x: x[1].honorable_kills or 0, 
-                                reverse=True))
+    # Top 10 players by honorable kills and the top player of each class (cached per guild version)
+    leaderboard = GuildService().get_pvp_leaderboard(guild, min_level, max_level)
     
     return render_template('pvp_leaderboard.html',
                           guild=guild,
                           bracket=bracket,
                           brackets=list(brackets.keys()),
-                          top_players=top_players,
-                          class_leaders=class_leaders)
+                          top_players=leaderboard['top_players'],
+                          class_leaders=leaderboard['class_leaders'])
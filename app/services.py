@@ -1,15 +1,83 @@
-from app.models import Guild, Character, GuildMemberHistory, CharacterProgressionHistory
-from app.bnet_api import BattleNetAPI
+from app.models import Guild, Character, GuildMemberHistory, CharacterProgressionHistory, CharacterEndpointState, UnindexedCharacter, SyncCheckpoint, CharacterSyncRetry, GuildAnalyticsSnapshot, GuildDailyRollup, GuildAnalyticsCounter
+from app.refresh_policy import RefreshPolicy, EndpointPolicy
+from app.analytics import (
+    compute_guild_analytics, serialize_analytics, restore_analytics, pvp_player_dict, ANALYTICS_SNAPSHOT_VERSION,
+    COUNTER_FIELDS, counter_values, character_counters, recompute_counters, load_counters
+)
+from app.cache import get_cache
+from app.bnet_api import BattleNetAPI, BattleNetAPIError, BattleNetNotFoundError, CHARACTER_ENDPOINTS
 from app import db
-from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from flask import current_app
+from itertools import islice
+import hashlib
+import json
+
+# Character columns written from the roster by the bulk upsert (name is only set on insert)
+ROSTER_COLUMNS = ('bnet_id', 'name', 'realm', 'level', 'rank', 'guild_id', 'roster_hash', 'last_updated')
+
+# Profile columns a new member may already have when inserted (fetched during roster sync)
+NEW_MEMBER_COLUMNS = ROSTER_COLUMNS + (
+    'achievement_points', 'average_item_level', 'equipped_item_level', 'gender', 'faction',
+    'character_class', 'race', 'last_login_timestamp', 'avatar_url', 'honorable_kills', 'pvp_rank',
+    'spec_name', 'details_checked_at', 'checked_level'
+)
+
+# Character columns filled by the detail sync; their digest is stored in profile_digest
+PROFILE_COLUMNS = (
+    'achievement_points', 'average_item_level', 'equipped_item_level', 'gender', 'faction',
+    'character_class', 'race', 'spec_name', 'avatar_url', 'honorable_kills', 'pvp_rank',
+    'last_login_timestamp'
+)
+
+# Counters kept by the character detail sync (and carried over when it resumes)
+SYNC_COUNTERS = ('changed', 'unchanged', 'failed', 'skipped', 'unindexed_skipped', 'retry_queued', 'endpoint_calls_skipped')
+
+# Native INSERT ... ON CONFLICT implementations by dialect
+UPSERT_DIALECTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+def member_fingerprint(guild_id, member):
+    """Hash of the roster fields stored for one member (ID, name, realm, level, rank) in a guild"""
+    character_data = member.get('character', {})
+    fields = (
+        guild_id,
+        character_data.get('id'),
+        character_data.get('name'),
+        character_data.get('realm', {}).get('name', ''),
+        character_data.get('level', 0),
+        member.get('rank', 0),
+    )
+    return hashlib.sha1('|'.join(str(field) for field in fields).encode('utf-8')).hexdigest()
+
+
+def roster_fingerprint(member_hashes):
+    """Order-independent hash of a whole roster, built from its member fingerprints"""
+    return hashlib.sha256('\n'.join(sorted(member_hashes)).encode('utf-8')).hexdigest()
+
 
 class GuildService:
     def __init__(self):
         self.api = BattleNetAPI()
     
     def sync_guild_roster(self, realm_slug, guild_name_slug):
-        """Fetch and store guild roster from Battle.net API"""
+        """
+        Fetch and store guild roster from Battle.net API
+        
+        Returns (guild, member_count, removed_count, stats). stats['detail_character_ids']
+        lists the characters that are new to the guild or whose level or rank changed,
+        i.e. the ones a follow-up detail sync should refresh right away.
+        
+        A changed roster bumps guild.data_version and stores the guild's analytics
+        snapshot and today's GuildDailyRollup in the same commit.
+        """
         try:
             current_app.logger.info(f"Starting guild sync for '{guild_name_slug}' on '{realm_slug}'")
             
@@ -35,6 +103,8 @@ class GuildService:
                     faction=guild_data.get('faction', {}).get('name')
                 )
                 db.session.add(guild)
+                # Assign guild.id now so every member row can reference it
+                db.session.flush()
             else:
                 current_app.logger.info("Updating existing guild record")
             
@@ -47,25 +117,70 @@ class GuildService:
             guild.last_updated = datetime.utcnow()
             current_app.logger.info(f"✅ Roster retrieved: {len(members)} members found")
             
+            # Skip all member processing when the roster is identical to the last sync
+            member_hashes = [member_fingerprint(guild.id, member) for member in members]
+            roster_hash = roster_fingerprint(member_hashes)
+            if not is_initial_sync and guild.roster_hash == roster_hash:
+                # Still one trend rollup per day, even without changes
+                if not self._has_daily_rollup(guild):
+                    self._store_daily_rollup(guild, compute_guild_analytics(guild))
+                db.session.commit()
+                current_app.logger.info(f"✅ Roster unchanged since last sync - no changes written")
+                return guild, len(members), 0, {
+                    'added': 0,
+                    'changed': 0,
+                    'unindexed_skipped': 0,
+                    'roster_unchanged': True,
+                    'detail_character_ids': []
+                }
+            
             # Track statistics
             added_count = 0
+            changed_count = 0
+            unindexed_skipped = 0
+            
+            # Characters recently answering 404 are not re-fetched when they join
+            unindexed = {}
+            if not is_initial_sync:
+                unindexed = self._load_unindexed_characters(
+                    {m.get('character', {}).get('realm', {}).get('slug', realm_slug) for m in members}
+                )
             
             # Track current member IDs to identify members who left
             current_member_bnet_ids = set()
             current_member_names = set()
             
-            # Get existing characters to track new additions
+            # Resolve every existing character up front (this guild's members plus any
+            # roster member already stored under another guild) so the loop below
+            # never has to query per member
             existing_character_ids = set()
-            existing_characters_map = {}
-            if guild.id:
-                for char in Character.query.filter_by(guild_id=guild.id).all():
-                    if char.bnet_id:
-                        existing_character_ids.add(char.bnet_id)
-                    existing_characters_map[(char.name, char.realm)] = char
+            characters_by_bnet_id, characters_by_name = self._load_roster_characters(guild.id, members)
+            for char in characters_by_bnet_id.values():
+                if char.guild_id == guild.id:
+                    existing_character_ids.add(char.bnet_id)
+            
+            # Most recent progression entry per character, for change detection
+            latest_progression = self._load_latest_progression(guild.id) if not is_initial_sync else {}
+            
+            # With ROSTER_BULK_UPSERT, members with a Battle.net ID are written with a few
+            # INSERT ... ON CONFLICT statements instead of one ORM object each
+            bulk_upsert = (
+                current_app.config.get('ROSTER_BULK_UPSERT', False)
+                and db.engine.dialect.name in UPSERT_DIALECTS
+            )
+            upsert_new_rows = {}
+            upsert_existing_rows = {}
+            progression_rows = []
+            counter_deltas = Counter()  # Analytics counter changes, (guild_id, dimension, bucket) -> amount
+            
+            # New members and members whose level or rank changed, for the detail sync handoff
+            detail_ids = set()
+            detail_new_characters = []  # ORM rows without an ID until the flush
+            detail_new_bnet_ids = []  # Rows inserted by the bulk upsert
             
             # Process each member
             current_app.logger.info(f"Processing {len(members)} members...")
-            for idx, member in enumerate(members, 1):
+            for idx, (member, member_hash) in enumerate(zip(members, member_hashes), 1):
                 character_data = member.get('character', {})
                 char_name = character_data.get('name')
                 char_bnet_id = character_data.get('id')  # Battle.net character ID
@@ -84,34 +199,57 @@ class GuildService:
                 is_new_character = False
                 
                 if char_bnet_id:
-                    character = Character.query.filter_by(bnet_id=char_bnet_id).first()
+                    character = characters_by_bnet_id.get(char_bnet_id)
                     if not character and char_bnet_id not in existing_character_ids:
                         is_new_character = True
                 
                 if not character:
-                    character = Character.query.filter_by(
-                        name=char_name,
-                        realm=character_data.get('realm', {}).get('name', '')
-                    ).first()
+                    character = characters_by_name.get((char_name, character_data.get('realm', {}).get('name', '')))
                     if not character:
                         is_new_character = True
                 
                 if not character:
                     character = Character(name=char_name)
                     is_new_character = True
+                # A row matched by name may carry another bnet_id; only upsert rows keyed on this one
+                upsert_member = bool(bulk_upsert and char_bnet_id and (character.id is None or character.bnet_id == char_bnet_id))
+                
+                # Members whose roster fields match the stored fingerprint are not written at all
+                roster_changed = character.id is None or character.roster_hash != member_hash
+                upsert_member = upsert_member and roster_changed
+                
+                # Members new to the guild, or whose level or rank changed, get their details refreshed
+                # (unless the new-member fetch below already did)
+                wants_details = is_new_character or (roster_changed and (
+                    character.level != character_data.get('level', 0) or character.rank != member.get('rank', 0)
+                ))
+                details_fetched = False
+                
+                # Counter contribution before this sync (existing rows may come from another guild)
+                old_guild_id = character.guild_id
+                old_counter_values = counter_values(character) if roster_changed and character.id is not None else None
                 
                 # Update character data from roster
-                character.bnet_id = char_bnet_id
-                # Use realm from character data, fallback to guild's realm
-                character.realm = character_data.get('realm', {}).get('name', '') or guild_data.get('realm', {}).get('name', '')
-                character.level = character_data.get('level', 0)
-                character.rank = member.get('rank', 0)
-                character.guild_id = guild.id
-                character.last_updated = datetime.utcnow()
+                if roster_changed:
+                    changed_count += 1
+                    character.bnet_id = char_bnet_id
+                    # Use realm from character data, fallback to guild's realm
+                    character.realm = character_data.get('realm', {}).get('name', '') or guild_data.get('realm', {}).get('name', '')
+                    character.level = character_data.get('level', 0)
+                    character.rank = member.get('rank', 0)
+                    character.guild_id = guild.id
+                    character.roster_hash = member_hash
+                    character.last_updated = datetime.utcnow()
+                if char_bnet_id:
+                    characters_by_bnet_id[char_bnet_id] = character
+                characters_by_name.setdefault((char_name, character.realm), character)
                 
                 # For new members (not during initial sync), fetch their details immediately
                 # so we can populate the guild history table with accurate class info
-                if is_new_character and not is_initial_sync:
+                if is_new_character and not is_initial_sync and self._is_known_unindexed(unindexed, char_realm, char_name, character.level):
+                    unindexed_skipped += 1
+                    current_app.logger.debug(f"Skipping details for new member '{char_name}' (recently not indexed)")
+                elif is_new_character and not is_initial_sync:
                     try:
                         current_app.logger.info(f"Fetching details for new member '{char_name}'...")
                         profile = self.api.get_character_profile(char_realm, char_name)
@@ -142,18 +280,42 @@ class GuildService:
                         except Exception:
                             pass  # PvP stats are optional
                         
+                        # Try to get the spec, so the detail sync handoff need not fetch this member again
+                        try:
+                            specs = self.api.get_character_specializations(char_realm, char_name)
+                            character.spec_name = self.api.get_primary_spec_from_talents(specs) or ''
+                        except Exception:
+                            pass  # Spec is optional
+                        
+                        # Stamped like a detail sync would, in the row write it gets anyway
+                        character.details_checked_at = datetime.utcnow()
+                        character.checked_level = character.level
+                        details_fetched = True
+                        self._forget_unindexed(unindexed, char_realm, char_name)
                         current_app.logger.info(f"✅ Details fetched for new member '{char_name}' ({character.character_class})")
                     except Exception as e:
                         error_msg = str(e)
-                        if "404" in error_msg:
+                        if isinstance(e, BattleNetNotFoundError):
+                            # The handoff would only skip it as unindexed
+                            details_fetched = True
+                            self._remember_unindexed(unindexed, char_realm, char_name, character.level)
                             current_app.logger.debug(f"Profile not found for new member '{char_name}' (not indexed yet)")
                         else:
                             current_app.logger.warning(f"Could not fetch details for new member '{char_name}': {error_msg}")
                 
-                db.session.add(character)
+                # The bulk upsert of an existing row only writes ROSTER_COLUMNS, dropping fetched details
+                if details_fetched and upsert_member and character.id is not None:
+                    details_fetched = False
+                if wants_details and not details_fetched:
+                    if character.id is not None:
+                        detail_ids.add(character.id)
+                    elif upsert_member:
+                        detail_new_bnet_ids.append(char_bnet_id)
+                    else:
+                        detail_new_characters.append(character)
                 
-                # Flush to ensure character.id is available for queries
-                db.session.flush()
+                if roster_changed and not upsert_member:
+                    db.session.add(character)
                 
                 # Track character progression (level and item level changes)
                 # Only track if character has meaningful data and isn't brand new
@@ -161,10 +323,7 @@ class GuildService:
                     should_track = False
                     
                     # Get the most recent progression entry for this character
-                    last_progression = CharacterProgressionHistory.query.filter_by(
-                        character_id=character.id,
-                        guild_id=guild.id
-                    ).order_by(CharacterProgressionHistory.timestamp.desc()).first()
+                    last_progression = latest_progression.get(character.id)
                     
                     # Track only if this is the first entry OR if there's been a change
                     if not last_progression:
@@ -187,14 +346,13 @@ class GuildService:
                     
                     # Only create entry if there's meaningful data and a change was detected
                     if should_track and (character.level or character.average_item_level):
-                        progression_entry = CharacterProgressionHistory(
-                            character_id=character.id,
-                            guild_id=guild.id,
-                            character_level=character.level,
-                            average_item_level=character.average_item_level,
-                            equipped_item_level=character.equipped_item_level
-                        )
-                        db.session.add(progression_entry)
+                        progression_rows.append({
+                            'character_id': character.id,
+                            'guild_id': guild.id,
+                            'character_level': character.level,
+                            'average_item_level': character.average_item_level,
+                            'equipped_item_level': character.equipped_item_level
+                        })
                         current_app.logger.info(f"✓ Progression tracked for {character.name}")
                 
                 # Log new member addition if this is their first time in the guild
@@ -209,47 +367,76 @@ class GuildService:
                     )
                     db.session.add(history_entry)
                     added_count += 1
+                
+                if roster_changed:
+                    new_counter_values = counter_values(character)
+                    if upsert_member and character.id is not None:
+                        # The upsert only writes the roster columns; the rest keeps its stored values
+                        new_counter_values = dict(old_counter_values, **{
+                            field: new_counter_values[field] for field in COUNTER_FIELDS if field in ROSTER_COLUMNS
+                        })
+                    self._track_counter_change(counter_deltas, old_guild_id, old_counter_values, guild.id, new_counter_values)
+                
+                if upsert_member:
+                    if character.id is None:
+                        upsert_new_rows[char_bnet_id] = {c: getattr(character, c) for c in NEW_MEMBER_COLUMNS}
+                    else:
+                        upsert_existing_rows[char_bnet_id] = {c: getattr(character, c) for c in ROSTER_COLUMNS}
+                        # The upsert writes this row; drop the pending ORM changes
+                        db.session.expire(character)
+            
+            # Write all new and changed members in one flush
+            db.session.flush()
+            if bulk_upsert:
+                self._upsert_characters(list(upsert_new_rows.values()), NEW_MEMBER_COLUMNS)
+                self._upsert_characters(list(upsert_existing_rows.values()), ROSTER_COLUMNS)
+            if progression_rows:
+                # One executemany; the ORM would insert row by row to fetch primary keys
+                db.session.execute(db.insert(CharacterProgressionHistory), progression_rows)
+            
+            detail_ids.update(character.id for character in detail_new_characters)
+            for i in range(0, len(detail_new_bnet_ids), 500):
+                detail_ids.update(
+                    character_id for (character_id,) in
+                    db.session.query(Character.id).filter(Character.bnet_id.in_(detail_new_bnet_ids[i:i + 500]))
+                )
             
             # Remove characters that are no longer in the guild
             current_app.logger.info("Checking for members who left the guild...")
-            existing_characters = Character.query.filter_by(guild_id=guild.id).all()
-            removed_count = 0
+            departed = []
+            for row in db.session.query(
+                Character.id, Character.bnet_id, Character.name, Character.realm,
+                Character.level, Character.character_class, Character.race, Character.spec_name,
+                Character.average_item_level, Character.gender
+            ).filter(Character.guild_id == guild.id):
+                # Check by bnet_id first (most reliable), then fall back to name + realm
+                if row.bnet_id and row.bnet_id in current_member_bnet_ids:
+                    continue
+                if (row.name, row.realm) in current_member_names:
+                    continue
+                current_app.logger.info(f"Removing '{row.name}' (no longer in guild)")
+                departed.append(row)
+                self._track_counter_change(counter_deltas, guild.id, counter_values(row), None, None)
             
-            for character in existing_characters:
-                # Check if this character is still in the current roster
-                is_still_member = False
+            removed_count = len(departed)
+            if departed:
+                # Log member removals (skip during initial sync)
+                if not is_initial_sync:
+                    db.session.execute(db.insert(GuildMemberHistory), [{
+                        'guild_id': guild.id,
+                        'character_name': row.name,
+                        'character_level': row.level,
+                        'character_class': row.character_class or 'Unknown',
+                        'action': 'removed'
+                    } for row in departed])
                 
-                # Check by bnet_id first (most reliable)
-                if character.bnet_id and character.bnet_id in current_member_bnet_ids:
-                    is_still_member = True
-                # Fall back to name + realm check
-                elif (character.name, character.realm) in current_member_names:
-                    is_still_member = True
-                
-                # Remove character if they're no longer in the guild
-                if not is_still_member:
-                    current_app.logger.info(f"Removing '{character.name}' (no longer in guild)")
-                    
-                    # Log member removal (skip during initial sync)
-                    if not is_initial_sync:
-                        history_entry = GuildMemberHistory(
-                            guild_id=guild.id,
-                            character_name=character.name,
-                            character_level=character.level,
-                            character_class=character.character_class or 'Unknown',
-                            action='removed'
-                        )
-                        db.session.add(history_entry)
-                    
-                    # Delete progression history for this character in this guild
-                    CharacterProgressionHistory.query.filter_by(
-                        character_id=character.id,
-                        guild_id=guild.id
-                    ).delete()
-                    
-                    db.session.delete(character)
-                    removed_count += 1
+                self._delete_characters([row.id for row in departed])
             
+            guild.roster_hash = roster_hash
+            # Counters, analytics snapshot and daily rollup commit together with the roster changes
+            self._apply_counter_deltas(counter_deltas)
+            self._bump_data_version(guild)
+            self._store_guild_aggregates(guild)
             db.session.commit()
             
             current_app.logger.info(f"✅ Guild sync completed successfully!")
@@ -258,282 +445,1106 @@ class GuildService:
             if not is_initial_sync:
                 current_app.logger.info(f"   - Members added: {added_count}")
                 current_app.logger.info(f"   - Members removed: {removed_count}")
+                current_app.logger.info(f"   - New members skipped (not indexed): {unindexed_skipped}")
             else:
                 current_app.logger.info(f"   - History tracking: Skipped (initial sync)")
-            current_app.logger.info(f"   - Note: Run character detail sync task to update profiles")
+            current_app.logger.info(f"   - Members written (new or changed): {changed_count}")
+            current_app.logger.info(f"   - New or level/rank changed (for detail sync): {len(detail_ids)}")
             
-            return guild, len(members), removed_count
+            stats = {
+                'added': added_count,
+                'changed': changed_count,
+                'unindexed_skipped': unindexed_skipped,
+                'roster_unchanged': False,
+                'detail_character_ids': sorted(detail_ids)
+            }
+            return guild, len(members), removed_count, stats
             
         except Exception as e:
             current_app.logger.error(f"❌ Guild sync failed: {str(e)}")
             db.session.rollback()
             raise e
     
+    def _load_roster_characters(self, guild_id, members, chunk_size=500):
+        """
+        Load the guild's characters and any roster member stored elsewhere with a
+        single query (IN lists are chunked for very large rosters).
+        
+        Returns (characters by bnet_id, characters by (name, realm name)); when
+        several rows share a key the oldest wins, like the per-member .first() lookups
+        this replaces.
+        """
+        bnet_ids = sorted({m.get('character', {}).get('id') for m in members} - {None})
+        names = sorted({m.get('character', {}).get('name') for m in members} - {None})
+        
+        conditions = []
+        if guild_id:
+            conditions.append(Character.guild_id == guild_id)
+        for i in range(0, len(bnet_ids), chunk_size):
+            conditions.append(Character.bnet_id.in_(bnet_ids[i:i + chunk_size]))
+        for i in range(0, len(names), chunk_size):
+            conditions.append(Character.name.in_(names[i:i + chunk_size]))
+        
+        characters_by_bnet_id = {}
+        characters_by_name = {}
+        if conditions:
+            for char in Character.query.filter(db.or_(*conditions)).order_by(Character.id).all():
+                if char.bnet_id:
+                    characters_by_bnet_id.setdefault(char.bnet_id, char)
+                characters_by_name.setdefault((char.name, char.realm), char)
+        return characters_by_bnet_id, characters_by_name
+    
+    def _delete_characters(self, character_ids, chunk_size=500):
+        """
+        Delete characters and their dependent rows (progression history, endpoint
+        validators, retry queue entries) with a few set-based DELETEs instead of per-row ORM cascades.
+        """
+        for i in range(0, len(character_ids), chunk_size):
+            chunk = character_ids[i:i + chunk_size]
+            for model in (CharacterProgressionHistory, CharacterEndpointState, CharacterSyncRetry):
+                db.session.execute(
+                    db.delete(model).where(model.character_id.in_(chunk)).execution_options(synchronize_session=False)
+                )
+            db.session.execute(
+                db.delete(Character).where(Character.id.in_(chunk)).execution_options(synchronize_session=False)
+            )
+    
+    def _upsert_characters(self, rows, columns, chunk_size=500):
+        """
+        Insert or update Character rows keyed on the unique bnet_id with the
+        dialect's native INSERT ... ON CONFLICT DO UPDATE, `chunk_size` rows per
+        executemany (batched into multi-row VALUES by the driver layer).
+        Conflicting rows get every roster column except name.
+        """
+        if not rows:
+            return
+        stmt = UPSERT_DIALECTS[db.engine.dialect.name](Character.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['bnet_id'],
+            set_={column: stmt.excluded[column] for column in ROSTER_COLUMNS if column not in ('bnet_id', 'name')}
+        )
+        for i in range(0, len(rows), chunk_size):
+            db.session.execute(stmt, rows[i:i + chunk_size])
+    
+    def _in_chunks(self, column, values, chunk_size=500):
+        """`column IN values` as an OR of IN lists of at most `chunk_size` values"""
+        if not values:
+            return db.false()
+        return db.or_(*(column.in_(values[i:i + chunk_size]) for i in range(0, len(values), chunk_size)))
+    
+    def _load_latest_progression(self, guild_id, character_ids=None):
+        """
+        Latest CharacterProgressionHistory row for every character in the guild (or
+        only for `character_ids`), keyed by character_id, using one max-timestamp
+        join (served by the (character_id, guild_id, timestamp) index).
+        """
+        latest = db.session.query(
+            CharacterProgressionHistory.character_id,
+            db.func.max(CharacterProgressionHistory.timestamp).label('timestamp')
+        ).filter(
+            CharacterProgressionHistory.guild_id == guild_id
+        )
+        if character_ids is not None:
+            latest = latest.filter(self._in_chunks(CharacterProgressionHistory.character_id, character_ids))
+        latest = latest.group_by(CharacterProgressionHistory.character_id).subquery()
+        
+        entries = CharacterProgressionHistory.query.join(
+            latest,
+            db.and_(
+                CharacterProgressionHistory.character_id == latest.c.character_id,
+                CharacterProgressionHistory.timestamp == latest.c.timestamp
+            )
+        ).filter(
+            CharacterProgressionHistory.guild_id == guild_id
+        ).order_by(CharacterProgressionHistory.id).all()
+        
+        # Rows sharing the latest timestamp: keep the last one inserted
+        return {entry.character_id: entry for entry in entries}
+    
     def get_guild_analytics(self, guild_id):
-        """Generate analytics for a guild"""
+        """
+        Analytics for a guild, from the versioned cache (app/cache.py) or else its
+        GuildAnalyticsSnapshot. A missing or stale snapshot (older data_version or
+        format) is rebuilt and stored first.
+        """
         guild = Guild.query.get(guild_id)
         if not guild:
             return None
         
-        characters = Character.query.filter_by(guild_id=guild_id).all()
-        
-        # Class distribution
-        class_distribution = {}
-        for char in characters:
-            class_name = char.character_class or 'Unknown'
-            class_distribution[class_name] = class_distribution.get(class_name, 0) + 1
-        
-        # Race distribution
-        race_distribution = {}
-        for char in characters:
-            race_name = char.race or 'Unknown'
-            race_distribution[race_name] = race_distribution.get(race_name, 0) + 1
-        
-        # Level distribution
-        level_distribution = {}
-        for char in characters:
-            level = char.level or 0
-            level_distribution[level] = level_distribution.get(level, 0) + 1
-        
-        # Level by class distribution (for stacked chart) - exclude level 60
-        level_class_distribution = {}
-        all_classes = set()
-        for char in characters:
-            level = char.level or 0
-            # Skip level 60 for this chart
-            if level == 60:
-                continue
-            char_class = char.character_class or 'Unknown'
-            all_classes.add(char_class)
-            
-            if level not in level_class_distribution:
-                level_class_distribution[level] = {}
-            
-            level_class_distribution[level][char_class] = level_class_distribution[level].get(char_class, 0) + 1
-        
-        # Level 60 breakdown by class
-        level_60_chars = [char for char in characters if char.level == 60]
-        level_60_by_class = {}
-        for char in level_60_chars:
-            char_class = char.character_class or 'Unknown'
-            level_60_by_class[char_class] = level_60_by_class.get(char_class, 0) + 1
-        
-        # Calculate percentages for level 60s
-        total_60s = len(level_60_chars)
-        level_60_percentages = {}
-        if total_60s > 0:
-            for char_class, count in level_60_by_class.items():
-                level_60_percentages[char_class] = round((count / total_60s) * 100, 1)
-        
-        # Average item level
-        item_levels = [char.average_item_level for char in characters if char.average_item_level]
-        avg_ilvl = sum(item_levels) / len(item_levels) if item_levels else 0
-        
-        # Spec distribution (all characters)
-        spec_distribution = {}
-        for char in characters:
-            if char.spec_name:
-                spec_distribution[char.spec_name] = spec_distribution.get(char.spec_name, 0) + 1
-        
-        # Level 60 breakdown by class and spec
-        level_60_class_spec = {}
-        for char in level_60_chars:
-            char_class = char.character_class or 'Unknown'
-            char_spec = char.spec_name or 'Unknown'
-            
-            if char_class not in level_60_class_spec:
-                level_60_class_spec[char_class] = {}
-            
-            level_60_class_spec[char_class][char_spec] = level_60_class_spec[char_class].get(char_spec, 0) + 1
-        
-        # Calculate data completeness
-        chars_with_profiles = sum(1 for char in characters if char.average_item_level or char.gender)
-        data_completeness = round((chars_with_profiles / len(characters) * 100), 1) if characters else 0
-        
-        # Top PvP killers (level 60 only)
-        top_pvp_60 = sorted(
-            [char for char in level_60_chars if char.honorable_kills and char.honorable_kills > 0],
-            key=lambda x: x.honorable_kills,
-            reverse=True
-        )[:5]  # Top 5
-        
-        return {
-            'guild': guild,
-            'total_members': len(characters),
-            'class_distribution': class_distribution,
-            'race_distribution': race_distribution,
-            'level_distribution': level_distribution,
-            'level_class_distribution': level_class_distribution,
-            'all_classes': sorted(list(all_classes)),
-            'level_60_count': total_60s,
-            'level_60_by_class': level_60_by_class,
-            'level_60_percentages': level_60_percentages,
-            'level_60_class_spec': level_60_class_spec,
-            'average_item_level': round(avg_ilvl, 2),
-            'top_pvp_60': top_pvp_60,
-            'spec_distribution': spec_distribution,
-            'characters': characters,
-            'data_completeness': data_completeness,
-            'chars_with_profiles': chars_with_profiles
+        data = get_cache().get_or_compute(
+            'analytics', guild.id, guild.data_version,
+            lambda: json.loads(self._load_analytics_snapshot(guild)),
+            params=f'f{ANALYTICS_SNAPSHOT_VERSION}'
+        )
+        return restore_analytics(guild, data)
+    
+    def _load_analytics_snapshot(self, guild):
+        """The guild's current snapshot JSON, rebuilding the snapshot if it is missing or stale"""
+        snapshot = GuildAnalyticsSnapshot.query.filter_by(guild_id=guild.id).first()
+        if (snapshot is not None and snapshot.data_version == guild.data_version
+                and snapshot.format_version == ANALYTICS_SNAPSHOT_VERSION):
+            return snapshot.data
+        
+        current_app.logger.info(f"Rebuilding analytics snapshot for guild {guild.id}")
+        db.session.flush()
+        data = self._store_analytics_snapshot(guild, compute_guild_analytics(guild))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another request stored the snapshot first; ours is just as current
+            db.session.rollback()
+        return data
+    
+    def _track_counter_change(self, deltas, old_guild_id, old_values, new_guild_id, new_values):
+        """
+        Add one character's analytics counter change to `deltas`: its old contribution
+        (COUNTER_FIELDS values) leaves the old guild, its new one joins the new guild.
+        Pass None for a side that does not exist (new or removed character).
+        """
+        if old_guild_id is not None and old_values is not None:
+            for (dimension, bucket), amount in character_counters(old_values).items():
+                deltas[(old_guild_id, dimension, bucket)] -= amount
+        if new_guild_id is not None and new_values is not None:
+            for (dimension, bucket), amount in character_counters(new_values).items():
+                deltas[(new_guild_id, dimension, bucket)] += amount
+    
+    def _apply_counter_deltas(self, deltas):
+        """
+        Add accumulated counter changes to GuildAnalyticsCounter with set-based
+        `value = value + delta` upserts, then clear `deltas` (the caller commits).
+        Guilds whose counters were never built are skipped; their first
+        _store_guild_aggregates() counts them from scratch.
+        """
+        # Upsert in key order, so concurrent shards lock the counter rows in the same
+        # order and cannot deadlock (PostgreSQL) on each other's rows
+        rows = [
+            {'guild_id': guild_id, 'dimension': dimension, 'bucket': bucket, 'value': amount}
+            for (guild_id, dimension, bucket), amount in sorted(deltas.items()) if amount
+        ]
+        deltas.clear()
+        if not rows:
+            return
+        
+        maintained = {
+            guild_id for (guild_id,) in db.session.query(Guild.id).filter(
+                Guild.id.in_({row['guild_id'] for row in rows}),
+                Guild.counters_rebuilt_at.isnot(None)
+            )
         }
+        rows = [row for row in rows if row['guild_id'] in maintained]
+        if not rows:
+            return
+        
+        table = GuildAnalyticsCounter.__table__
+        insert = UPSERT_DIALECTS.get(db.engine.dialect.name)
+        if insert is not None:
+            stmt = insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['guild_id', 'dimension', 'bucket'],
+                set_={'value': table.c.value + stmt.excluded.value}
+            )
+            db.session.execute(stmt, rows)
+        else:
+            for row in rows:
+                counter = GuildAnalyticsCounter.query.filter_by(
+                    guild_id=row['guild_id'], dimension=row['dimension'], bucket=row['bucket']
+                ).first()
+                if counter is None:
+                    db.session.add(GuildAnalyticsCounter(**row))
+                else:
+                    counter.value += row['value']
+            db.session.flush()
+        
+        # Buckets that dropped to zero are removed, as a full rebuild would leave them out
+        db.session.execute(
+            db.delete(GuildAnalyticsCounter).where(
+                GuildAnalyticsCounter.guild_id.in_(maintained),
+                GuildAnalyticsCounter.value == 0
+            ).execution_options(synchronize_session=False)
+        )
     
-    def sync_character_details(self, guild_id):
+    def rebuild_analytics_counters(self, guild):
+        """Replace the guild's analytics counters with a full recount (the caller commits)"""
+        db.session.flush()
+        counters = recompute_counters(guild.id)
+        db.session.execute(
+            db.delete(GuildAnalyticsCounter).where(GuildAnalyticsCounter.guild_id == guild.id)
+            .execution_options(synchronize_session=False)
+        )
+        if counters:
+            db.session.execute(db.insert(GuildAnalyticsCounter), [
+                {'guild_id': guild.id, 'dimension': dimension, 'bucket': bucket, 'value': value}
+                for (dimension, bucket), value in counters.items()
+            ])
+        guild.counters_rebuilt_at = datetime.utcnow()
+    
+    def check_analytics_counters(self, guild):
+        """
+        Compare the guild's stored analytics counters with a full recount.
+        Returns a list of {'dimension', 'bucket', 'stored', 'actual'} mismatches
+        (empty when consistent), or None when the guild's counters are not built yet.
+        """
+        if guild.counters_rebuilt_at is None:
+            return None
+        stored = load_counters(guild.id)
+        actual = recompute_counters(guild.id)
+        return [
+            {'dimension': dimension, 'bucket': bucket, 'stored': stored[(dimension, bucket)], 'actual': actual[(dimension, bucket)]}
+            for dimension, bucket in sorted(set(stored) | set(actual))
+            if stored[(dimension, bucket)] != actual[(dimension, bucket)]
+        ]
+    
+    def repair_analytics_counters(self, guild):
+        """
+        Rebuild the guild's counters and bump its data_version, so the analytics
+        snapshot and cached pages built from drifted counters are rebuilt (the caller commits)
+        """
+        self.rebuild_analytics_counters(guild)
+        self._bump_data_version(guild)
+    
+    def _has_daily_rollup(self, guild, day=None):
+        """Whether the guild already has a GuildDailyRollup for `day` (default: today, UTC)"""
+        day = day or datetime.utcnow().date()
+        return db.session.query(
+            GuildDailyRollup.query.filter_by(guild_id=guild.id, day=day).exists()
+        ).scalar()
+    
+    def _store_daily_rollup(self, guild, analytics):
+        """Upsert today's GuildDailyRollup from an analytics dict (the caller commits)"""
+        row = {
+            'guild_id': guild.id,
+            'day': datetime.utcnow().date(),
+            'member_count': analytics['total_members'],
+            'level_60_count': analytics['level_60_count'],
+            'average_item_level': analytics['average_item_level'],
+            'class_distribution': json.dumps(analytics['class_distribution'], sort_keys=True),
+            'updated_at': datetime.utcnow()
+        }
+        
+        insert = UPSERT_DIALECTS.get(db.engine.dialect.name)
+        if insert is not None:
+            stmt = insert(GuildDailyRollup.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['guild_id', 'day'],
+                set_={column: stmt.excluded[column] for column in row if column not in ('guild_id', 'day')}
+            )
+            db.session.execute(stmt, row)
+        else:
+            rollup = GuildDailyRollup.query.filter_by(guild_id=guild.id, day=row['day']).first()
+            if rollup is None:
+                rollup = GuildDailyRollup(guild_id=guild.id, day=row['day'])
+                db.session.add(rollup)
+            for column, value in row.items():
+                setattr(rollup, column, value)
+    
+    def get_guild_trends(self, guild_id, start, end):
+        """Daily rollups of a guild from `start` to `end` (dates, inclusive), oldest first"""
+        rollups = GuildDailyRollup.query.filter(
+            GuildDailyRollup.guild_id == guild_id,
+            GuildDailyRollup.day >= start,
+            GuildDailyRollup.day <= end
+        ).order_by(GuildDailyRollup.day).all()
+        return [rollup.to_dict() for rollup in rollups]
+    
+    def get_pvp_leaderboard(self, guild, min_level, max_level):
+        """
+        Top 10 PvP players of a level bracket and the top player of each class, as
+        {'top_players': [...], 'class_leaders': {class: player}} with player dicts.
+        Cached per guild data_version and bracket.
+        """
+        def compute():
+            in_bracket = Character.query.filter_by(guild_id=guild.id)\
+                .filter(Character.level >= min_level)\
+                .filter(Character.level <= max_level)\
+                .filter(Character.honorable_kills.isnot(None))\
+                .filter(Character.honorable_kills > 0)
+            
+            top_players = in_bracket.order_by(Character.honorable_kills.desc().nullslast()).limit(10).all()
+            
+            # Top player of each class
+            class_leaders = {}
+            character_classes = in_bracket.with_entities(Character.character_class)\
+                .filter(Character.character_class.isnot(None))\
+                .distinct()\
+                .all()
+            for (class_name,) in character_classes:
+                if class_name:
+                    top_in_class = in_bracket.filter(Character.character_class == class_name)\
+                        .order_by(Character.honorable_kills.desc().nullslast())\
+                        .first()
+                    if top_in_class:
+                        class_leaders[class_name] = pvp_player_dict(top_in_class)
+            
+            # Sort class leaders by honorable kills (descending)
+            class_leaders = dict(sorted(class_leaders.items(),
+                                        key=lambda x: x[1]['honorable_kills'] or 0,
+                                        reverse=True))
+            return {
+                'top_players': [pvp_player_dict(player) for player in top_players],
+                'class_leaders': class_leaders
+            }
+        
+        return get_cache().get_or_compute(
+            'pvp', guild.id, guild.data_version, compute, params=f'{min_level}-{max_level}'
+        )
+    
+    def _bump_data_version(self, guild):
+        """Mark the guild's data as changed (atomic increment, safe for concurrent shards)"""
+        guild.data_version = Guild.data_version + 1
+    
+    def publish_guild_changes(self, guild_id):
+        """
+        Bump the guild's data_version and store its analytics snapshot and today's
+        rollup, once all shards of a sharded detail sync are done (see
+        finalize_character_sync); commits.
+        """
+        guild = Guild.query.get(guild_id)
+        if guild is None:
+            return
+        self._bump_data_version(guild)
+        self._store_guild_aggregates(guild)
+        db.session.commit()
+    
+    def _store_guild_aggregates(self, guild):
+        """Compute the guild's analytics and store its snapshot and today's rollup (the caller commits)"""
+        db.session.flush()
+        if guild.counters_rebuilt_at is None:
+            # First sync since counters exist: count once, then maintain them from deltas
+            self.rebuild_analytics_counters(guild)
+        analytics = compute_guild_analytics(guild)
+        self._store_analytics_snapshot(guild, analytics)
+        self._store_daily_rollup(guild, analytics)
+    
+    def _store_analytics_snapshot(self, guild, analytics):
+        """
+        Store analytics as the guild's snapshot in the current transaction (the
+        caller commits). Returns the snapshot JSON.
+        """
+        data = serialize_analytics(analytics)
+        row = {
+            'guild_id': guild.id,
+            'data_version': guild.data_version,
+            'format_version': ANALYTICS_SNAPSHOT_VERSION,
+            'data': data,
+            'created_at': datetime.utcnow()
+        }
+        
+        insert = UPSERT_DIALECTS.get(db.engine.dialect.name)
+        if insert is not None:
+            stmt = insert(GuildAnalyticsSnapshot.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['guild_id'],
+                set_={column: stmt.excluded[column] for column in row if column != 'guild_id'},
+                # Never replace a snapshot of newer data (concurrent shards of one guild)
+                where=GuildAnalyticsSnapshot.__table__.c.data_version <= stmt.excluded.data_version
+            )
+            db.session.execute(stmt, row)
+        else:
+            snapshot = GuildAnalyticsSnapshot.query.filter_by(guild_id=guild.id).first()
+            if snapshot is None:
+                snapshot = GuildAnalyticsSnapshot(guild_id=guild.id)
+                db.session.add(snapshot)
+            for column, value in row.items():
+                setattr(snapshot, column, value)
+        return data
+    
+    def sync_character_details(self, guild_id, concurrency=None, character_ids=None, task_id=None, shard=None):
         """
         Sync detailed information for all characters in a guild.
         This fetches individual character profiles from the API.
+        
+        Args:
+            guild_id: Database ID of the guild
+            concurrency: Characters fetched in parallel (CHARACTER_SYNC_CONCURRENCY by default)
+            character_ids: Only sync these characters of the guild, in this order (default: all)
+            task_id: Task record ID; progress is checkpointed against it
+            shard: Shard index when this run is one shard of a sharded task
+        
+        API calls for up to `concurrency` characters run in parallel worker threads;
+        all database writes stay on the calling thread.
+        
+        Progress is checkpointed (SyncCheckpoint) with every batch commit, except for
+        targeted runs without a task_id, which nothing could resume. A retry of
+        the same task, or a new full-guild run while an unfinished checkpoint younger
+        than CHARACTER_SYNC_CHECKPOINT_MAX_AGE_HOURS exists, resumes with the
+        characters that were still left and carries the counters over.
+        
+        With API_CONDITIONAL_REQUESTS enabled, stored ETag/Last-Modified validators are
+        sent with each call. A character whose endpoints all answer 304 Not Modified is
+        counted as unchanged and its row is not written at all.
+        
+        Fetched profile data is compared with the stored profile_digest; characters
+        whose data is identical are also counted as unchanged and skip the UPDATE.
+        Every character the run fetched, probed (404, failure) or skipped gets
+        details_checked_at / checked_level stamped, so the refresh policy does not
+        pick it again before its interval: changed characters with their row write,
+        the others with one set-based UPDATE per batch that skips rows whose stamp
+        is younger than the shortest refresh interval and whose level is unchanged.
+        
+        Endpoints fetched more recently than their ENDPOINT_TTL_*_HOURS, or below
+        their ENDPOINT_MIN_LEVEL_*, are not called; their stored data is kept.
+        
+        Characters whose profile answered 404 are remembered for
+        UNINDEXED_CHARACTER_TTL_HOURS and skipped without an API call, unless their
+        roster level has changed since.
+        
+        Other failed characters are queued in CharacterSyncRetry with exponential
+        backoff (see retry_failed_characters); a later successful fetch removes them.
+        
+        Changed characters whose level or item levels differ from their latest
+        CharacterProgressionHistory entry get a new entry in the same batch commit,
+        so item level progress is recorded even when the roster itself is unchanged.
+        
+        Only the final commit of a run that changed anything (including changes
+        restored from its checkpoint) bumps guild.data_version, together with the
+        analytics snapshot and today's GuildDailyRollup, so page views during the
+        sync keep serving the previous snapshot instead of rebuilding it. Shards
+        skip this; publish_guild_changes() does it once all shards are done.
+        
+        Targeted runs (character_ids, e.g. shards) only load the endpoint states,
+        retry entries and latest progression of their own characters.
         """
         try:
             guild = Guild.query.get(guild_id)
             if not guild:
                 raise Exception(f"Guild with ID {guild_id} not found")
             
-            characters = Character.query.filter_by(guild_id=guild_id).all()
-            total_chars = len(characters)
+            if concurrency is None:
+                concurrency = current_app.config.get('CHARACTER_SYNC_CONCURRENCY', 4)
+            concurrency = max(1, int(concurrency))
+            use_validators = current_app.config.get('API_CONDITIONAL_REQUESTS', True)
+            
+            query = Character.query.filter_by(guild_id=guild_id)
+            if character_ids is not None:
+                query = query.filter(self._in_chunks(Character.id, list(character_ids)))
+            characters = query.order_by(Character.id).all()
+            if character_ids is not None:
+                order = {character_id: index for index, character_id in enumerate(character_ids)}
+                characters = sorted(
+                    (character for character in characters if character.id in order),
+                    key=lambda character: order[character.id]
+                )
+            
+            checkpoint = self._get_sync_checkpoint(guild_id, task_id, characters, full_guild=character_ids is None, shard=shard)
+            counts = dict.fromkeys(SYNC_COUNTERS, 0)
+            counts.update(json.loads(checkpoint.counters))
+            total_chars = checkpoint.total
+            if checkpoint.remaining_ids is not None:
+                remaining = set(json.loads(checkpoint.remaining_ids))
+                characters = [character for character in characters if character.id in remaining]
+                current_app.logger.info(
+                    f"Resuming character detail sync from checkpoint {checkpoint.id}: "
+                    f"{len(characters)} of {total_chars} characters left"
+                )
             
             current_app.logger.info(f"Starting character detail sync for {guild.name}")
-            current_app.logger.info(f"Total characters to sync: {total_chars}")
+            current_app.logger.info(f"Total characters to sync: {len(characters)} (concurrency: {concurrency})")
             
-            successful = 0
-            failed = 0
-            skipped = 0
+            # Load stored validators and endpoint fetch times for the whole guild in one
+            # query, or for a targeted run (shard) only those of its own characters
+            scope_ids = None if character_ids is None else [character.id for character in characters]
+            endpoint_states = {}
+            if scope_ids is None:
+                state_query = CharacterEndpointState.query.join(Character).filter(Character.guild_id == guild_id)
+            else:
+                state_query = CharacterEndpointState.query.filter(self._in_chunks(CharacterEndpointState.character_id, scope_ids))
+            for state in state_query.all():
+                endpoint_states[(state.character_id, state.endpoint)] = state
+            endpoint_policy = EndpointPolicy.from_config()
+            now = datetime.utcnow()
+            restamp_after = RefreshPolicy.from_config().shortest_interval()
             
-            for idx, character in enumerate(characters, 1):
+            # Resolve realm slugs and validators up front so worker threads never touch ORM objects
+            realm_slugs = {}
+            for character in characters:
                 # Get realm slug from character, fallback to guild's realm if empty
                 realm_slug = character.realm or guild.realm
                 if realm_slug:
-                    realm_slug = realm_slug.lower().replace(' ', '-').replace("'", '')
+                    realm_slugs[character.id] = realm_slug.lower().replace(' ', '-').replace("'", '')
+            unindexed = self._load_unindexed_characters(set(realm_slugs.values()))
+            if scope_ids is None:
+                retry_query = CharacterSyncRetry.query.join(Character).filter(Character.guild_id == guild_id)
+            else:
+                retry_query = CharacterSyncRetry.query.filter(self._in_chunks(CharacterSyncRetry.character_id, scope_ids))
+            retries = {entry.character_id: entry for entry in retry_query.all()}
+            latest_progression = {
+                character_id: (entry.character_level, entry.average_item_level, entry.equipped_item_level)
+                for character_id, entry in self._load_latest_progression(guild_id, scope_ids).items()
+            }
+            progression_rows = []
+            
+            jobs = []
+            checked_ids = []
+            for character in characters:
+                realm_slug = realm_slugs.get(character.id)
+                if realm_slug and self._is_known_unindexed(unindexed, realm_slug, character.name, character.level):
+                    counts['skipped'] += 1
+                    counts['unindexed_skipped'] += 1
+                    checked_ids.append(character.id)
+                elif realm_slug:
+                    validators = None
+                    if use_validators:
+                        validators = {}
+                        for endpoint in CHARACTER_ENDPOINTS:
+                            state = endpoint_states.get((character.id, endpoint))
+                            if state:
+                                validators[endpoint] = {'etag': state.etag, 'last_modified': state.last_modified}
+                    checked_at = {}
+                    for endpoint in CHARACTER_ENDPOINTS:
+                        state = endpoint_states.get((character.id, endpoint))
+                        if state and state.checked_at:
+                            checked_at[endpoint] = state.checked_at
+                    skip = endpoint_policy.endpoints_to_skip(character.level, checked_at, now)
+                    jobs.append((character, realm_slug, character.name, validators, skip))
                 else:
                     current_app.logger.error(f"Character '{character.name}' has no realm set, skipping")
-                    skipped += 1
-                    continue
-                
-                if idx % 25 == 0:
-                    current_app.logger.info(f"Progress: {idx}/{total_chars} characters processed...")
-                
-                # Skip if character already has detailed data (optional optimization)
-                # if character.average_item_level and character.gender:
-                #     skipped += 1
-                #     continue
-                
-                try:
-                    # Retry logic for transient API errors (504, 503, 500, connection errors)
-                    max_retries = current_app.config.get('API_MAX_RETRIES', 3)
-                    retry_delay = current_app.config.get('API_RETRY_DELAY', 1.0)
-                    
-                    profile = None
-                    last_error = None
-                    
-                    for attempt in range(max_retries):
-                        try:
-                            # Fetch character profile
-                            profile = self.api.get_character_profile(realm_slug, character.name)
-                            break  # Success, exit retry loop
-                        except Exception as api_error:
-                            last_error = api_error
-                            error_msg = str(api_error)
-                            
-                            # 404 errors are permanent - don't retry
-                            if "404" in error_msg:
-                                raise api_error
-                            
-                            # Check if this is a retryable error (503, 504, 500, timeouts)
-                            is_retryable = any(code in error_msg for code in ['504', '503', '500', 'timeout', 'connection'])
-                            
-                            if is_retryable and attempt < max_retries - 1:
-                                wait_time = retry_delay * (2 ** attempt)  # Exponential backoff
-                                current_app.logger.warning(f"API error for '{character.name}' (attempt {attempt + 1}/{max_retries}): {error_msg}. Retrying in {wait_time}s...")
-                                import time
-                                time.sleep(wait_time)
-                            else:
-                                # Not retryable or out of retries
-                                raise api_error
-                    
-                    if not profile:
-                        raise last_error or Exception("Failed to fetch profile")
-                    
-                    # Update character with profile data
-                    character.achievement_points = profile.get('achievement_points', 0)
-                    character.average_item_level = profile.get('average_item_level', 0)
-                    character.equipped_item_level = profile.get('equipped_item_level', 0)
-                    character.gender = profile.get('gender', {}).get('name', '')
-                    character.faction = profile.get('faction', {}).get('name', '')
-                    character.character_class = profile.get('character_class', {}).get('name', '')
-                    character.race = profile.get('race', {}).get('name', '')
+                    counts['skipped'] += 1
+                    checked_ids.append(character.id)
+            
+            job_ids = [job[0].id for job in jobs]
+            touched_states = {}
+            counter_deltas = Counter()
+            self._save_sync_checkpoint(checkpoint, counts, job_ids)
+            db.session.commit()
+            
+            results = self._fetch_all_character_details(
+                [(realm_slug, name, validators, skip) for _, realm_slug, name, validators, skip in jobs],
+                concurrency
+            )
+            
+            try:
+                for idx, ((character, realm_slug, _, _, skip), (details, error)) in enumerate(zip(jobs, results), 1):
+                    if idx % 25 == 0:
+                        current_app.logger.info(f"Progress: {idx}/{len(jobs)} characters processed...")
                     
-                    # Fetch specialization (Classic uses talent trees)
-                    try:
-                        specs = self.api.get_character_specializations(realm_slug, character.name)
-                        # Extract primary spec from talent tree distribution
-                        primary_spec = self.api.get_primary_spec_from_talents(specs)
-                        if primary_spec:
-                            character.spec_name = primary_spec
-                            current_app.logger.debug(f"✅ {character.name}: {primary_spec}")
+                    # Counted per processed character so the checkpoint's counters match its remaining IDs
+                    counts['endpoint_calls_skipped'] += len(skip)
+                    if error is None:
+                        old_counter_values = counter_values(character)
+                        if self._apply_character_details(character, details):
+                            counts['changed'] += 1
+                            # The row is written anyway: stamp it in the same UPDATE
+                            character.details_checked_at = datetime.utcnow()
+                            character.checked_level = character.level
+                            self._track_counter_change(
+                                counter_deltas, guild_id, old_counter_values, guild_id, counter_values(character)
+                            )
+                            self._track_progression(character, latest_progression, progression_rows)
                         else:
-                            character.spec_name = ''
-                            current_app.logger.debug(f"⚠️  {character.name}: No spec found (low level or no talents)")
-                    except Exception as spec_error:
-                        character.spec_name = ''
-                        current_app.logger.warning(f"Could not fetch spec for {character.name}: {str(spec_error)}")
-                    
-                    # Fetch character media (avatar)
-                    try:
-                        media = self.api.get_character_media(realm_slug, character.name)
-                        # Extract avatar URL from assets
-                        for asset in media.get('assets', []):
-                            if asset.get('key') == 'avatar':
-                                character.avatar_url = asset.get('value')
-                                current_app.logger.debug(f"✅ {character.name}: Avatar URL updated")
-                                break
-                    except Exception as media_error:
-                        # Avatar is optional, don't fail if not available
-                        current_app.logger.debug(f"Could not fetch media for {character.name}: {str(media_error)}")
-                    
-                    # Fetch PvP statistics
-                    try:
-                        pvp_data = self.api.get_character_pvp_summary(realm_slug, character.name)
-                        character.honorable_kills = pvp_data.get('honorable_kills', 0)
-                        character.pvp_rank = pvp_data.get('pvp_rank', 0)
-                        current_app.logger.debug(f"✅ {character.name}: PvP stats updated (HKs: {character.honorable_kills}, Rank: {character.pvp_rank})")
-                    except Exception as pvp_error:
-                        # PvP stats are optional, don't fail if not available
-                        current_app.logger.debug(f"Could not fetch PvP stats for {character.name}: {str(pvp_error)}")
-                    
-                    character.last_updated = datetime.utcnow()
-                    successful += 1
-
+                            counts['unchanged'] += 1
+                            checked_ids.append(character.id)
+                            current_app.logger.debug(f"'{character.name}' unchanged since last sync")
+                        self._store_endpoint_states(character, details, endpoint_states, touched_states, endpoint_policy)
+                        self._forget_unindexed(unindexed, realm_slug, character.name)
+                        self._clear_character_retry(retries, character.id)
+                    else:
+                        error_msg = str(error)
+                        # Handle 404s gracefully - these are expected for some characters
+                        if isinstance(error, BattleNetNotFoundError):
+                            counts['skipped'] += 1
+                            self._remember_unindexed(unindexed, realm_slug, character.name, character.level)
+                            self._clear_character_retry(retries, character.id)
+                            checked_ids.append(character.id)
+                            current_app.logger.debug(f"Skipping '{character.name}' - not indexed by Battle.net API (common for inactive/low-level characters)")
+                        else:
+                            # Log unexpected errors
+                            counts['failed'] += 1
+                            current_app.logger.warning(f"Error syncing '{character.name}': {error_msg}")
+                            if self._queue_character_retry(retries, character, error):
+                                counts['retry_queued'] += 1
+                            # The retry queue re-fetches it; the refresh policy need not
+                            checked_ids.append(character.id)
                     
-                    # Commit every 25 characters to avoid losing progress
+                    # Commit every 25 characters (with the checkpoint) to avoid losing progress
                     if idx % 25 == 0:
+                        self._mark_details_checked(checked_ids, touched_states, restamp_after)
+                        checked_ids = []
+                        touched_states = {}
+                        self._insert_progression(progression_rows)
+                        self._apply_counter_deltas(counter_deltas)
+                        self._save_sync_checkpoint(checkpoint, counts, job_ids[idx:], last_character_id=character.id)
                         db.session.commit()
-                    
-                except Exception as e:
-                    error_msg = str(e)
-                    # Handle 404s gracefully - these are expected for some characters
-                    if "404" in error_msg:
-                        skipped += 1
-                        current_app.logger.debug(f"Skipping '{character.name}' - not indexed by Battle.net API (common for inactive/low-level characters)")
-                    else:
-                        # Log unexpected errors
-                        failed += 1
-                        current_app.logger.warning(f"Error syncing '{character.name}': {error_msg}")
+            finally:
+                # Stops the fetch workers if the loop aborts (time limit, failed commit)
+                results.close()
             
-            # Final commit
+            # Final commit, with a fresh analytics snapshot if this run changed anything;
+            # shards leave that to finalize_character_sync, once for the whole task
+            self._mark_details_checked(checked_ids, touched_states, restamp_after)
+            self._insert_progression(progression_rows)
+            self._apply_counter_deltas(counter_deltas)
+            if counts['changed'] and shard is None:
+                self._bump_data_version(guild)
+                self._store_guild_aggregates(guild)
+            checkpoint.completed_at = datetime.utcnow()
+            self._save_sync_checkpoint(checkpoint, counts, [], last_character_id=job_ids[-1] if job_ids else None)
             db.session.commit()
             
             current_app.logger.info(f"✅ Character detail sync completed!")
             current_app.logger.info(f"   - Total characters: {total_chars}")
-            current_app.logger.info(f"   - Successfully synced: {successful}")
-            current_app.logger.info(f"   - Failed: {failed}")
-            current_app.logger.info(f"   - Skipped: {skipped}")
+            current_app.logger.info(f"   - Changed: {counts['changed']}")
+            current_app.logger.info(f"   - Unchanged (not written): {counts['unchanged']}")
+            current_app.logger.info(f"   - Failed: {counts['failed']} ({counts['retry_queued']} queued for retry)")
+            current_app.logger.info(f"   - Skipped: {counts['skipped']} ({counts['unindexed_skipped']} recently not indexed, no API call)")
+            current_app.logger.info(f"   - Endpoint calls skipped (fresh or below min level): {counts['endpoint_calls_skipped']}")
             
             return {
                 'total': total_chars,
-                'successful': successful,
-                'failed': failed,
-                'skipped': skipped
+                'changed': counts['changed'],
+                'successful': counts['changed'],  # Same as 'changed'; kept for existing callers
+                'unchanged': counts['unchanged'],
+                'failed': counts['failed'],
+                'skipped': counts['skipped'],
+                'unindexed_skipped': counts['unindexed_skipped'],
+                'retry_queued': counts['retry_queued'],
+                'endpoint_calls_skipped': counts['endpoint_calls_skipped']
             }
             
         except Exception as e:
             current_app.logger.error(f"❌ Character detail sync failed: {str(e)}")
             db.session.rollback()
             raise e
+    
+    def _get_sync_checkpoint(self, guild_id, task_id, characters, full_guild, shard=None):
+        """
+        Return the checkpoint to continue: the task's (or task shard's) own unfinished checkpoint, else
+        (for full-guild runs) the guild's latest recent unfinished one, else a new one.
+        A new checkpoint has remaining_ids None, meaning "start from the beginning".
+        
+        Targeted runs without a task (retry queue, roster-delta handoff) cannot be
+        resumed by anything, so their checkpoint is never added to the session: it
+        only carries the counters in memory and leaves no rows behind when such a
+        run aborts.
+        """
+        if task_id is None and not full_guild:
+            return SyncCheckpoint(
+                guild_id=guild_id,
+                full_guild=False,
+                shard=shard,
+                total=len(characters),
+                counters=json.dumps(dict.fromkeys(SYNC_COUNTERS, 0))
+            )
+        
+        checkpoint = None
+        if task_id is not None:
+            checkpoint = SyncCheckpoint.query.filter_by(task_id=task_id, shard=shard, completed_at=None).first()
+        
+        if checkpoint is None and full_guild:
+            max_age = current_app.config.get('CHARACTER_SYNC_CHECKPOINT_MAX_AGE_HOURS', 24)
+            checkpoint = SyncCheckpoint.query.filter(
+                SyncCheckpoint.guild_id == guild_id,
+                SyncCheckpoint.full_guild.is_(True),
+                SyncCheckpoint.completed_at.is_(None),
+                SyncCheckpoint.updated_at >= datetime.utcnow() - timedelta(hours=max_age)
+            ).order_by(SyncCheckpoint.updated_at.desc()).first()
+            if checkpoint is not None and task_id is not None:
+                checkpoint.task_id = task_id
+        
+        if checkpoint is None:
+            # Finished checkpoints are only kept until the next run of the same task shard
+            # (unsharded: the guild's next unsharded run); other running shards keep theirs
+            finished = SyncCheckpoint.query.filter(SyncCheckpoint.completed_at.isnot(None))
+            if shard is None:
+                finished = finished.filter(SyncCheckpoint.guild_id == guild_id, SyncCheckpoint.shard.is_(None))
+            else:
+                finished = finished.filter(SyncCheckpoint.task_id == task_id, SyncCheckpoint.shard == shard)
+            finished.delete(synchronize_session=False)
+            checkpoint = SyncCheckpoint(
+                guild_id=guild_id,
+                task_id=task_id,
+                full_guild=full_guild,
+                shard=shard,
+                total=len(characters),
+                counters=json.dumps(dict.fromkeys(SYNC_COUNTERS, 0))
+            )
+            db.session.add(checkpoint)
+        return checkpoint
+    
+    def _save_sync_checkpoint(self, checkpoint, counts, remaining_ids, last_character_id=None):
+        """Record counters and the characters still to do (committed with the batch it describes)"""
+        checkpoint.counters = json.dumps(counts)
+        checkpoint.remaining_ids = json.dumps(remaining_ids)
+        if last_character_id is not None:
+            checkpoint.last_character_id = last_character_id
+        checkpoint.updated_at = datetime.utcnow()
+    
+    def _fetch_all_character_details(self, targets, concurrency):
+        """
+        Fetch details for (realm_slug, character_name, validators, skip) targets.
+        Yields (details, error) tuples in input order; up to `concurrency` characters are
+        fetched in parallel while the caller consumes earlier results.
+        
+        At most `concurrency * 2` fetches are submitted ahead of the caller. Closing
+        the generator (or an exception in the caller that closes it) cancels the
+        fetches not yet started, so no API calls continue after the task gave up.
+        """
+        if concurrency <= 1 or len(targets) <= 1:
+            for target in targets:
+                yield self._fetch_character_details_safe(*target)
+            return
+        
+        app = current_app._get_current_object()
+        
+        def fetch(target):
+            # Worker threads need their own app context for config and logging
+            with app.app_context():
+                return self._fetch_character_details_safe(*target)
+        
+        remaining = iter(targets)
+        pending = deque()
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='character-sync')
+        try:
+            for target in islice(remaining, concurrency * 2):
+                pending.append(executor.submit(fetch, target))
+            while pending:
+                result = pending.popleft().result()
+                for target in islice(remaining, 1):
+                    pending.append(executor.submit(fetch, target))
+                yield result
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _fetch_character_details_safe(self, realm_slug, character_name, validators=None, skip=None):
+        """Fetch details for one character, returning (details, error) instead of raising"""
+        try:
+            return self._fetch_character_details(realm_slug, character_name, validators, skip), None
+        except Exception as e:
+            return None, e
+    
+    def _fetch_character_details(self, realm_slug, character_name, validators=None, skip=None):
+        """
+        Fetch profile, specialization, media and PvP data for one character.
+        Runs on worker threads, so it only talks to the API and never touches the database.
+        
+        Args:
+            validators: Optional dict of endpoint -> {'etag', 'last_modified'}; when given,
+                requests are conditional and endpoints answering 304 are left as None.
+            skip: Optional set of endpoints not to call (left as None, not in 'fetched').
+        
+        Returns a dict where None for 'profile', 'spec_name', 'avatar_url' or 'pvp' means
+        "leave the stored value as is".
+        """
+        details = {
+            'profile': None,
+            'spec_name': None,
+            'avatar_url': None,
+            'pvp': None,
+            'not_modified': set(),
+            'validators': {},
+            'fetched': set()  # Endpoints that answered (200 or 304)
+        }
+        skip = skip or set()
+        
+        def call(fetch, endpoint):
+            if endpoint in skip:
+                return None
+            if validators is None:
+                data = fetch(realm_slug, character_name)
+                details['fetched'].add(endpoint)
+                return data
+            result = fetch(realm_slug, character_name, validators.get(endpoint, {}))
+            details['fetched'].add(endpoint)
+            details['validators'][endpoint] = (result.etag, result.last_modified)
+            if result.not_modified:
+                details['not_modified'].add(endpoint)
+            return result.data
+        
+        # Transient errors (5xx, 429, timeouts) are retried inside the API client;
+        # a 404 raises BattleNetNotFoundError straight away
+        profile = call(self.api.get_character_profile, 'profile')
+        
+        if not profile and 'profile' not in details['not_modified'] and 'profile' not in skip:
+            raise BattleNetAPIError(f"Empty profile returned for '{character_name}'")
+        details['profile'] = profile
+        
+        # Fetch specialization (Classic uses talent trees)
+        try:
+            specs = call(self.api.get_character_specializations, 'specializations')
+            if specs is not None:
+                # Extract primary spec from talent tree distribution
+                primary_spec = self.api.get_primary_spec_from_talents(specs)
+                if primary_spec:
+                    details['spec_name'] = primary_spec
+                    current_app.logger.debug(f"✅ {character_name}: {primary_spec}")
+                else:
+                    details['spec_name'] = ''
+                    current_app.logger.debug(f"⚠️  {character_name}: No spec found (low level or no talents)")
+        except Exception as spec_error:
+            details['spec_name'] = ''
+            current_app.logger.warning(f"Could not fetch spec for {character_name}: {str(spec_error)}")
+        
+        # Fetch character media (avatar)
+        try:
+            media = call(self.api.get_character_media, 'character-media')
+            # Extract avatar URL from assets
+            for asset in (media or {}).get('assets', []):
+                if asset.get('key') == 'avatar':
+                    details['avatar_url'] = asset.get('value')
+                    current_app.logger.debug(f"✅ {character_name}: Avatar URL updated")
+                    break
+        except Exception as media_error:
+            # Avatar is optional, don't fail if not available
+            current_app.logger.debug(f"Could not fetch media for {character_name}: {str(media_error)}")
+        
+        # Fetch PvP statistics
+        try:
+            details['pvp'] = call(self.api.get_character_pvp_summary, 'pvp-summary')
+            if details['pvp'] is not None:
+                current_app.logger.debug(f"✅ {character_name}: PvP stats updated (HKs: {details['pvp'].get('honorable_kills', 0)}, Rank: {details['pvp'].get('pvp_rank', 0)})")
+        except Exception as pvp_error:
+            # PvP stats are optional, don't fail if not available
+            current_app.logger.debug(f"Could not fetch PvP stats for {character_name}: {str(pvp_error)}")
+        
+        return details
+    
+    def _apply_character_details(self, character, details):
+        """
+        Copy fetched character details onto the Character row (main thread only).
+        Returns False without touching the row when nothing new was fetched or the
+        merged profile data matches the stored profile_digest.
+        """
+        profile = details['profile']
+        
+        if profile is None and details['spec_name'] is None and details['avatar_url'] is None and details['pvp'] is None:
+            return False
+        
+        # Start from the stored values; endpoints that were not fetched (304) keep them
+        values = {column: getattr(character, column) for column in PROFILE_COLUMNS}
+        
+        if profile is not None:
+            values['achievement_points'] = profile.get('achievement_points', 0)
+            values['average_item_level'] = profile.get('average_item_level', 0)
+            values['equipped_item_level'] = profile.get('equipped_item_level', 0)
+            values['gender'] = profile.get('gender', {}).get('name', '')
+            values['faction'] = profile.get('faction', {}).get('name', '')
+            values['character_class'] = profile.get('character_class', {}).get('name', '')
+            values['race'] = profile.get('race', {}).get('name', '')
+            values['last_login_timestamp'] = profile.get('last_login_timestamp')
+        
+        if details['spec_name'] is not None:
+            values['spec_name'] = details['spec_name']
+        
+        if details['avatar_url']:
+            values['avatar_url'] = details['avatar_url']
+        
+        if details['pvp'] is not None:
+            values['honorable_kills'] = details['pvp'].get('honorable_kills', 0)
+            values['pvp_rank'] = details['pvp'].get('pvp_rank', 0)
+        
+        digest = hashlib.sha1(json.dumps(values, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        if character.profile_digest == digest:
+            return False
+        
+        for column, value in values.items():
+            if getattr(character, column) != value:
+                setattr(character, column, value)
+        character.profile_digest = digest
+        character.last_updated = datetime.utcnow()
+        return True
+    
+    def _track_progression(self, character, latest_progression, progression_rows):
+        """
+        Queue a CharacterProgressionHistory row when the character's level or item
+        levels differ from its latest entry (latest_progression: character_id ->
+        (level, average, equipped)), like the roster sync's change detection
+        """
+        values = (character.level, character.average_item_level, character.equipped_item_level)
+        if latest_progression.get(character.id) == values or not (character.level or character.average_item_level):
+            return
+        latest_progression[character.id] = values
+        progression_rows.append({
+            'character_id': character.id,
+            'guild_id': character.guild_id,
+            'character_level': character.level,
+            'average_item_level': character.average_item_level,
+            'equipped_item_level': character.equipped_item_level
+        })
+    
+    def _insert_progression(self, progression_rows):
+        """Insert queued progression rows with one executemany and clear the list (the caller commits)"""
+        if progression_rows:
+            db.session.execute(db.insert(CharacterProgressionHistory), progression_rows)
+            progression_rows.clear()
+    
+    def _mark_details_checked(self, character_ids, touched_states, restamp_after):
+        """
+        Record the fetch time and roster level of checked characters, and the fetch
+        time of endpoint states whose validators did not change (one UPDATE per batch
+        and endpoint instead of one per row). Characters stamped less than
+        `restamp_after` ago at their current level are not rewritten.
+        """
+        now = datetime.utcnow()
+        if character_ids:
+            db.session.execute(
+                db.update(Character).where(
+                    Character.id.in_(character_ids),
+                    db.or_(
+                        Character.details_checked_at.is_(None),
+                        Character.details_checked_at < now - restamp_after,
+                        Character.checked_level.is_distinct_from(Character.level)
+                    )
+                ).values(
+                    details_checked_at=now,
+                    checked_level=Character.level
+                ).execution_options(synchronize_session=False)
+            )
+        for endpoint, ids in touched_states.items():
+            db.session.execute(
+                db.update(CharacterEndpointState).where(
+                    CharacterEndpointState.endpoint == endpoint,
+                    CharacterEndpointState.character_id.in_(ids)
+                ).values(checked_at=now).execution_options(synchronize_session=False)
+            )
+    
+    def _store_endpoint_states(self, character, details, endpoint_states, touched_states, endpoint_policy):
+        """
+        Persist new ETag/Last-Modified validators and the fetch time of every endpoint
+        that answered. States whose validators are unchanged are only collected in
+        touched_states ({endpoint: [character_id, ...]}) for _mark_details_checked,
+        and only for endpoints with a TTL: a TTL endpoint is fetched at most once per
+        TTL, while the fetch time of an endpoint called on every refresh is never
+        read, so restamping it would rewrite every state row on every run.
+        """
+        now = datetime.utcnow()
+        for endpoint in details['fetched']:
+            key = (character.id, endpoint)
+            state = endpoint_states.get(key)
+            validators = details['validators'].get(endpoint)
+            if state is None:
+                state = CharacterEndpointState(character_id=character.id, endpoint=endpoint)
+                db.session.add(state)
+                endpoint_states[key] = state
+            elif validators is None or (state.etag, state.last_modified) == validators:
+                if endpoint_policy.tracks_fetch_time(endpoint):
+                    touched_states.setdefault(endpoint, []).append(character.id)
+                continue
+            if validators is not None:
+                state.etag, state.last_modified = validators
+                state.updated_at = now
+            state.checked_at = now
+    
+    def select_characters_for_refresh(self, guild_id=None, limit=None, policy=None):
+        """
+        Characters due for a detail refresh under the refresh policy, highest priority
+        first, across all guilds or just one.
+        Returns {guild_id: [character_id, ...]} with at most `limit` characters in total.
+        """
+        policy = policy or RefreshPolicy.from_config()
+        query = Character.query.options(load_only(
+            Character.id, Character.guild_id, Character.level, Character.checked_level,
+            Character.last_login_timestamp, Character.details_checked_at
+        ))
+        if guild_id is not None:
+            query = query.filter(Character.guild_id == guild_id)
+        else:
+            query = query.filter(Character.guild_id.isnot(None))
+        
+        due = {}
+        for character in policy.select(query.all(), limit=limit):
+            due.setdefault(character.guild_id, []).append(character.id)
+        return due
+    
+    def get_due_character_retries(self, limit=None):
+        """
+        Characters whose queued retry is due, oldest first.
+        Returns {guild_id: [character_id, ...]} with at most `limit` characters in total.
+        """
+        query = db.session.query(Character.guild_id, CharacterSyncRetry.character_id).join(
+            Character, Character.id == CharacterSyncRetry.character_id
+        ).filter(
+            CharacterSyncRetry.next_attempt_at <= datetime.utcnow(),
+            Character.guild_id.isnot(None)
+        ).order_by(CharacterSyncRetry.next_attempt_at)
+        if limit:
+            query = query.limit(limit)
+        
+        due = {}
+        for guild_id, character_id in query:
+            due.setdefault(guild_id, []).append(character_id)
+        return due
+    
+    def _queue_character_retry(self, retries, character, error):
+        """
+        Queue a failed character for another attempt, doubling the delay each time
+        (and honouring Retry-After). Returns False once CHARACTER_RETRY_MAX_ATTEMPTS
+        is used up, dropping the entry.
+        """
+        max_attempts = current_app.config.get('CHARACTER_RETRY_MAX_ATTEMPTS', 5)
+        if not max_attempts:
+            return False
+        
+        entry = retries.get(character.id)
+        attempts = (entry.attempts if entry else 0) + 1
+        if attempts > max_attempts:
+            current_app.logger.warning(f"Giving up on '{character.name}' after {max_attempts} retries: {error}")
+            self._clear_character_retry(retries, character.id)
+            return False
+        
+        if entry is None:
+            entry = CharacterSyncRetry(character_id=character.id)
+            db.session.add(entry)
+            retries[character.id] = entry
+        
+        delay = current_app.config.get('CHARACTER_RETRY_BASE_DELAY', 300) * 2 ** (attempts - 1)
+        delay = max(delay, getattr(error, 'retry_after', None) or 0)
+        now = datetime.utcnow()
+        entry.attempts = attempts
+        entry.reason = str(error)[:500]
+        entry.next_attempt_at = now + timedelta(seconds=delay)
+        entry.updated_at = now
+        return True
+    
+    def _clear_character_retry(self, retries, character_id):
+        """Drop the retry queue entry of a character that no longer needs one"""
+        entry = retries.pop(character_id, None)
+        if entry is not None:
+            db.session.delete(entry)
+    
+    def _load_unindexed_characters(self, realm_slugs):
+        """
+        Load negative cache entries for the given realms, keyed by (realm_slug, lowercase name).
+        Expired entries are included so they can be refreshed in place.
+        """
+        if not current_app.config.get('UNINDEXED_CHARACTER_TTL_HOURS', 72) or not realm_slugs:
+            return {}
+        entries = UnindexedCharacter.query.filter(UnindexedCharacter.realm_slug.in_(list(realm_slugs))).all()
+        return {(entry.realm_slug, entry.name): entry for entry in entries}
+    
+    def _is_known_unindexed(self, unindexed, realm_slug, character_name, level):
+        """True if this character answered 404 recently and its level has not changed since"""
+        entry = unindexed.get((realm_slug, (character_name or '').lower()))
+        return entry is not None and entry.expires_at > datetime.utcnow() and entry.level == level
+    
+    def _remember_unindexed(self, unindexed, realm_slug, character_name, level):
+        """Record a 404 so the character is skipped until the TTL expires or its level changes"""
+        ttl_hours = current_app.config.get('UNINDEXED_CHARACTER_TTL_HOURS', 72)
+        if not ttl_hours or not realm_slug:
+            return
+        key = (realm_slug, (character_name or '').lower())
+        entry = unindexed.get(key)
+        if entry is None:
+            entry = UnindexedCharacter(realm_slug=key[0], name=key[1])
+            db.session.add(entry)
+            unindexed[key] = entry
+        now = datetime.utcnow()
+        entry.level = level
+        entry.last_checked = now
+        entry.expires_at = now + timedelta(hours=ttl_hours)
+    
+    def prune_unindexed_characters(self):
+        """
+        Delete expired negative cache entries (all of them when the cache is disabled).
+        Entries of characters still in a guild are recreated by their next 404;
+        the others (departed, renamed, deleted) would otherwise stay forever.
+        Returns the number of deleted rows (the caller commits).
+        """
+        query = db.delete(UnindexedCharacter)
+        if current_app.config.get('UNINDEXED_CHARACTER_TTL_HOURS', 72):
+            query = query.where(UnindexedCharacter.expires_at <= datetime.utcnow())
+        return db.session.execute(query.execution_options(synchronize_session=False)).rowcount
+    
+    def _forget_unindexed(self, unindexed, realm_slug, character_name):
+        """Drop the negative cache entry for a character that is now indexed"""
+        entry = unindexed.pop((realm_slug, (character_name or '').lower()), None)
+        if entry is not None:
+            db.session.delete(entry)
@@ -3,19 +3,63 @@ Celery background tasks for long-running operations
 """
 from app.celery_config import celery
 from app import create_app, db
-from app.models import Guild, Character, Task
-from app.services import GuildService
+from app.models import Guild, Character, Task, SyncCheckpoint
+from app.services import GuildService, SYNC_COUNTERS
+from app.bnet_api import BattleNetAPIError
 from datetime import datetime
-from celery import current_task
+from celery import current_task, chord
 from celery.exceptions import SoftTimeLimitExceeded
+from kombu.exceptions import OperationalError as BrokerOperationalError
+from sqlalchemy.exc import DBAPIError, OperationalError as DatabaseOperationalError
 import logging
 
+try:
+    from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+    REDIS_TRANSIENT_ERRORS = (RedisConnectionError, RedisTimeoutError)
+except ImportError:  # redis is in requirements.txt, but only the broker and cache need it
+    REDIS_TRANSIENT_ERRORS = ()
+
 logger = logging.getLogger(__name__)
 
 # Create Flask app context for tasks
 flask_app = create_app()
 
 
+def is_transient_error(error):
+    """True if re-running the whole task later may succeed"""
+    if isinstance(error, BattleNetAPIError):
+        return error.retryable
+    # Database / broker / Redis connection problems and timeouts
+    if isinstance(error, DatabaseOperationalError):
+        return True
+    if isinstance(error, DBAPIError):
+        return error.connection_invalidated
+    return isinstance(error, (BrokerOperationalError, ConnectionError, TimeoutError) + REDIS_TRANSIENT_ERRORS)
+
+
+def retry_countdown(error, default):
+    """Task retry delay in seconds, respecting a server-provided Retry-After"""
+    retry_after = getattr(error, 'retry_after', None)
+    if retry_after:
+        return max(default, int(retry_after) + 1)
+    return default
+
+
+def continue_task(task, error, continuations):
+    """
+    Re-run a task that hit its soft time limit from its checkpoint. Continuations
+    are counted in their own `continuations` kwarg, so they never use up the
+    task's max_retries for errors.
+    """
+    kwargs = dict(task.request.kwargs or {}, continuations=continuations + 1)
+    return task.retry(exc=error, countdown=5, kwargs=kwargs, max_retries=task.request.retries + 1)
+
+
+def retry_task(task, error, countdown, continuations):
+    """Retry a task after a transient error; its max_retries excludes earlier continuations"""
+    return task.retry(exc=error, countdown=countdown, max_retries=task.max_retries + continuations)
+
+
 def update_task_progress(task_record, progress, current_step, status='STARTED'):
     """Update task progress in database"""
     with flask_app.app_context():
@@ -40,6 +84,46 @@ def update_task_progress(task_record, progress, current_step, status='STARTED'):
             db.session.rollback()
 
 
+def character_sync_message(result):
+    """Summary line for a finished character detail sync"""
+    message = (
+        f"Character sync completed! {result['changed']} changed, {result['unchanged']} unchanged, "
+        f"{result['failed']} failed out of {result['total']} characters."
+    )
+    if result.get('skipped', 0) > 0:
+        message += f" {result['skipped']} skipped"
+        if result.get('unindexed_skipped', 0) > 0:
+            message += f" ({result['unindexed_skipped']} recently not indexed by Battle.net)"
+        message += "."
+    if result.get('retry_queued', 0) > 0:
+        message += f" {result['retry_queued']} queued for retry."
+    return message
+
+
+def record_shard_done(task_id):
+    """Count one finished shard of a sharded character sync and update progress"""
+    try:
+        # Atomic increment - shards finish concurrently on different workers
+        db.session.execute(
+            db.update(Task).where(Task.id == task_id).values(shards_done=Task.shards_done + 1)
+        )
+        # The row stays locked until commit, so this reads our own increment
+        done, total = db.session.execute(
+            db.select(Task.shards_done, Task.shards_total).where(Task.id == task_id)
+        ).one()
+        total = max(total or 1, 1)
+        db.session.execute(
+            db.update(Task).where(Task.id == task_id).values(
+                progress=20 + 70 * min(done, total) // total,
+                current_step=f"Synced {min(done, total)} of {total} shards"
+            )
+        )
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"Error recording shard progress: {str(e)}")
+        db.session.rollback()
+
+
 @celery.task(bind=True, name='app.tasks.sync_guild_roster', max_retries=3, soft_time_limit=300)
 def sync_guild_roster(self, realm_slug, guild_name_slug, task_id=None):
     """
@@ -54,9 +138,11 @@ def sync_guild_roster(self, realm_slug, guild_name_slug, task_id=None):
         task_record = None
         
         try:
-            # Get or create task record
+            # Get or create task record (a retried task already created one under its Celery ID)
             if task_id:
                 task_record = Task.query.get(task_id)
+            else:
+                task_record = Task.query.filter_by(celery_id=self.request.id).first()
             
             if not task_record:
                 task_record = Task(
@@ -77,7 +163,7 @@ def sync_guild_roster(self, realm_slug, guild_name_slug, task_id=None):
             update_task_progress(task_record, 20, "Fetching guild information from Battle.net...")
             
             # Perform the sync
-            guild, member_count, removed_count = service.sync_guild_roster(realm_slug, guild_name_slug)
+            guild, member_count, removed_count, roster_stats = service.sync_guild_roster(realm_slug, guild_name_slug)
             
             # Update task with guild_id
             task_record.guild_id = guild.id
@@ -85,10 +171,25 @@ def sync_guild_roster(self, realm_slug, guild_name_slug, task_id=None):
             update_task_progress(task_record, 90, f"Synced {member_count} members, removed {removed_count}")
             
             # Build success message
-            success_msg = f'Successfully synced {member_count} members from {guild.name}'
-            if removed_count > 0:
-                success_msg += f' ({removed_count} member{"s" if removed_count != 1 else ""} removed)'
-            success_msg += '. Character detail sync scheduled.'
+            if roster_stats.get('roster_unchanged'):
+                success_msg = f'Roster of {guild.name} unchanged since last sync ({member_count} members) - no changes'
+            else:
+                success_msg = f'Successfully synced {member_count} members from {guild.name}'
+                if removed_count > 0:
+                    success_msg += f' ({removed_count} member{"s" if removed_count != 1 else ""} removed)'
+            detail_ids = roster_stats['detail_character_ids']
+            handoff = flask_app.config.get('CHARACTER_REFRESH_POLICY', 'delta')
+            if handoff == 'priority':
+                # The delta first, then whatever else the refresh policy considers due
+                flagged = set(detail_ids)
+                due_ids = service.select_characters_for_refresh(guild_id=guild.id).get(guild.id, [])
+                detail_ids = detail_ids + [character_id for character_id in due_ids if character_id not in flagged]
+            if handoff == 'all':
+                success_msg += '. Character detail sync scheduled.'
+            elif detail_ids:
+                success_msg += f'. Character detail sync scheduled for {len(detail_ids)} characters.'
+            else:
+                success_msg += '. No character details to refresh now.'
             
             # Mark as complete
             task_record.status = 'SUCCESS'
@@ -100,10 +201,16 @@ def sync_guild_roster(self, realm_slug, guild_name_slug, task_id=None):
             
             logger.info(f"Guild sync completed: {success_msg}")
             
-            # Automatically schedule character detail sync after successful guild sync
+            # Automatically schedule character detail sync after successful guild sync:
+            # only the characters the roster diff flagged, the rest is left to the
+            # hourly refresh_characters_scheduled task (CHARACTER_REFRESH_POLICY=all syncs everyone)
             logger.info(f"Scheduling character detail sync for guild {guild.id}...")
-            sync_character_details.delay(guild.id)
-            logger.info(f"Character detail sync task queued for guild {guild.id}")
+            if handoff == 'all':
+                sync_character_details.delay(guild.id)
+                logger.info(f"Character detail sync task queued for guild {guild.id}")
+            elif detail_ids:
+                sync_character_details.delay(guild.id, character_ids=detail_ids)
+                logger.info(f"Character detail sync queued for {len(detail_ids)} characters of guild {guild.id}")
             
             return {
                 'status': 'success',
@@ -111,6 +218,10 @@ def sync_guild_roster(self, realm_slug, guild_name_slug, task_id=None):
                 'guild_name': guild.name,
                 'member_count': member_count,
                 'removed_count': removed_count,
+                'changed_count': roster_stats['changed'],
+                'roster_unchanged': roster_stats['roster_unchanged'],
+                'unindexed_skipped': roster_stats['unindexed_skipped'],
+                'detail_sync_characters': None if handoff == 'all' else len(detail_ids),
                 'message': success_msg
             }
             
@@ -139,28 +250,36 @@ def sync_guild_roster(self, realm_slug, guild_name_slug, task_id=None):
                 db.session.commit()
             
             # Retry if this is a transient error (network, API issues)
-            if 'connection' in str(e).lower() or 'timeout' in str(e).lower():
-                raise self.retry(exc=e, countdown=60)  # Retry after 60 seconds
+            if is_transient_error(e):
+                raise self.retry(exc=e, countdown=retry_countdown(e, 60))  # Retry after 60 seconds
             
             raise
 
 
 @celery.task(bind=True, name='app.tasks.sync_character_details', max_retries=3, soft_time_limit=600)
-def sync_character_details(self, guild_id, task_id=None):
+def sync_character_details(self, guild_id, task_id=None, character_ids=None, continuations=0):
     """
     Background task to sync detailed character information for a guild
     
     Args:
         guild_id: Database ID of the guild
         task_id: Database task record ID for progress tracking
+        character_ids: Only sync these characters, in this order (default: all)
+        continuations: Time-limit continuations so far, counted apart from error retries
+    
+    With CHARACTER_SYNC_SHARD_SIZE set, guilds with more characters than that are
+    split into shards that run as parallel sync_character_shard subtasks; the
+    finalize_character_sync chord callback completes the task record.
     """
     with flask_app.app_context():
         task_record = None
         
         try:
-            # Get or create task record
+            # Get or create task record (a retried task already created one under its Celery ID)
             if task_id:
                 task_record = Task.query.get(task_id)
+            else:
+                task_record = Task.query.filter_by(celery_id=self.request.id).first()
             
             if not task_record:
                 task_record = Task(
@@ -179,17 +298,48 @@ def sync_character_details(self, guild_id, task_id=None):
             # Create service and sync
             service = GuildService()
             
+            # Large guilds: fan out one subtask per shard, a chord callback finalizes the task
+            shard_size = flask_app.config.get('CHARACTER_SYNC_SHARD_SIZE', 0)
+            if shard_size > 0:
+                shard_ids = character_ids
+                if shard_ids is None:
+                    shard_ids = [
+                        character_id for (character_id,) in
+                        db.session.query(Character.id).filter_by(guild_id=guild_id).order_by(Character.id)
+                    ]
+                if len(shard_ids) > shard_size:
+                    shards = [shard_ids[i:i + shard_size] for i in range(0, len(shard_ids), shard_size)]
+                    task_record.shards_total = len(shards)
+                    task_record.shards_done = 0
+                    guild = Guild.query.get(guild_id)
+                    if guild is not None and guild.counters_rebuilt_at is None:
+                        # Count once here; shards running in parallel only apply their deltas
+                        service.rebuild_analytics_counters(guild)
+                    db.session.commit()  # Shards update these counters as they finish
+                    update_task_progress(task_record, 20, f"Syncing {len(shard_ids)} characters in {len(shards)} shards...")
+                    
+                    chord(
+                        sync_character_shard.s(guild_id, shard, task_record.id, index)
+                        for index, shard in enumerate(shards)
+                    )(finalize_character_sync.s(guild_id, task_record.id))
+                    
+                    logger.info(f"Character sync for guild {guild_id} split into {len(shards)} shards")
+                    return {
+                        'status': 'sharded',
+                        'guild_id': guild_id,
+                        'total': len(shard_ids),
+                        'shards': len(shards)
+                    }
+            
             update_task_progress(task_record, 20, "Fetching character details from Battle.net...")
             
-            # Perform the sync
-            result = service.sync_character_details(guild_id)
+            # Perform the sync (resumes from the task's or guild's checkpoint if there is one)
+            result = service.sync_character_details(guild_id, character_ids=character_ids, task_id=task_record.id)
             
-            update_task_progress(task_record, 90, f"Synced {result['successful']} of {result['total']} characters")
+            update_task_progress(task_record, 90, f"Synced {result['changed'] + result['unchanged']} of {result['total']} characters")
             
             # Build success message
-            success_msg = f"Character sync completed! Successfully updated {result['successful']} out of {result['total']} characters."
-            if result.get('failed', 0) > 0:
-                success_msg += f" ({result['failed']} failed)"
+            success_msg = character_sync_message(result)
             
             # Mark as complete
             task_record.status = 'SUCCESS'
@@ -205,13 +355,26 @@ def sync_character_details(self, guild_id, task_id=None):
                 'status': 'success',
                 'guild_id': guild_id,
                 'total': result['total'],
+                'changed': result['changed'],
                 'successful': result['successful'],
-                'failed': result.get('failed', 0),
+                'unchanged': result['unchanged'],
+                'failed': result['failed'],
+                'skipped': result.get('skipped', 0),
+                'unindexed_skipped': result.get('unindexed_skipped', 0),
+                'retry_queued': result.get('retry_queued', 0),
+                'endpoint_calls_skipped': result.get('endpoint_calls_skipped', 0),
                 'message': success_msg
             }
             
-        except SoftTimeLimitExceeded:
-            # Task took too long
+        except SoftTimeLimitExceeded as e:
+            # Task ran out of time - progress up to the last batch is checkpointed,
+            # so continue in a fresh run instead of starting over
+            max_continuations = flask_app.config.get('CHARACTER_SYNC_MAX_CONTINUATIONS', 10)
+            if task_record and continuations < max_continuations:
+                logger.warning(f"Character sync for guild {guild_id} hit the time limit; continuing from checkpoint")
+                update_task_progress(task_record, task_record.progress or 20, "Time limit reached, continuing from checkpoint...", status='RETRY')
+                raise continue_task(self, e, continuations)
+            
             error_msg = "Character sync timed out (exceeded 10 minutes)"
             logger.error(error_msg)
             
@@ -234,13 +397,242 @@ def sync_character_details(self, guild_id, task_id=None):
                 task_record.completed_at = datetime.utcnow()
                 db.session.commit()
             
-            # Retry if this is a transient error
-            if 'connection' in str(e).lower() or 'timeout' in str(e).lower():
-                raise self.retry(exc=e, countdown=120)  # Retry after 2 minutes
+            # Characters that fail on their own are queued in CharacterSyncRetry; only errors
+            # that abort the whole run get here, and the retry resumes from the checkpoint
+            if is_transient_error(e):
+                raise retry_task(self, e, retry_countdown(e, 120), continuations)  # Retry after 2 minutes
             
             raise
 
 
+@celery.task(bind=True, name='app.tasks.sync_character_shard', max_retries=3, soft_time_limit=600)
+def sync_character_shard(self, guild_id, character_ids, task_id, shard, continuations=0):
+    """
+    One shard of a sharded character detail sync (see sync_character_details)
+    
+    Args:
+        guild_id: Database ID of the guild
+        character_ids: Characters in this shard
+        task_id: Database task record ID of the parent sync
+        shard: Shard index, used to checkpoint this shard separately
+        continuations: Time-limit continuations so far, counted apart from error retries
+    
+    Always returns a result dict (with status 'error' once retries are used up) so
+    the chord callback runs even when a shard fails.
+    """
+    with flask_app.app_context():
+        try:
+            service = GuildService()
+            result = service.sync_character_details(guild_id, character_ids=character_ids, task_id=task_id, shard=shard)
+            result['status'] = 'success'
+            
+        except SoftTimeLimitExceeded as e:
+            # Continue from the shard's checkpoint in a fresh run
+            max_continuations = flask_app.config.get('CHARACTER_SYNC_MAX_CONTINUATIONS', 10)
+            if continuations < max_continuations:
+                logger.warning(f"Shard {shard} of guild {guild_id} hit the time limit; continuing from checkpoint")
+                raise continue_task(self, e, continuations)
+            result = {'status': 'error', 'error': "Shard timed out (exceeded 10 minutes)"}
+            
+        except Exception as e:
+            logger.error(f"Error syncing shard {shard} of guild {guild_id}: {str(e)}", exc_info=True)
+            if is_transient_error(e) and self.request.retries - continuations < self.max_retries:
+                raise retry_task(self, e, retry_countdown(e, 120), continuations)
+            result = {'status': 'error', 'error': str(e)}
+        
+        if result['status'] == 'error':
+            # Characters of a failed shard are reported as failed
+            result.update(dict.fromkeys(SYNC_COUNTERS, 0), total=len(character_ids), failed=len(character_ids))
+        
+        record_shard_done(task_id)
+        return result
+
+
+@celery.task(name='app.tasks.finalize_character_sync')
+def finalize_character_sync(results, guild_id, task_id):
+    """
+    Chord callback of a sharded character detail sync: add up the shard results
+    and finalize the task record
+    
+    Args:
+        results: Result dicts of all shards
+        guild_id: Database ID of the guild
+        task_id: Database task record ID
+    """
+    with flask_app.app_context():
+        totals = dict.fromkeys(('total',) + SYNC_COUNTERS, 0)
+        for result in results:
+            for key in totals:
+                totals[key] += result.get(key, 0)
+        failed_shards = [result['error'] for result in results if result.get('status') == 'error']
+        
+        success_msg = character_sync_message(totals)
+        if failed_shards:
+            success_msg += f" {len(failed_shards)} of {len(results)} shards failed."
+        
+        task_record = Task.query.get(task_id)
+        if task_record:
+            task_record.status = 'SUCCESS' if len(failed_shards) < len(results) else 'FAILURE'
+            task_record.progress = 100
+            task_record.current_step = "Sync completed"
+            task_record.result_message = success_msg
+            if failed_shards:
+                task_record.error_message = '; '.join(sorted(set(failed_shards)))
+            task_record.completed_at = datetime.utcnow()
+        
+        # Shards leave the data_version bump and analytics snapshot to this callback
+        if totals['changed']:
+            GuildService().publish_guild_changes(guild_id)
+        
+        # Shards keep their finished checkpoints until the whole task is done
+        SyncCheckpoint.query.filter(
+            SyncCheckpoint.task_id == task_id,
+            SyncCheckpoint.completed_at.isnot(None)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        
+        logger.info(f"Sharded character sync completed: {success_msg}")
+        
+        return dict(
+            totals,
+            status='success',
+            guild_id=guild_id,
+            successful=totals['changed'],
+            shards=len(results),
+            failed_shards=len(failed_shards),
+            message=success_msg
+        )
+
+
+@celery.task(name='app.tasks.retry_failed_characters', soft_time_limit=600)
+def retry_failed_characters():
+    """
+    Periodic task (Celery Beat) that re-fetches characters from the retry queue
+    whose next attempt is due, up to CHARACTER_RETRY_BATCH_SIZE per run
+    """
+    with flask_app.app_context():
+        try:
+            service = GuildService()
+            due = service.get_due_character_retries(limit=flask_app.config.get('CHARACTER_RETRY_BATCH_SIZE', 200))
+            
+            if not due:
+                return {'status': 'success', 'characters': 0}
+            
+            totals = dict.fromkeys(('total',) + SYNC_COUNTERS, 0)
+            for guild_id, character_ids in due.items():
+                try:
+                    result = service.sync_character_details(guild_id, character_ids=character_ids)
+                    for key in totals:
+                        totals[key] += result.get(key, 0)
+                except Exception as e:
+                    logger.error(f"Error retrying characters of guild {guild_id}: {str(e)}")
+            
+            logger.info(
+                f"Retried {totals['total']} characters from {len(due)} guilds: {totals['changed']} changed, "
+                f"{totals['unchanged']} unchanged, {totals['failed']} failed ({totals['retry_queued']} re-queued)"
+            )
+            return dict(totals, status='success', characters=totals['total'], guilds=len(due))
+            
+        except Exception as e:
+            logger.error(f"Error in character retry run: {str(e)}", exc_info=True)
+            return {
+                'status': 'error',
+                'error': str(e)
+            }
+
+@celery.task(name='app.tasks.refresh_characters_scheduled')
+def refresh_characters_scheduled():
+    """
+    Periodic task (Celery Beat) that queues detail syncs for the characters the
+    refresh policy ranks highest, up to CHARACTER_REFRESH_BUDGET characters per run
+    """
+    with flask_app.app_context():
+        try:
+            service = GuildService()
+            due = service.select_characters_for_refresh(limit=flask_app.config.get('CHARACTER_REFRESH_BUDGET', 500))
+            
+            if not due:
+                logger.info("No characters due for refresh")
+                return {'status': 'success', 'characters': 0}
+            
+            results = []
+            for guild_id, character_ids in due.items():
+                task_result = sync_character_details.apply_async(args=[guild_id], kwargs={'character_ids': character_ids})
+                results.append({
+                    'guild_id': guild_id,
+                    'characters': len(character_ids),
+                    'task_id': task_result.id
+                })
+            
+            total = sum(result['characters'] for result in results)
+            logger.info(f"Queued refresh of {total} characters in {len(results)} guilds")
+            return {
+                'status': 'success',
+                'characters': total,
+                'results': results
+            }
+            
+        except Exception as e:
+            logger.error(f"Error in scheduled character refresh: {str(e)}", exc_info=True)
+            return {
+                'status': 'error',
+                'error': str(e)
+            }
+
+@celery.task(name='app.tasks.check_analytics_counters', soft_time_limit=600)
+def check_analytics_counters():
+    """
+    Periodic task (Celery Beat) that compares every guild's incremental analytics
+    counters with a full recount and rebuilds the ones that drifted
+    """
+    with flask_app.app_context():
+        try:
+            service = GuildService()
+            repaired = []
+            for guild in Guild.query.order_by(Guild.id).all():
+                mismatches = service.check_analytics_counters(guild)
+                if mismatches:
+                    logger.warning(
+                        f"Analytics counters of {guild.name} drifted in {len(mismatches)} buckets "
+                        f"(e.g. {mismatches[0]['dimension']}[{mismatches[0]['bucket']}]: "
+                        f"stored {mismatches[0]['stored']}, actual {mismatches[0]['actual']}); rebuilding"
+                    )
+                    service.repair_analytics_counters(guild)
+                    db.session.commit()
+                    repaired.append(guild.id)
+            
+            logger.info(f"Analytics counter check complete: {len(repaired)} guilds rebuilt")
+            return {'status': 'success', 'repaired_guilds': repaired}
+            
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error checking analytics counters: {str(e)}", exc_info=True)
+            return {
+                'status': 'error',
+                'error': str(e)
+            }
+
+@celery.task(name='app.tasks.prune_unindexed_characters')
+def prune_unindexed_characters():
+    """
+    Periodic task (Celery Beat) that deletes expired entries of the unindexed
+    character cache
+    """
+    with flask_app.app_context():
+        try:
+            deleted = GuildService().prune_unindexed_characters()
+            db.session.commit()
+            logger.info(f"Pruned {deleted} expired unindexed character entries")
+            return {'status': 'success', 'deleted': deleted}
+            
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error pruning unindexed characters: {str(e)}", exc_info=True)
+            return {
+                'status': 'error',
+                'error': str(e)
+            }
+
 @celery.task(name='app.tasks.sync_all_guilds_scheduled')
 def sync_all_guilds_scheduled():
     """
@@ -0,0 +1,216 @@
+"""
+OAuth access token cache shared by every BattleNetAPI instance.
+
+A new BattleNetAPI() is created for each web request and each Celery task, so
+the token lives here instead of on the instance:
+
+- In-process: one cached token per (OAuth URL, client ID), guarded by a lock.
+- Cross-process (optional): the token is also stored in Redis so gunicorn and
+  Celery workers reuse each other's tokens. A Redis lock ensures only one
+  process requests a new token when many notice expiry at the same time.
+- Background refresh: once a token is within BNET_TOKEN_REFRESH_MARGIN seconds
+  of expiry, callers keep using it while one thread fetches its replacement.
+"""
+import hashlib
+import json
+import threading
+import time
+import uuid
+from flask import current_app
+from app.redis_client import get_redis, report_redis_error, RedisError
+
+# Stop handing out a token this many seconds before it actually expires
+TOKEN_EXPIRY_SAFETY_SECONDS = 60
+
+# How long a process may hold the cross-process refresh lock
+REFRESH_LOCK_SECONDS = 15
+
+# Compare-and-delete so a process only releases a lock it still owns
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Compare-and-delete for the shared token: only drop it if it is still the rejected
+# one, not a replacement another process stored in the meantime
+INVALIDATE_TOKEN_SCRIPT = """
+local raw = redis.call('get', KEYS[1])
+if raw and cjson.decode(raw)['access_token'] == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class TokenCache:
+    """Cached OAuth token for one set of client credentials"""
+
+    def __init__(self, oauth_url, client_id):
+        key_hash = hashlib.sha1(f"{oauth_url}|{client_id}".encode('utf-8')).hexdigest()[:16]
+        self.redis_key = f"bnet:oauth:token:{key_hash}"
+        self.redis_lock_key = f"bnet:oauth:token-lock:{key_hash}"
+        self.access_token = None
+        self.expires_at = 0.0  # Unix timestamp (shared with other processes via Redis)
+        self.lock = threading.Lock()
+        self.refreshing = False
+
+    def get_token(self, fetch_token):
+        """
+        Return a valid access token.
+
+        Args:
+            fetch_token: Callable returning (access_token, expires_in_seconds);
+                only called when no usable token is cached anywhere.
+        """
+        if self._is_usable():
+            if self._needs_refresh():
+                self._start_background_refresh(fetch_token)
+            return self.access_token
+
+        with self.lock:
+            # Another thread may have refreshed while we waited for the lock
+            if self._is_usable():
+                return self.access_token
+
+            if self._load_from_redis() and self._is_usable():
+                return self.access_token
+
+            self._refresh(fetch_token)
+            return self.access_token
+
+    def invalidate(self, access_token):
+        """
+        Drop a token the API rejected (e.g. with 401). Only the rejected token is
+        dropped: if this process or another one already replaced it, the
+        replacement stays cached.
+        """
+        with self.lock:
+            if self.access_token == access_token:
+                self.access_token = None
+                self.expires_at = 0.0
+            client = self._redis()
+            if client is not None:
+                try:
+                    client.eval(INVALIDATE_TOKEN_SCRIPT, 1, self.redis_key, access_token)
+                except RedisError as e:
+                    report_redis_error(e)
+
+    def _is_usable(self):
+        return self.access_token is not None and time.time() < self.expires_at - TOKEN_EXPIRY_SAFETY_SECONDS
+
+    def _needs_refresh(self):
+        margin = current_app.config.get('BNET_TOKEN_REFRESH_MARGIN', 600)
+        return time.time() >= self.expires_at - margin
+
+    def _redis(self):
+        if current_app.config.get('BNET_TOKEN_CACHE', 'redis') != 'redis':
+            return None
+        return get_redis()
+
+    def _store(self, access_token, expires_at):
+        self.access_token = access_token
+        self.expires_at = expires_at
+
+    def _load_from_redis(self):
+        """Adopt a token another process stored in Redis. Returns True if one was found."""
+        client = self._redis()
+        if client is None:
+            return False
+        try:
+            raw = client.get(self.redis_key)
+        except RedisError as e:
+            report_redis_error(e)
+            return False
+        if not raw:
+            return False
+
+        data = json.loads(raw)
+        if data.get('expires_at', 0) <= self.expires_at:
+            return False
+        self._store(data['access_token'], data['expires_at'])
+        return True
+
+    def _refresh(self, fetch_token):
+        """Fetch a new token, letting only one process at a time talk to the OAuth endpoint"""
+        client = self._redis()
+        lock_token = None
+
+        if client is not None:
+            lock_token = str(uuid.uuid4())
+            try:
+                acquired = client.set(self.redis_lock_key, lock_token, nx=True, ex=REFRESH_LOCK_SECONDS)
+            except RedisError as e:
+                report_redis_error(e)
+                client = None
+                acquired = False
+
+            if client is not None and not acquired:
+                # Another process is refreshing - wait for it to publish the new token
+                previous_expiry = self.expires_at
+                deadline = time.monotonic() + REFRESH_LOCK_SECONDS
+                while time.monotonic() < deadline:
+                    time.sleep(0.1)
+                    if self._load_from_redis() and self.expires_at > previous_expiry and self._is_usable():
+                        return
+                current_app.logger.warning("Timed out waiting for another worker to refresh the OAuth token")
+                lock_token = None
+
+        try:
+            access_token, expires_in = fetch_token()
+            expires_at = time.time() + expires_in
+            self._store(access_token, expires_at)
+
+            if client is not None:
+                try:
+                    client.set(
+                        self.redis_key,
+                        json.dumps({'access_token': access_token, 'expires_at': expires_at}),
+                        ex=max(int(expires_in) - TOKEN_EXPIRY_SAFETY_SECONDS, 1)
+                    )
+                except RedisError as e:
+                    report_redis_error(e)
+        finally:
+            if client is not None and lock_token is not None:
+                try:
+                    client.eval(RELEASE_LOCK_SCRIPT, 1, self.redis_lock_key, lock_token)
+                except RedisError as e:
+                    report_redis_error(e)
+
+    def _start_background_refresh(self, fetch_token):
+        """Refresh the token in a daemon thread while callers keep using the current one"""
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+
+        app = current_app._get_current_object()
+
+        def run():
+            with app.app_context():
+                try:
+                    with self.lock:
+                        # Another process may already have refreshed it
+                        if not (self._load_from_redis() and not self._needs_refresh()):
+                            self._refresh(fetch_token)
+                    app.logger.info("✅ OAuth token refreshed in background")
+                except Exception as e:
+                    app.logger.warning(f"Background OAuth token refresh failed: {str(e)}")
+                finally:
+                    self.refreshing = False
+
+        threading.Thread(target=run, name='bnet-token-refresh', daemon=True).start()
+
+
+def get_token_cache(oauth_url, client_id):
+    """Return the process-wide token cache for these credentials"""
+    key = (oauth_url, client_id)
+    cache = _caches.get(key)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.setdefault(key, TokenCache(oauth_url, client_id))
+    return cache
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Backfill GuildDailyRollup rows from the existing history tables.
+
+Starts from each guild's current members and walks back one day at a time,
+undoing later history: members 'added' after a day are taken out again, members
+'removed' after it are put back (with the level and class the history recorded),
+and CharacterProgressionHistory entries are rolled back to the character's
+previous level and item level. The state left at the end of each day becomes
+that day's rollup.
+
+Limitations: re-added departed members have no item level, and characters'
+classes are assumed unchanged. Days before a guild's first history entry are not
+backfilled. Existing rollups (written by syncs) are kept unless --overwrite.
+
+Usage:
+    python backfill_guild_rollups.py                 # All guilds, up to 365 days back
+    python backfill_guild_rollups.py --guild-id 3 --days 90
+    python backfill_guild_rollups.py --overwrite     # Replace existing rollups too
+"""
+
+import argparse
+import json
+from datetime import datetime, timedelta
+from app import create_app, db
+from app.analytics import MAX_LEVEL
+from app.models import Guild, Character, GuildMemberHistory, CharacterProgressionHistory, GuildDailyRollup
+
+
+def summarize(members):
+    """Rollup columns for {name: {'class', 'level', 'ilvl'}} (same rules as compute_guild_analytics)"""
+    class_distribution = {}
+    level_60_count = 0
+    item_levels = []
+    for member in members.values():
+        class_name = member['class'] or 'Unknown'
+        class_distribution[class_name] = class_distribution.get(class_name, 0) + 1
+        if member['level'] == MAX_LEVEL:
+            level_60_count += 1
+        if member['ilvl']:
+            item_levels.append(member['ilvl'])
+    return {
+        'member_count': len(members),
+        'level_60_count': level_60_count,
+        'average_item_level': round(sum(item_levels) / len(item_levels), 2) if item_levels else 0,
+        'class_distribution': json.dumps(class_distribution, sort_keys=True)
+    }
+
+
+def history_events(guild_id, since):
+    """(timestamp, kind, payload) for every history entry after `since`, newest first"""
+    events = []
+    for entry in GuildMemberHistory.query.filter(
+        GuildMemberHistory.guild_id == guild_id,
+        GuildMemberHistory.timestamp >= since
+    ):
+        events.append((entry.timestamp, entry.action, entry))
+    
+    # Each progression entry is undone by restoring the character's entry before it
+    previous = {}
+    for entry in CharacterProgressionHistory.query.filter(
+        CharacterProgressionHistory.guild_id == guild_id
+    ).order_by(CharacterProgressionHistory.character_id, CharacterProgressionHistory.timestamp):
+        if entry.timestamp >= since:
+            events.append((entry.timestamp, 'progression', (entry, previous.get(entry.character_id))))
+        previous[entry.character_id] = entry
+    
+    events.sort(key=lambda event: event[0], reverse=True)
+    return events
+
+
+def backfill_guild(guild, days, overwrite):
+    """Write rollups for the guild's past `days` days. Returns the number of rows written."""
+    today = datetime.utcnow().date()
+    since = datetime.combine(today - timedelta(days=days - 1), datetime.min.time())
+    
+    characters = Character.query.filter_by(guild_id=guild.id).all()
+    members = {
+        character.name: {'class': character.character_class, 'level': character.level, 'ilvl': character.average_item_level}
+        for character in characters
+    }
+    names = {character.id: character.name for character in characters}
+    events = history_events(guild.id, since)
+    
+    first = db.session.query(db.func.min(GuildMemberHistory.timestamp)).filter(GuildMemberHistory.guild_id == guild.id).scalar()
+    first_progression = db.session.query(db.func.min(CharacterProgressionHistory.timestamp)).filter(
+        CharacterProgressionHistory.guild_id == guild.id
+    ).scalar()
+    first = min(filter(None, (first, first_progression)), default=None)
+    if first is None:
+        print(f"  - {guild.name}: no history, skipped")
+        return 0
+    first_day = max(first.date(), since.date())
+    
+    existing = {
+        day for (day,) in db.session.query(GuildDailyRollup.day).filter(
+            GuildDailyRollup.guild_id == guild.id,
+            GuildDailyRollup.day >= first_day
+        )
+    }
+    
+    rows = []
+    undone = 0
+    day = today
+    while day >= first_day:
+        end_of_day = datetime.combine(day + timedelta(days=1), datetime.min.time())
+        # Undo everything that happened after this day
+        while undone < len(events) and events[undone][0] >= end_of_day:
+            _, kind, payload = events[undone]
+            undone += 1
+            if kind == 'added':
+                members.pop(payload.character_name, None)
+            elif kind == 'removed':
+                members[payload.character_name] = {
+                    'class': payload.character_class, 'level': payload.character_level, 'ilvl': None
+                }
+            else:
+                entry, before = payload
+                member = members.get(names.get(entry.character_id))
+                if member is not None and before is not None:
+                    member['level'] = before.character_level
+                    member['ilvl'] = before.average_item_level
+        
+        if overwrite or day not in existing:
+            rows.append(dict(summarize(members), guild_id=guild.id, day=day, updated_at=datetime.utcnow()))
+        day -= timedelta(days=1)
+    
+    if overwrite:
+        GuildDailyRollup.query.filter(
+            GuildDailyRollup.guild_id == guild.id,
+            GuildDailyRollup.day >= first_day
+        ).delete(synchronize_session=False)
+    if rows:
+        db.session.execute(db.insert(GuildDailyRollup), rows)
+    db.session.commit()
+    print(f"  - {guild.name}: {len(rows)} daily rollups written ({first_day} to {today})")
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build daily guild rollups from the history tables')
+    parser.add_argument('--guild-id', type=int, help='Only backfill this guild')
+    parser.add_argument('--days', type=int, default=365, help='How many days back to backfill (including today)')
+    parser.add_argument('--overwrite', action='store_true', help='Replace rollups that already exist')
+    args = parser.parse_args()
+    
+    app = create_app()
+    with app.app_context():
+        query = Guild.query.order_by(Guild.id)
+        if args.guild_id is not None:
+            query = query.filter(Guild.id == args.guild_id)
+        
+        print("Backfilling daily guild rollups...")
+        total = sum(backfill_guild(guild, args.days, args.overwrite) for guild in query.all())
+        print(f"\n✅ {total} rollups written")
+
+
+if __name__ == '__main__':
+    main()
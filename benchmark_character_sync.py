@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark: character detail sync wall-clock time versus concurrency.
+
+Syncs a synthetic guild from the local mock Battle.net server (with simulated
+network latency), then runs the character detail sync at several concurrency
+levels and reports how long each run takes.
+
+Endpoint TTLs, conditional requests and the rate limiter are disabled, so every
+run makes the same API calls and the speedup measures parallelism only; the benchmark fails if the
+request counts of the runs differ.
+
+Usage:
+    python benchmark_character_sync.py --members 300 --latency 0.02 --levels 1,2,4,8,16
+"""
+import argparse
+import sys
+import time
+from mock_bnet_server import MockBattleNetServer, generate_guild, make_app_config
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Character detail sync time versus concurrency')
+    parser.add_argument('--members', type=int, default=300, help='Size of the synthetic guild')
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds of latency per API response')
+    parser.add_argument('--levels', default='1,2,4,8,16', help='Comma-separated concurrency levels to test')
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(',')]
+
+    from app import create_app
+    from app.bnet_api import BattleNetAPI
+    from app.services import GuildService
+
+    server = MockBattleNetServer(generate_guild(args.members), latency=args.latency).start()
+    # Every run must fetch every endpoint: no freshness TTLs, no 304s from stored validators
+    app = create_app(make_app_config(
+        server.url,
+        API_POOL_MAXSIZE=max(levels),
+        API_CONDITIONAL_REQUESTS=False,
+        API_RATE_LIMIT_ENABLED=False,  # The quota would cap every level at the same rate
+        ENDPOINT_TTL_PROFILE_HOURS=0,
+        ENDPOINT_TTL_SPECIALIZATIONS_HOURS=0,
+        ENDPOINT_TTL_MEDIA_HOURS=0,
+        ENDPOINT_TTL_PVP_HOURS=0,
+    ))
+    realm_slug = server.guild['realm']['slug']
+    guild_slug = server.guild['name'].lower().replace(' ', '-')
+
+    try:
+        with app.app_context():
+            guild, _, _, _ = GuildService().sync_guild_roster(realm_slug, guild_slug)
+
+            print("=" * 66)
+            print(f"Character detail sync: {args.members} members, {args.latency * 1000:.0f} ms latency per call")
+            print("=" * 66)
+            print(f"{'Concurrency':>12} {'Requests':>10} {'Seconds':>10} {'Chars/sec':>12} {'Speedup':>10}")
+            print("-" * 66)
+
+            baseline = None
+            request_counts = set()
+            for level in levels:
+                server.reset_stats()
+                started = time.perf_counter()
+                result = GuildService().sync_character_details(guild.id, concurrency=level)
+                elapsed = time.perf_counter() - started
+                baseline = baseline or elapsed
+                request_counts.add(server.requests)
+                print(f"{level:>12} {server.requests:>10} {elapsed:>10.2f} "
+                      f"{result['total'] / elapsed:>12.1f} {baseline / elapsed:>9.1f}x")
+            print("=" * 66)
+            BattleNetAPI.close_session()
+    finally:
+        server.stop()
+
+    if len(request_counts) > 1:
+        print(f"❌ Runs made different numbers of requests ({sorted(request_counts)}); the speedup is not comparable")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
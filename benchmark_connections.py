@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark: connection setups per guild sync.
+
+Runs a full roster sync followed by a character detail sync against the local
+mock Battle.net server and reports how many TCP connections were opened for the
+HTTP requests made, with keep-alive pooling enabled and disabled.
+
+Usage:
+    python benchmark_connections.py --members 900
+"""
+import argparse
+import time
+from mock_bnet_server import MockBattleNetServer, generate_guild, make_app_config
+
+
+def run_sync(server, keepalive):
+    from app import create_app
+    from app.bnet_api import BattleNetAPI
+    from app.services import GuildService
+
+    app = create_app(make_app_config(server.url, API_KEEPALIVE=keepalive))
+    realm_slug = server.guild['realm']['slug']
+    guild_slug = server.guild['name'].lower().replace(' ', '-')
+
+    with app.app_context():
+        BattleNetAPI.close_session()
+        server.reset_stats()
+        started = time.perf_counter()
+
+        service = GuildService()
+        guild, member_count, _, _ = service.sync_guild_roster(realm_slug, guild_slug)
+        service.sync_character_details(guild.id)
+
+        elapsed = time.perf_counter() - started
+        BattleNetAPI.close_session()
+
+    return {
+        'members': member_count,
+        'requests': server.requests,
+        'connections': server.connections,
+        'seconds': elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Count connection setups per guild sync')
+    parser.add_argument('--members', type=int, default=900, help='Size of the synthetic guild')
+    args = parser.parse_args()
+
+    server = MockBattleNetServer(generate_guild(args.members)).start()
+    try:
+        print("=" * 70)
+        print(f"Connection setups per guild sync ({args.members} members)")
+        print("=" * 70)
+        print(f"{'Mode':<22} {'Requests':>10} {'Connections':>12} {'Req/Conn':>10} {'Seconds':>10}")
+        print("-" * 70)
+        for label, keepalive in (('No keep-alive', False), ('Pooled keep-alive', True)):
+            result = run_sync(server, keepalive)
+            ratio = result['requests'] / result['connections'] if result['connections'] else 0
+            print(f"{label:<22} {result['requests']:>10} {result['connections']:>12} "
+                  f"{ratio:>10.1f} {result['seconds']:>10.2f}")
+        print("=" * 70)
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
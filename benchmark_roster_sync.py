@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark: database time of a guild roster sync.
+
+Syncs a synthetic guild from the local mock Battle.net server into an in-memory
+database with the per-member ORM writes and with ROSTER_BULK_UPSERT, and reports
+the time spent executing SQL for an initial sync and for a re-sync where every
+member's level and rank changed.
+
+Usage:
+    python benchmark_roster_sync.py --members 1000
+"""
+import argparse
+import time
+from sqlalchemy import event
+from mock_bnet_server import MockBattleNetServer, generate_guild, make_app_config
+
+
+class SQLTimer:
+    """Accumulates statement count and SQL execution time on an engine while active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = 0
+        self.seconds = 0.0
+        self.started = []
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        self.started.append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        self.seconds += time.perf_counter() - self.started.pop()
+        self.statements += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before)
+        event.listen(self.engine, 'after_cursor_execute', self._after)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._before)
+        event.remove(self.engine, 'after_cursor_execute', self._after)
+
+
+def run_sync(member_count, bulk_upsert):
+    from app import create_app, db
+    from app.services import GuildService
+
+    server = MockBattleNetServer(generate_guild(member_count)).start()
+    results = []
+    try:
+        app = create_app(make_app_config(server.url, ROSTER_BULK_UPSERT=bulk_upsert))
+        realm_slug = server.guild['realm']['slug']
+        guild_slug = server.guild['name'].lower().replace(' ', '-')
+
+        with app.app_context():
+            service = GuildService()
+            for label in ('Initial sync', 'Re-sync (all changed)'):
+                with SQLTimer(db.engine) as timer:
+                    started = time.perf_counter()
+                    service.sync_guild_roster(realm_slug, guild_slug)
+                    elapsed = time.perf_counter() - started
+                results.append((label, timer.statements, timer.seconds, elapsed))
+
+                for member in server.guild['members']:
+                    member['level'] = member['level'] % 60 + 1
+                    member['rank'] = (member['rank'] + 1) % 10
+                server.roster_cache = None
+    finally:
+        server.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure database time of a roster sync')
+    parser.add_argument('--members', type=int, default=1000, help='Size of the synthetic guild')
+    args = parser.parse_args()
+
+    print("=" * 78)
+    print(f"Roster sync database time ({args.members} members)")
+    print("=" * 78)
+    print(f"{'Mode':<14} {'Phase':<24} {'Statements':>11} {'DB seconds':>12} {'Total seconds':>14}")
+    print("-" * 78)
+    for label, bulk_upsert in (('ORM', False), ('Bulk upsert', True)):
+        for phase, statements, db_seconds, total in run_sync(args.members, bulk_upsert):
+            print(f"{label:<14} {phase:<24} {statements:>11} {db_seconds:>12.3f} {total:>14.3f}")
+    print("=" * 78)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Consistency check for the incremental guild analytics counters.
+
+The syncs keep GuildAnalyticsCounter rows current by applying the changes of the
+characters they add, change or remove. This script compares every guild's stored
+counters with a full recount (the GROUP BY queries in app/analytics.py) and lists
+the buckets that differ. With --fix, drifted guilds get their counters rebuilt and
+their data_version bumped, so analytics snapshots and cached pages are rebuilt too.
+
+Usage:
+    python check_analytics_counters.py                # Check all guilds
+    python check_analytics_counters.py --guild-id 3
+    python check_analytics_counters.py --fix          # Rebuild drifted counters
+"""
+
+import argparse
+import sys
+from app import create_app, db
+from app.models import Guild
+from app.services import GuildService
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare guild analytics counters with a full recount')
+    parser.add_argument('--guild-id', type=int, help='Only check this guild')
+    parser.add_argument('--fix', action='store_true', help='Rebuild the counters of guilds that drifted')
+    args = parser.parse_args()
+    
+    app = create_app()
+    with app.app_context():
+        service = GuildService()
+        query = Guild.query.order_by(Guild.id)
+        if args.guild_id is not None:
+            query = query.filter(Guild.id == args.guild_id)
+        
+        drifted = 0
+        for guild in query.all():
+            mismatches = service.check_analytics_counters(guild)
+            if mismatches is None:
+                print(f"ℹ️  {guild.name}: counters not built yet (built by the next sync)")
+                continue
+            if not mismatches:
+                print(f"✓ {guild.name}: counters consistent")
+                continue
+            
+            drifted += 1
+            print(f"✗ {guild.name}: {len(mismatches)} counters differ")
+            for mismatch in mismatches:
+                print(f"  - {mismatch['dimension']}[{mismatch['bucket']}]: stored {mismatch['stored']}, actual {mismatch['actual']}")
+            if args.fix:
+                service.repair_analytics_counters(guild)
+                db.session.commit()
+                print(f"  → Counters rebuilt")
+        
+        print(f"\n{drifted} guild(s) with drifted counters" + (" (fixed)" if args.fix and drifted else ""))
+        return drifted == 0 or args.fix
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -43,6 +43,22 @@ class Config:
     BNET_CLIENT_ID = os.environ.get('BNET_CLIENT_ID')
     BNET_CLIENT_SECRET = os.environ.get('BNET_CLIENT_SECRET')
     BNET_REGION = os.environ.get('BNET_REGION', 'us')  # us, eu, kr, tw, cn
+    # Optional endpoint overrides (e.g. http://127.0.0.1:8099 for the local mock server)
+    BNET_OAUTH_URL = os.environ.get('BNET_OAUTH_URL')
+    BNET_API_BASE_URL = os.environ.get('BNET_API_BASE_URL')
+    
+    # OAuth token cache: 'redis' shares tokens across gunicorn/Celery processes, 'local' keeps them per process
+    BNET_TOKEN_CACHE = os.environ.get('BNET_TOKEN_CACHE', 'redis').lower()
+    BNET_TOKEN_REFRESH_MARGIN = int(os.environ.get('BNET_TOKEN_REFRESH_MARGIN', '600'))  # Refresh in background this many seconds before expiry
+    
+    # Redis (shared with the Celery broker) for cross-process coordination
+    REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', '1.0'))
+    
+    # Guild page cache (app/cache.py), keyed by guild data_version so syncs invalidate it exactly
+    CACHE_ENABLED = os.environ.get('CACHE_ENABLED', 'true').lower() == 'true'
+    CACHE_TTL_SECONDS = int(os.environ.get('CACHE_TTL_SECONDS', '86400'))  # Only evicts versions no longer read
+    CACHE_LOCAL_MAX_ENTRIES = int(os.environ.get('CACHE_LOCAL_MAX_ENTRIES', '256'))  # In-process fallback without Redis
     
     # Azure OpenAI / AI Foundry Configuration
     AZURE_OPENAI_ENDPOINT = os.environ.get('AZURE_OPENAI_ENDPOINT')
@@ -58,3 +74,47 @@ class Config:
     # API Retry configuration
     API_MAX_RETRIES = int(os.environ.get('API_MAX_RETRIES', '3'))  # Max retries for failed API calls
     API_RETRY_DELAY = float(os.environ.get('API_RETRY_DELAY', '1.0'))  # Initial delay in seconds (exponential backoff)
+    API_RETRY_MAX_DELAY = float(os.environ.get('API_RETRY_MAX_DELAY', '30'))  # Cap on the jittered backoff delay
+    API_RETRY_AFTER_MAX = float(os.environ.get('API_RETRY_AFTER_MAX', '120'))  # Give up instead of honouring a longer Retry-After
+    
+    # API rate limiting (token buckets shared by all processes through Redis)
+    # Blizzard allows 100 requests/second and 36,000 requests/hour per client
+    API_RATE_LIMIT_ENABLED = os.environ.get('API_RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    API_RATE_LIMIT_PROFILE_PER_SECOND = float(os.environ.get('API_RATE_LIMIT_PROFILE_PER_SECOND', '80'))  # /profile/... namespace
+    API_RATE_LIMIT_PROFILE_PER_HOUR = float(os.environ.get('API_RATE_LIMIT_PROFILE_PER_HOUR', '30000'))
+    API_RATE_LIMIT_DATA_PER_SECOND = float(os.environ.get('API_RATE_LIMIT_DATA_PER_SECOND', '20'))  # /data/... namespace
+    API_RATE_LIMIT_DATA_PER_HOUR = float(os.environ.get('API_RATE_LIMIT_DATA_PER_HOUR', '6000'))
+    API_RATE_LIMIT_MAX_WAIT = float(os.environ.get('API_RATE_LIMIT_MAX_WAIT', '120'))  # Give up on a call after waiting this long
+    
+    # Character detail sync
+    CHARACTER_SYNC_CONCURRENCY = int(os.environ.get('CHARACTER_SYNC_CONCURRENCY', '4'))  # Characters fetched in parallel (1 = sequential)
+    API_CONDITIONAL_REQUESTS = os.environ.get('API_CONDITIONAL_REQUESTS', 'true').lower() == 'true'  # Send ETag/If-Modified-Since validators
+    ROSTER_BULK_UPSERT = os.environ.get('ROSTER_BULK_UPSERT', 'false').lower() == 'true'  # INSERT ... ON CONFLICT roster writes (PostgreSQL/SQLite, needs migrate_add_bnet_id_unique.py)
+    CHARACTER_SYNC_CHECKPOINT_MAX_AGE_HOURS = int(os.environ.get('CHARACTER_SYNC_CHECKPOINT_MAX_AGE_HOURS', '24'))  # Re-runs resume unfinished syncs younger than this
+    CHARACTER_SYNC_MAX_CONTINUATIONS = int(os.environ.get('CHARACTER_SYNC_MAX_CONTINUATIONS', '10'))  # Follow-up runs after hitting the task time limit
+    CHARACTER_SYNC_SHARD_SIZE = int(os.environ.get('CHARACTER_SYNC_SHARD_SIZE', '0'))  # Characters per parallel subtask for large guilds (0 = one task per guild)
+    CHARACTER_RETRY_MAX_ATTEMPTS = int(os.environ.get('CHARACTER_RETRY_MAX_ATTEMPTS', '5'))  # Retries of a failed character before giving up (0 = no retry queue)
+    CHARACTER_RETRY_BASE_DELAY = int(os.environ.get('CHARACTER_RETRY_BASE_DELAY', '300'))  # Seconds before the first retry; doubles with every attempt
+    CHARACTER_RETRY_BATCH_SIZE = int(os.environ.get('CHARACTER_RETRY_BATCH_SIZE', '200'))  # Characters re-fetched per retry_failed_characters run
+    CHARACTER_REFRESH_POLICY = os.environ.get('CHARACTER_REFRESH_POLICY', 'delta')  # Detail sync after a roster sync: 'delta' (new/level/rank changed), 'priority' (delta + due) or 'all'
+    CHARACTER_REFRESH_BUDGET = int(os.environ.get('CHARACTER_REFRESH_BUDGET', '500'))  # Characters refreshed per hourly refresh_characters_scheduled run
+    CHARACTER_REFRESH_ACTIVE_HOURS = float(os.environ.get('CHARACTER_REFRESH_ACTIVE_HOURS', '6'))  # Refresh interval, logged in within a day
+    CHARACTER_REFRESH_RECENT_HOURS = float(os.environ.get('CHARACTER_REFRESH_RECENT_HOURS', '24'))  # Refresh interval, logged in within a week
+    CHARACTER_REFRESH_INACTIVE_HOURS = float(os.environ.get('CHARACTER_REFRESH_INACTIVE_HOURS', '168'))  # Refresh interval, inactive alts
+    CHARACTER_REFRESH_MAX_LEVEL = int(os.environ.get('CHARACTER_REFRESH_MAX_LEVEL', '60'))  # Max-level characters are refreshed twice as often
+    UNINDEXED_CHARACTER_TTL_HOURS = int(os.environ.get('UNINDEXED_CHARACTER_TTL_HOURS', '72'))  # Skip characters that returned 404 for this long (0 = disabled)
+    
+    # Per-endpoint freshness: skip endpoints fetched within their TTL (0 = fetch every sync)
+    ENDPOINT_TTL_PROFILE_HOURS = float(os.environ.get('ENDPOINT_TTL_PROFILE_HOURS', '0'))  # Level, item level, last login
+    ENDPOINT_TTL_SPECIALIZATIONS_HOURS = float(os.environ.get('ENDPOINT_TTL_SPECIALIZATIONS_HOURS', '24'))
+    ENDPOINT_TTL_MEDIA_HOURS = float(os.environ.get('ENDPOINT_TTL_MEDIA_HOURS', '168'))  # Avatars
+    ENDPOINT_TTL_PVP_HOURS = float(os.environ.get('ENDPOINT_TTL_PVP_HOURS', '24'))
+    ENDPOINT_MIN_LEVEL_SPECIALIZATIONS = int(os.environ.get('ENDPOINT_MIN_LEVEL_SPECIALIZATIONS', '0'))  # Don't call below this level (0 = any level)
+    ENDPOINT_MIN_LEVEL_MEDIA = int(os.environ.get('ENDPOINT_MIN_LEVEL_MEDIA', '0'))
+    ENDPOINT_MIN_LEVEL_PVP = int(os.environ.get('ENDPOINT_MIN_LEVEL_PVP', '10'))
+    
+    # API HTTP connection pooling (one keep-alive session shared per process)
+    API_POOL_CONNECTIONS = int(os.environ.get('API_POOL_CONNECTIONS', '4'))  # Number of hosts to keep connection pools for
+    API_POOL_MAXSIZE = int(os.environ.get('API_POOL_MAXSIZE', '10'))  # Keep-alive connections kept open per host
+    API_KEEPALIVE = os.environ.get('API_KEEPALIVE', 'true').lower() == 'true'  # Reuse connections between requests
+    API_REQUEST_TIMEOUT = float(os.environ.get('API_REQUEST_TIMEOUT', '30'))  # Seconds before an API request times out
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Migration script to add incremental guild analytics counters.
+
+This adds:
+- guild_analytics_counter table: Per-guild class, race, level, spec, level 60
+  class/spec and item level counters, updated by the syncs from the characters
+  they add, change or remove
+- guild.counters_rebuilt_at (DATETIME): Time of the last full recount; guilds
+  without one are recounted by their next sync and maintained incrementally after
+
+Pass --build to count every guild now instead of at its next sync.
+"""
+
+import sys
+from app import create_app, db
+from app.models import Guild, GuildAnalyticsCounter
+
+def migrate(build=False):
+    """Add the GuildAnalyticsCounter table and the guild.counters_rebuilt_at column."""
+    app = create_app()
+    
+    with app.app_context():
+        print("Starting migration: Adding analytics counters...")
+        
+        try:
+            db.create_all()
+            
+            inspector = db.inspect(db.engine)
+            if 'guild_analytics_counter' not in inspector.get_table_names():
+                print("✗ Error: Table was not created")
+                return False
+            print("✓ guild_analytics_counter table exists")
+            
+            existing = [col['name'] for col in inspector.get_columns('guild')]
+            if 'counters_rebuilt_at' in existing:
+                print("ℹ️  guild.counters_rebuilt_at already exists")
+            else:
+                with db.engine.begin() as conn:
+                    conn.execute(db.text('ALTER TABLE "guild" ADD COLUMN counters_rebuilt_at TIMESTAMP'))
+                print("✓ Added guild.counters_rebuilt_at")
+            
+            if build:
+                from app.services import GuildService
+                service = GuildService()
+                for guild in Guild.query.all():
+                    service.repair_analytics_counters(guild)
+                    db.session.commit()
+                    print(f"✓ Counted {guild.name}")
+            
+            print("\nMigration complete!")
+            print("\nNext steps:")
+            print("1. Restart the web app, the Celery workers and Celery Beat")
+            print("2. Check the counters any time with python check_analytics_counters.py")
+                
+        except Exception as e:
+            print(f"✗ Migration failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        
+        return True
+
+if __name__ == '__main__':
+    success = migrate(build='--build' in sys.argv[1:])
+    exit(0 if success else 1)
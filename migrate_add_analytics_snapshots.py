@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Migration script to add stored analytics snapshots.
+
+This adds:
+- guild_analytics_snapshot table: The guild's analytics as JSON, written by the
+  syncs in the transaction that changes the guild's data
+- guild.data_version (INTEGER): Bumped by every sync commit that changes the guild;
+  a snapshot with an older data_version is stale and rebuilt on the next read
+
+Existing guilds start at data_version 0 without a snapshot; the first analytics
+page view (or sync) of each guild stores one.
+"""
+
+from app import create_app, db
+from app.models import GuildAnalyticsSnapshot
+
+def migrate():
+    """Add the GuildAnalyticsSnapshot table and the guild.data_version column."""
+    app = create_app()
+    
+    with app.app_context():
+        print("Starting migration: Adding analytics snapshots...")
+        
+        try:
+            db.create_all()
+            
+            inspector = db.inspect(db.engine)
+            if 'guild_analytics_snapshot' not in inspector.get_table_names():
+                print("✗ Error: Table was not created")
+                return False
+            print("✓ guild_analytics_snapshot table exists")
+            
+            existing = [col['name'] for col in inspector.get_columns('guild')]
+            if 'data_version' in existing:
+                print("ℹ️  guild.data_version already exists")
+            else:
+                with db.engine.begin() as conn:
+                    conn.execute(db.text('ALTER TABLE "guild" ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0'))
+                print("✓ Added guild.data_version")
+            
+            print("\nMigration complete!")
+            print("\nNext steps:")
+            print("1. Restart the web app and the Celery workers")
+            print("2. Analytics pages now read the stored snapshot instead of aggregating on every view")
+                
+        except Exception as e:
+            print(f"✗ Migration failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        
+        return True
+
+if __name__ == '__main__':
+    success = migrate()
+    exit(0 if success else 1)
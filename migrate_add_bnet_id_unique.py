@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Migration script to make character.bnet_id unique.
+The bulk roster upsert (ROSTER_BULK_UPSERT) uses INSERT ... ON CONFLICT (bnet_id),
+which needs a unique index. Duplicate Battle.net IDs are cleared on all but the
+most recently updated row first; the next roster sync matches those rows by name.
+"""
+
+from app import create_app, db
+from app.models import Character
+
+INDEX_NAME = 'ix_character_bnet_id'
+
+def migrate():
+    """Replace the non-unique bnet_id index with a unique one."""
+    app = create_app()
+    
+    with app.app_context():
+        print("Starting migration: Making character.bnet_id unique...")
+        
+        try:
+            inspector = db.inspect(db.engine)
+            indexes = {idx['name']: idx for idx in inspector.get_indexes('character')}
+            if INDEX_NAME in indexes and indexes[INDEX_NAME].get('unique'):
+                print("ℹ️  bnet_id index is already unique")
+                return True
+            
+            # Clear duplicate Battle.net IDs, keeping the most recently updated row
+            duplicates = db.session.query(Character.bnet_id).filter(
+                Character.bnet_id.isnot(None)
+            ).group_by(Character.bnet_id).having(db.func.count(Character.id) > 1).all()
+            cleared = 0
+            for (bnet_id,) in duplicates:
+                rows = db.session.query(Character.id, Character.name).filter(
+                    Character.bnet_id == bnet_id
+                ).order_by(Character.last_updated.desc(), Character.id.desc()).all()
+                for row_id, name in rows[1:]:
+                    print(f"  - Clearing duplicate bnet_id {bnet_id} on '{name}' (id {row_id})")
+                    db.session.execute(db.update(Character).where(Character.id == row_id).values(bnet_id=None))
+                    cleared += 1
+            db.session.commit()
+            print(f"✓ Duplicate Battle.net IDs cleared: {cleared}")
+            
+            with db.engine.begin() as conn:
+                if INDEX_NAME in indexes:
+                    conn.execute(db.text(f'DROP INDEX {INDEX_NAME}'))
+                conn.execute(db.text(f'CREATE UNIQUE INDEX {INDEX_NAME} ON "character" (bnet_id)'))
+            
+            inspector = db.inspect(db.engine)
+            indexes = {idx['name']: idx for idx in inspector.get_indexes('character')}
+            if indexes.get(INDEX_NAME, {}).get('unique'):
+                print(f"✓ {INDEX_NAME} is unique")
+                print("\nMigration complete!")
+                print("\nNext steps:")
+                print("1. Set ROSTER_BULK_UPSERT=true to write rosters with INSERT ... ON CONFLICT")
+            else:
+                print("✗ Error: Unique index was not created")
+                return False
+                
+        except Exception as e:
+            print(f"✗ Migration failed: {e}")
+            db.session.rollback()
+            import traceback
+            traceback.print_exc()
+            return False
+        
+        return True
+
+if __name__ == '__main__':
+    success = migrate()
+    exit(0 if success else 1)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the CharacterSyncRetry table.
+Queues characters whose detail fetch failed so the retry_failed_characters
+periodic task re-fetches just those characters, with exponential backoff.
+"""
+
+from app import create_app, db
+from app.models import CharacterSyncRetry
+
+def migrate():
+    """Add CharacterSyncRetry table to the database."""
+    app = create_app()
+    
+    with app.app_context():
+        print("Starting migration: Adding CharacterSyncRetry table...")
+        
+        try:
+            db.create_all()
+            
+            inspector = db.inspect(db.engine)
+            if 'character_sync_retry' in inspector.get_table_names():
+                print("✓ character_sync_retry table exists")
+                
+                print("\nTable structure:")
+                for col in inspector.get_columns('character_sync_retry'):
+                    print(f"  - {col['name']}: {col['type']}")
+                
+                print("\nMigration complete!")
+                print("\nNext steps:")
+                print("1. Restart the Celery workers and Celery Beat")
+                print("2. Failed characters are now re-fetched every 5 minutes instead of retrying the whole guild")
+            else:
+                print("✗ Error: Table was not created")
+                return False
+                
+        except Exception as e:
+            print(f"✗ Migration failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        
+        return True
+
+if __name__ == '__main__':
+    success = migrate()
+    exit(0 if success else 1)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Migration script to add character_endpoint_state.checked_at.
+
+Records when each Battle.net endpoint was last fetched for a character, so detail
+syncs skip endpoints whose data is younger than their ENDPOINT_TTL_*_HOURS.
+Existing rows start empty, so every endpoint is fetched once more.
+"""
+
+from app import create_app, db
+
+COLUMNS = [
+    ('character_endpoint_state', 'checked_at', 'TIMESTAMP'),
+]
+
+def migrate():
+    """Add checked_at to the character_endpoint_state table."""
+    app = create_app()
+    
+    with app.app_context():
+        print("Starting migration: Adding endpoint fetch times...")
+        
+        try:
+            inspector = db.inspect(db.engine)
+            with db.engine.begin() as conn:
+                for table, column, column_type in COLUMNS:
+                    existing = [col['name'] for col in inspector.get_columns(table)]
+                    if column in existing:
+                        print(f"ℹ️  {table}.{column} already exists")
+                        continue
+                    conn.execute(db.text(f'ALTER TABLE "{table}" ADD COLUMN {column} {column_type}'))
+                    print(f"✓ Added {table}.{column}")
+            
+            print("\nMigration complete!")
+            print("\nNext steps:")
+            print("1. Restart the Celery workers")
+            print("2. Adjust ENDPOINT_TTL_*_HOURS / ENDPOINT_MIN_LEVEL_* in .env if needed")
+                
+        except Exception as e:
+            print(f"✗ Migration failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        
+        return True
+
+if __name__ == '__main__':
+    success = migrate()
+    exit(0 if success else 1)
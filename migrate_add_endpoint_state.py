@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the CharacterEndpointState table.
+Stores ETag/Last-Modified validators per character and profile endpoint so the
+character detail sync can send conditional requests and skip unchanged characters.
+"""
+
+from app import create_app, db
+from app.models import CharacterEndpointState
+
+def migrate():
+    """Add CharacterEndpointState table to the database."""
+    app = create_app()
+    
+    with app.app_context():
+        print("Starting migration: Adding CharacterEndpointState table...")
+        
+        try:
+            db.create_all()
+            
+            inspector = db.inspect(db.engine)
+            if 'character_endpoint_state' in inspector.get_table_names():
+                print("✓ character_endpoint_state table exists")
+                
+                print("\nTable structure:")
+                for col in inspector.get_columns('character_endpoint_state'):
+                    print(f"  - {col['name']}: {col['type']}")
+                
+                print("\nMigration complete!")
+                print("\nNext steps:")
+                print("1. Run a character sync to record validators")
+                print("2. Later syncs send If-None-Match / If-Modified-Since and skip unchanged characters")
+            else:
+                print("✗ Error: Table was not created")
+                return False
+                
+        except Exception as e:
+            print(f"✗ Migration failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        
+        return True
+
+if __name__ == '__main__':
+    success = migrate()
+    exit(0 if success else 1)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the GuildDailyRollup table.
+One row of guild metrics per guild per day, written by the roster and character
+detail syncs and read by the trends API (/api/guild/<id>/trends).
+Run backfill_guild_rollups.py afterwards to build rollups for past days.
+"""
+
+from app import create_app, db
+from app.models import GuildDailyRollup
+
+def migrate():
+    """Add GuildDailyRollup table to the database."""
+    app = create_app()
+    
+    with app.app_context():
+        print("Starting migration: Adding GuildDailyRollup table...")
+        
+        try:
+            db.create_all()
+            
+            inspector = db.inspect(db.engine)
+            if 'guild_daily_rollup' in inspector.get_table_names():
+                print("✓ guild_daily_rollup table exists")
+                
+                print("\nTable structure:")
+                for col in inspector.get_columns('guild_daily_rollup'):
+                    print(f"  - {col['name']}: {col['type']}")
+                
+                print("\nMigration complete!")
+                print("\nNext steps:")
+                print("1. Restart the web app and the Celery workers")
+                print("2. Run python backfill_guild_rollups.py to build rollups from the existing history")
+            else:
+                print("✗ Error: Table was not created")
+                return False
+                
+        except Exception as e:
+            print(f"✗ Migration failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        
+        return True
+
+if __name__ == '__main__':
+    success = migrate()
+    exit(0 if success else 1)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the profile digest column.
+
+This adds:
+- character.profile_digest (VARCHAR(40)): Digest of the profile fields written by
+  the last character detail sync; characters whose fetched data matches it are
+  not updated
+
+The column starts empty, so the first detail sync after this migration writes
+every character once.
+"""
+
+from app import create_app, db
+
+COLUMNS = [
+    ('character', 'profile_digest', 'VARCHAR(40)'),
+]
+
+def migrate():
+    """Add the profile_digest column to the character table."""
+    app = create_app()
+    
+    with app.app_context():
+        print("Starting migration: Adding profile digest column...")
+        
+        try:
+            inspector = db.inspect(db.engine)
+            with db.engine.begin() as conn:
+                for table, column, column_type in COLUMNS:
+                    existing = [col['name'] for col in inspector.get_columns(table)]
+                    if column in existing:
+                        print(f"ℹ️  {table}.{column} already exists")
+                        continue
+                    conn.execute(db.text(f'ALTER TABLE "{table}" ADD COLUMN {column} {column_type}'))
+                    print(f"✓ Added {table}.{column}")
+            
+            print("\nMigration complete!")
+            print("\nNext steps:")
+            print("1. Run a character detail sync to store digests")
+            print("2. Later syncs skip the UPDATE for characters whose data did not change")
+                
+        except Exception as e:
+            print(f"✗ Migration failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        
+        return True
+
+if __name__ == '__main__':
+    success = migrate()
+    exit(0 if success else 1)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Migration script to add a composite (character_id, guild_id, timestamp) index on
+character_progression_history.
+Roster syncs look up the latest progression entry of every guild member in one
+query; this index keeps that lookup fast as history grows.
+"""
+
+from app import create_app, db
+from app.models import CharacterProgressionHistory
+
+INDEX_NAME = 'ix_progression_character_guild_timestamp'
+
+def migrate():
+    """Add the composite progression index to the database."""
+    app = create_app()
+    
+    with app.app_context():
+        print(f"Starting migration: Adding {INDEX_NAME} index...")
+        
+        try:
+            index = next(i for i in CharacterProgressionHistory.__table__.indexes if i.name == INDEX_NAME)
+            index.create(bind=db.engine, checkfirst=True)
+            
+            inspector = db.inspect(db.engine)
+            indexes = {idx['name']: idx['column_names'] for idx in inspector.get_indexes('character_progression_history')}
+            if INDEX_NAME in indexes:
+                print(f"✓ {INDEX_NAME}: {indexes[INDEX_NAME]}")
+                print("\nMigration complete!")
+            else:
+                print("✗ Error: Index was not created")
+                return False
+                
+        except Exception as e:
+            print(f"✗ Migration failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        
+        return True
+
+if __name__ == '__main__':
+    success = migrate()
+    exit(0 if success else 1)
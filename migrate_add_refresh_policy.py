@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Migration script to add refresh policy columns.
+
+This adds:
+- character.details_checked_at (TIMESTAMP): Last successful detail fetch, whether
+  or not anything changed; the refresh policy measures staleness from it
+- character.checked_level (INTEGER): Roster level at that fetch; a character whose
+  roster level differs is refreshed first
+
+Both start empty, so every character counts as due until its next detail fetch.
+An index on details_checked_at created by earlier versions of this script is
+dropped: nothing queries it, and it would make every stamp rewrite an index entry.
+"""
+
+from app import create_app, db
+
+COLUMNS = [
+    ('character', 'details_checked_at', 'TIMESTAMP'),
+    ('character', 'checked_level', 'INTEGER'),
+]
+
+INDEX_NAME = 'ix_character_details_checked_at'
+
+def migrate():
+    """Add refresh policy columns to the character table."""
+    app = create_app()
+    
+    with app.app_context():
+        print("Starting migration: Adding refresh policy columns...")
+        
+        try:
+            inspector = db.inspect(db.engine)
+            with db.engine.begin() as conn:
+                for table, column, column_type in COLUMNS:
+                    existing = [col['name'] for col in inspector.get_columns(table)]
+                    if column in existing:
+                        print(f"ℹ️  {table}.{column} already exists")
+                        continue
+                    conn.execute(db.text(f'ALTER TABLE "{table}" ADD COLUMN {column} {column_type}'))
+                    print(f"✓ Added {table}.{column}")
+            
+            with db.engine.begin() as conn:
+                conn.execute(db.text(f'DROP INDEX IF EXISTS {INDEX_NAME}'))
+            print(f"✓ {INDEX_NAME} not present")
+            
+            print("\nMigration complete!")
+            print("\nNext steps:")
+            print("1. Restart the Celery workers and Celery Beat")
+            print("2. The hourly refresh task fetches every character once, then only the ones that are due")
+                
+        except Exception as e:
+            print(f"✗ Migration failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        
+        return True
+
+if __name__ == '__main__':
+    success = migrate()
+    exit(0 if success else 1)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Migration script to add roster fingerprint columns.
+
+This adds:
+- guild.roster_hash (VARCHAR(64)): Hash of the last synced roster; an identical
+  roster skips all member processing
+- character.roster_hash (VARCHAR(40)): Hash of the member's roster fields; only
+  members whose hash changed are written
+
+Both start empty, so the first roster sync after this migration writes every member.
+"""
+
+from app import create_app, db
+
+COLUMNS = [
+    ('guild', 'roster_hash', 'VARCHAR(64)'),
+    ('character', 'roster_hash', 'VARCHAR(40)'),
+]
+
+def migrate():
+    """Add roster_hash columns to the guild and character tables."""
+    app = create_app()
+    
+    with app.app_context():
+        print("Starting migration: Adding roster fingerprint columns...")
+        
+        try:
+            inspector = db.inspect(db.engine)
+            with db.engine.begin() as conn:
+                for table, column, column_type in COLUMNS:
+                    existing = [col['name'] for col in inspector.get_columns(table)]
+                    if column in existing:
+                        print(f"ℹ️  {table}.{column} already exists")
+                        continue
+                    conn.execute(db.text(f'ALTER TABLE "{table}" ADD COLUMN {column} {column_type}'))
+                    print(f"✓ Added {table}.{column}")
+            
+            print("\nMigration complete!")
+            print("\nNext steps:")
+            print("1. The next roster sync stores fingerprints for every guild")
+            print("2. Later syncs of an unchanged roster only touch guild.last_updated")
+                
+        except Exception as e:
+            print(f"✗ Migration failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        
+        return True
+
+if __name__ == '__main__':
+    success = migrate()
+    exit(0 if success else 1)
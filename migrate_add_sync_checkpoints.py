@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the SyncCheckpoint table.
+Stores the progress of each character detail sync so retries, re-runs and runs
+that hit the task time limit resume where the previous run stopped.
+"""
+
+from app import create_app, db
+from app.models import SyncCheckpoint
+
+def migrate():
+    """Add SyncCheckpoint table to the database."""
+    app = create_app()
+    
+    with app.app_context():
+        print("Starting migration: Adding SyncCheckpoint table...")
+        
+        try:
+            db.create_all()
+            
+            inspector = db.inspect(db.engine)
+            if 'sync_checkpoint' in inspector.get_table_names():
+                print("✓ sync_checkpoint table exists")
+                
+                print("\nTable structure:")
+                for col in inspector.get_columns('sync_checkpoint'):
+                    print(f"  - {col['name']}: {col['type']}")
+                
+                print("\nMigration complete!")
+                print("\nNext steps:")
+                print("1. Restart the Celery workers")
+                print("2. Interrupted character syncs now resume from their last committed batch")
+            else:
+                print("✗ Error: Table was not created")
+                return False
+                
+        except Exception as e:
+            print(f"✗ Migration failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        
+        return True
+
+if __name__ == '__main__':
+    success = migrate()
+    exit(0 if success else 1)
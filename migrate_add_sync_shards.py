@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Migration script to add sharded character sync columns.
+
+This adds:
+- task.shards_total (INTEGER): Number of shard subtasks of a sharded character sync
+- task.shards_done (INTEGER): Shards finished so far; progress is shards_done / shards_total
+- sync_checkpoint.shard (INTEGER): Shard index, so each shard resumes from its own checkpoint
+
+Existing rows keep NULL, which means "not sharded".
+"""
+
+from app import create_app, db
+
+COLUMNS = [
+    ('task', 'shards_total', 'INTEGER'),
+    ('task', 'shards_done', 'INTEGER DEFAULT 0'),
+    ('sync_checkpoint', 'shard', 'INTEGER'),
+]
+
+def migrate():
+    """Add shard columns to the task and sync_checkpoint tables."""
+    app = create_app()
+    
+    with app.app_context():
+        print("Starting migration: Adding sharded character sync columns...")
+        
+        try:
+            inspector = db.inspect(db.engine)
+            with db.engine.begin() as conn:
+                for table, column, column_type in COLUMNS:
+                    existing = [col['name'] for col in inspector.get_columns(table)]
+                    if column in existing:
+                        print(f"ℹ️  {table}.{column} already exists")
+                        continue
+                    conn.execute(db.text(f'ALTER TABLE "{table}" ADD COLUMN {column} {column_type}'))
+                    print(f"✓ Added {table}.{column}")
+            
+            print("\nMigration complete!")
+            print("\nNext steps:")
+            print("1. Set CHARACTER_SYNC_SHARD_SIZE (e.g. 200) in .env to enable sharded syncs")
+            print("2. Run more Celery workers - each shard runs as its own subtask")
+                
+        except Exception as e:
+            print(f"✗ Migration failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        
+        return True
+
+if __name__ == '__main__':
+    success = migrate()
+    exit(0 if success else 1)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the UnindexedCharacter table.
+Remembers characters whose profile endpoint answered 404 so the roster and
+character detail syncs stop spending API calls on them every run.
+"""
+
+from app import create_app, db
+from app.models import UnindexedCharacter
+
+def migrate():
+    """Add UnindexedCharacter table to the database."""
+    app = create_app()
+    
+    with app.app_context():
+        print("Starting migration: Adding UnindexedCharacter table...")
+        
+        try:
+            db.create_all()
+            
+            inspector = db.inspect(db.engine)
+            if 'unindexed_character' in inspector.get_table_names():
+                print("✓ unindexed_character table exists")
+                
+                print("\nTable structure:")
+                for col in inspector.get_columns('unindexed_character'):
+                    print(f"  - {col['name']}: {col['type']}")
+                
+                print("\nMigration complete!")
+                print("\nNext steps:")
+                print("1. Optionally set UNINDEXED_CHARACTER_TTL_HOURS (default 72, 0 disables)")
+                print("2. Characters answering 404 are skipped until the TTL expires or their level changes")
+            else:
+                print("✗ Error: Table was not created")
+                return False
+                
+        except Exception as e:
+            print(f"✗ Migration failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        
+        return True
+
+if __name__ == '__main__':
+    success = migrate()
+    exit(0 if success else 1)
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Battle.net API used by BattleNetAPI.
+
+Serves the OAuth, guild, roster and character endpoints from a synthetic guild
+so that GuildService can be exercised and benchmarked without credentials or
+network access. Point the app at it with:
+
+    BNET_OAUTH_URL=http://127.0.0.1:8099/oauth/token
+    BNET_API_BASE_URL=http://127.0.0.1:8099
+
+Besides the synthetic guild the server can:
+
+- Inject latency, random 503s and 429s (with Retry-After) into API responses
+- Record: proxy requests to the real API and save every response to a fixture file
+- Replay: answer requests from a previously recorded fixture file, offline
+
+Usage:
+    python mock_bnet_server.py --members 900 --port 8099
+    python mock_bnet_server.py --members 20000 --latency 0.05 --error-rate 0.02 --rate-limit-rate 0.01
+    python mock_bnet_server.py --record fixtures/my-guild.json --upstream https://us.api.blizzard.com
+    python mock_bnet_server.py --replay fixtures/my-guild.json
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, unquote, parse_qsl, urlencode
+
+CLASSES = ['Warrior', 'Paladin', 'Hunter', 'Rogue', 'Priest', 'Shaman', 'Mage', 'Warlock', 'Druid']
+RACES = ['Human', 'Dwarf', 'Night Elf', 'Gnome', 'Orc', 'Undead', 'Tauren', 'Troll']
+TALENT_TREES = {
+    'Warrior': ['Arms', 'Fury', 'Protection'],
+    'Paladin': ['Holy', 'Protection', 'Retribution'],
+    'Hunter': ['Beast Mastery', 'Marksmanship', 'Survival'],
+    'Rogue': ['Assassination', 'Combat', 'Subtlety'],
+    'Priest': ['Discipline', 'Holy', 'Shadow'],
+    'Shaman': ['Elemental', 'Enhancement', 'Restoration'],
+    'Mage': ['Arcane', 'Fire', 'Frost'],
+    'Warlock': ['Affliction', 'Demonology', 'Destruction'],
+    'Druid': ['Balance', 'Feral Combat', 'Restoration'],
+}
+
+
+def generate_guild(member_count, guild_name='Mock Guild', realm_name='Mock Realm', seed=42, unindexed_rate=0.0):
+    """
+    Build a deterministic synthetic guild with the given number of members.
+    
+    Args:
+        unindexed_rate: Fraction of members whose profile endpoints answer 404,
+            like low-level or inactive characters on the real API.
+    """
+    rng = random.Random(seed)
+    realm_slug = realm_name.lower().replace(' ', '-')
+    width = max(5, len(str(member_count - 1)))
+    members = []
+    for i in range(member_count):
+        char_class = rng.choice(CLASSES)
+        level = 60 if rng.random() < 0.4 else rng.randint(1, 59)
+        members.append({
+            'id': 100000 + i,
+            'name': f'Mock{i:0{width}d}',
+            'level': level,
+            'rank': rng.randint(0, 9),
+            'character_class': char_class,
+            'race': rng.choice(RACES),
+            'gender': rng.choice(['Male', 'Female']),
+            'average_item_level': rng.randint(40, 75) if level == 60 else level,
+            'honorable_kills': rng.randint(0, 5000) if level >= 10 else 0,
+            'pvp_rank': rng.randint(0, 14) if level == 60 else 0,
+            'spec': rng.choice(TALENT_TREES[char_class]),
+            'last_login_timestamp': 1700000000000 + rng.randint(0, 30 * 86400) * 1000,
+            'indexed': rng.random() >= unindexed_rate,
+        })
+    return {
+        'name': guild_name,
+        'realm': {'name': realm_name, 'slug': realm_slug},
+        'faction': {'name': 'Horde'},
+        'members': members,
+    }
+
+
+def make_app_config(server_url, **overrides):
+    """Build a Config subclass that points the app at a mock server and an in-memory database"""
+    from config import Config
+
+    settings = {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'SQLALCHEMY_ENGINE_OPTIONS': {},
+        'BNET_CLIENT_ID': 'mock-client',
+        'BNET_CLIENT_SECRET': 'mock-secret',
+        'BNET_OAUTH_URL': f'{server_url}/oauth/token',
+        'BNET_API_BASE_URL': server_url,
+        'BNET_TOKEN_CACHE': 'local',
+    }
+    settings.update(overrides)
+    return type('MockServerConfig', (Config,), settings)
+
+
+def load_fixtures(path):
+    """Load a fixture file written by a recording server"""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def fixture_key(method, path, query=''):
+    """Fixture lookup key; query parameters are sorted so their order does not matter"""
+    params = sorted(parse_qsl(query, keep_blank_values=True))
+    return f"{method} {path}" + (f"?{urlencode(params)}" if params else '')
+
+
+class MockBattleNetServer:
+    """
+    Threaded HTTP server that answers Battle.net API requests from a synthetic guild,
+    a recorded fixture file (replay) or the real API (record).
+    """
+
+    def __init__(self, guild=None, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=1, fixtures=None, upstream=None,
+                 upstream_oauth_url='https://oauth.battle.net/token', record_path=None, seed=None):
+        """
+        Args:
+            latency: Seconds added to every API response (simulates network round trip)
+            error_rate: Fraction of API requests answered with 503 Service Unavailable
+            rate_limit_rate: Fraction of API requests answered with 429 Too Many Requests
+            retry_after: Retry-After seconds sent with injected 429s
+            fixtures: Recorded responses to replay (see load_fixtures); replaces the synthetic guild
+            upstream: Base URL of the real API to proxy to while recording
+            record_path: File the recorded fixtures are written to (on stop() or save_fixtures())
+        """
+        self.guild = guild or generate_guild(50)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.fixtures = fixtures
+        self.upstream = upstream.rstrip('/') if upstream else None
+        self.upstream_oauth_url = upstream_oauth_url
+        self.record_path = record_path
+        self.recorded = {}
+        self.rng = random.Random(seed)
+        self.last_modified = formatdate(usegmt=True)  # Profiles report this as their Last-Modified date
+        self.characters = {m['name'].lower(): m for m in self.guild['members']}
+        self.roster_cache = None  # (member count, serialized roster) - rebuilding it for 10k+ members is slow
+        self.lock = threading.Lock()
+        self.connections = 0  # TCP connections accepted
+        self.requests = 0  # HTTP requests served
+        self.token_requests = 0
+        self.injected_errors = 0  # 503s and 429s returned by fault injection
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.record_path:
+            self.save_fixtures()
+
+    def reset_stats(self):
+        with self.lock:
+            self.connections = 0
+            self.requests = 0
+            self.token_requests = 0
+            self.injected_errors = 0
+
+    def save_fixtures(self, path=None):
+        """Write the responses recorded so far to a fixture file"""
+        with self.lock:
+            recorded = dict(self.recorded)
+        with open(path or self.record_path, 'w', encoding='utf-8') as f:
+            json.dump(recorded, f, indent=1, sort_keys=True)
+        return len(recorded)
+
+    def _inject_fault(self):
+        """Return (status, payload, headers) for an injected error, or None"""
+        if not self.error_rate and not self.rate_limit_rate:
+            return None
+        with self.lock:
+            roll = self.rng.random()
+            if roll < self.rate_limit_rate:
+                self.injected_errors += 1
+                return 429, {'code': 429, 'type': 'BLZWEBAPI00000429', 'detail': 'Too Many Requests'}, {
+                    'Retry-After': str(self.retry_after)
+                }
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.injected_errors += 1
+                return 503, {'code': 503, 'type': 'BLZWEBAPI00000503', 'detail': 'Service Unavailable'}, {}
+        return None
+
+    def _proxy(self, method, url, headers, body=None):
+        """Forward a request to the real API while recording. Returns (status, body bytes, headers)."""
+        import requests
+
+        forward = {k: v for k, v in headers.items() if k.lower() in ('authorization', 'content-type')}
+        response = requests.request(method, url, headers=forward, data=body, timeout=30)
+        keep = {k: response.headers[k] for k in ('ETag', 'Last-Modified', 'Retry-After') if k in response.headers}
+        return response.status_code, response.content, keep
+
+    def _record(self, key, status, body, headers):
+        try:
+            payload = json.loads(body) if body else None
+        except ValueError:
+            payload = body.decode('utf-8', 'replace')
+        with self.lock:
+            self.recorded[key] = {'status': status, 'body': payload, 'headers': headers}
+
+    def _roster_payload(self):
+        """Serialized roster response, cached until the member list changes size"""
+        members = self.guild['members']
+        cached = self.roster_cache
+        if cached is not None and cached[0] == len(members):
+            return cached[1]
+        realm = self.guild['realm']
+        body = json.dumps({'members': [{
+            'character': {
+                'name': m['name'],
+                'id': m['id'],
+                'realm': realm,
+                'level': m['level'],
+            },
+            'rank': m['rank'],
+        } for m in members]}).encode('utf-8')
+        self.roster_cache = (len(members), body)
+        return body
+
+    def _route(self, path):
+        """Return (status, payload) for an API path"""
+        parts = [unquote(p) for p in path.strip('/').split('/')]
+        guild = self.guild
+
+        # /data/wow/guild/{realm}/{guild}[/roster]
+        if parts[:3] == ['data', 'wow', 'guild'] and len(parts) in (5, 6):
+            if len(parts) == 5:
+                return 200, {k: guild[k] for k in ('name', 'realm', 'faction')}
+            if parts[5] == 'roster':
+                return 200, None  # Served pre-serialized by the handler (see _roster_payload)
+
+        # /profile/wow/character/{realm}/{name}[/endpoint]
+        if parts[:3] == ['profile', 'wow', 'character'] and len(parts) in (5, 6):
+            member = self.characters.get(parts[4].lower())
+            if not member or not member.get('indexed', True):
+                return 404, {'code': 404, 'type': 'BLZWEBAPI00000404', 'detail': 'Not Found'}
+
+            if len(parts) == 5:
+                return 200, {
+                    'id': member['id'],
+                    'name': member['name'],
+                    'level': member['level'],
+                    'achievement_points': 0,
+                    'average_item_level': member['average_item_level'],
+                    'equipped_item_level': member['average_item_level'],
+                    'gender': {'name': member['gender']},
+                    'faction': guild['faction'],
+                    'character_class': {'name': member['character_class']},
+                    'race': {'name': member['race']},
+                    'last_login_timestamp': member['last_login_timestamp'],
+                }
+            endpoint = parts[5]
+            if endpoint == 'specializations':
+                trees = TALENT_TREES[member['character_class']]
+                return 200, {'specialization_groups': [{
+                    'is_active': True,
+                    'specializations': [{
+                        'specialization_name': tree,
+                        'spent_points': 31 if tree == member['spec'] else 10,
+                    } for tree in trees] if member['level'] >= 10 else [],
+                }]}
+            if endpoint == 'character-media':
+                return 200, {'assets': [{
+                    'key': 'avatar',
+                    'value': f"https://render.worldofwarcraft.com/mock/{member['id']}-avatar.jpg",
+                }]}
+            if endpoint == 'pvp-summary':
+                return 200, {'honorable_kills': member['honorable_kills'], 'pvp_rank': member['pvp_rank']}
+            if endpoint == 'equipment':
+                return 200, {'equipped_items': []}
+
+        return 404, {'code': 404, 'type': 'BLZWEBAPI00000404', 'detail': 'Not Found'}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Allow keep-alive connections
+            disable_nagle_algorithm = True
+            wbufsize = -1  # Send headers and body in one write
+
+            def setup(self):
+                super().setup()
+                with server.lock:
+                    server.connections += 1
+
+            def log_message(self, format, *args):
+                pass  # Keep benchmark output clean
+
+            def _send_json(self, status, payload, headers=None):
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json;charset=UTF-8')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                if self.headers.get('Connection', '').lower() == 'close':
+                    self.send_header('Connection', 'close')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length) if length else None
+                with server.lock:
+                    server.requests += 1
+                    server.token_requests += 1
+                if server.upstream and urlparse(self.path).path.rstrip('/').endswith('/oauth/token'):
+                    # Recording: exchange the real credentials for a real token (never recorded)
+                    status, content, headers = server._proxy('POST', server.upstream_oauth_url, self.headers, body)
+                    self._send_json(status, content, headers)
+                elif urlparse(self.path).path.rstrip('/').endswith('/oauth/token'):
+                    self._send_json(200, {
+                        'access_token': 'mock-access-token',
+                        'token_type': 'bearer',
+                        'expires_in': 86399,
+                    })
+                else:
+                    self._send_json(404, {'error': 'not_found'})
+
+            def do_GET(self):
+                with server.lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                fault = server._inject_fault()
+                if fault:
+                    self._send_json(*fault)
+                    return
+
+                parsed = urlparse(self.path)
+                path = parsed.path
+                key = fixture_key('GET', path, parsed.query)
+                if server.upstream:
+                    status, content, headers = server._proxy('GET', server.upstream + self.path, self.headers)
+                    server._record(key, status, content, headers)
+                    self._send_json(status, content, headers)
+                    return
+                if server.fixtures is not None:
+                    fixture = server.fixtures.get(key) or server.fixtures.get(fixture_key('GET', path))
+                    if fixture is None:
+                        self._send_json(404, {'code': 404, 'type': 'BLZWEBAPI00000404', 'detail': 'Not Found'})
+                    else:
+                        self._send_json(fixture['status'], fixture['body'], fixture.get('headers'))
+                    return
+
+                status, payload = server._route(path)
+                if status == 200 and payload is None:
+                    payload = server._roster_payload()
+                if status != 200 or not path.startswith('/profile/'):
+                    self._send_json(status, payload)
+                    return
+
+                # Profile endpoints support conditional requests like the real API
+                etag = '"' + hashlib.md5(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest() + '"'
+                validators = {'ETag': etag, 'Last-Modified': server.last_modified}
+                if self.headers.get('If-None-Match') == etag or (
+                    not self.headers.get('If-None-Match')
+                    and self.headers.get('If-Modified-Since') == server.last_modified
+                ):
+                    self.send_response(304)
+                    for name, value in validators.items():
+                        self.send_header(name, value)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self._send_json(status, payload, validators)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Battle.net API stand-in server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--members', type=int, default=50, help='Size of the synthetic guild')
+    parser.add_argument('--guild-name', default='Mock Guild')
+    parser.add_argument('--realm-name', default='Mock Realm')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds of latency added to each API response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of API requests answered with 503')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of API requests answered with 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with injected 429s')
+    parser.add_argument('--unindexed-rate', type=float, default=0.0, help='Fraction of members whose profile answers 404')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for guild generation and fault injection')
+    parser.add_argument('--record', metavar='FILE', help='Proxy to --upstream and record responses to FILE')
+    parser.add_argument('--upstream', default='https://us.api.blizzard.com', help='Real API base URL used with --record')
+    parser.add_argument('--upstream-oauth-url', default='https://oauth.battle.net/token', help='Real OAuth URL used with --record')
+    parser.add_argument('--replay', metavar='FILE', help='Serve responses recorded with --record instead of a synthetic guild')
+    args = parser.parse_args()
+
+    guild = generate_guild(args.members, args.guild_name, args.realm_name, seed=args.seed, unindexed_rate=args.unindexed_rate)
+    server = MockBattleNetServer(
+        guild, host=args.host, port=args.port, latency=args.latency,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+        fixtures=load_fixtures(args.replay) if args.replay else None,
+        upstream=args.upstream if args.record else None,
+        upstream_oauth_url=args.upstream_oauth_url,
+        record_path=args.record, seed=args.seed
+    )
+    realm_slug = guild['realm']['slug']
+    guild_slug = guild['name'].lower().replace(' ', '-')
+
+    print("=" * 60)
+    print("Mock Battle.net API")
+    print("=" * 60)
+    print(f"Listening on: {server.url}")
+    if args.record:
+        print(f"Mode: RECORD (proxying {args.upstream}, writing {args.record})")
+    elif args.replay:
+        print(f"Mode: REPLAY ({len(server.fixtures)} recorded responses from {args.replay})")
+    else:
+        print(f"Guild: {guild['name']} ({len(guild['members'])} members)")
+        print(f"Sync with realm slug '{realm_slug}' and guild slug '{guild_slug}'")
+    if args.error_rate or args.rate_limit_rate:
+        print(f"Fault injection: {args.error_rate:.1%} 503s, {args.rate_limit_rate:.1%} 429s (Retry-After: {args.retry_after}s)")
+    print(f"BNET_OAUTH_URL={server.url}/oauth/token")
+    print(f"BNET_API_BASE_URL={server.url}")
+    print("Press CTRL+C to quit")
+    print("=" * 60)
+
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        if args.record:
+            print(f"Recorded {server.save_fixtures()} responses to {args.record}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Regression test: incremental analytics counters stay equal to a full recount.
+
+Syncs a synthetic guild from the local mock Battle.net server, then churns the
+roster (level, class, spec and race changes, departures, new members) and
+re-syncs roster and details. After every sync the GuildAnalyticsCounter rows
+maintained from deltas must equal recompute_counters(), with ORM and with bulk
+(ROSTER_BULK_UPSERT) roster writes.
+
+Usage:
+    python test_analytics_counters.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_bnet_server import MockBattleNetServer, generate_guild, make_app_config
+
+MEMBERS = 200
+
+
+def churn_roster(members):
+    """Change, remove and add members of a mock guild in place"""
+    for member in members[:20]:
+        member['level'] = 59 if member['level'] == 60 else 60
+    for member in members[20:30]:
+        member['character_class'] = 'Mage'
+        member['spec'] = 'Fire'
+        member['average_item_level'] = 70
+    for member in members[30:40]:
+        member['race'] = 'Orc'
+    del members[40:55]
+    newcomers = generate_guild(20, seed=7)['members']
+    for index, member in enumerate(newcomers):
+        member['id'] = 900000 + index
+        member['name'] = f'Newcomer{index}'
+    members.extend(newcomers)
+
+
+def check_counters_match_recount(bulk_upsert):
+    """Return the number of syncs whose counters were compared"""
+    from app import create_app
+    from app.services import GuildService
+
+    server = MockBattleNetServer(generate_guild(MEMBERS, unindexed_rate=0.1)).start()
+    try:
+        app = create_app(make_app_config(server.url, REDIS_URL=None, ROSTER_BULK_UPSERT=bulk_upsert))
+        with app.app_context():
+            service = GuildService()
+            checked = []
+
+            def check(step):
+                mismatches = service.check_analytics_counters(guild)
+                assert mismatches is not None, f"{step}: counters were never built"
+                assert not mismatches, f"{step}: {len(mismatches)} counters differ from a recount, e.g. {mismatches[0]}"
+                checked.append(step)
+
+            guild, _, _, _ = service.sync_guild_roster('mock-realm', 'mock-guild')
+            check('initial roster sync')
+            service.sync_character_details(guild.id)
+            check('initial detail sync')
+
+            churn_roster(server.guild['members'])
+            server.roster_cache = None
+            guild, _, removed, _ = service.sync_guild_roster('mock-realm', 'mock-guild')
+            assert removed, "Churned roster removed nobody"
+            check('roster sync after churn')
+            service.sync_character_details(guild.id)
+            check('detail sync after churn')
+            return len(checked)
+    finally:
+        server.stop()
+
+
+def test_counters_match_recount_after_churn():
+    check_counters_match_recount(bulk_upsert=False)
+
+
+def test_counters_match_recount_after_churn_bulk_upsert():
+    check_counters_match_recount(bulk_upsert=True)
+
+
+if __name__ == '__main__':
+    print("Incremental analytics counters vs full recount")
+    print("=" * 50)
+    try:
+        for bulk_upsert in (False, True):
+            syncs = check_counters_match_recount(bulk_upsert)
+            print(f"{'Bulk' if bulk_upsert else 'ORM'} roster writes: counters equal a recount after {syncs} syncs")
+        print("✅ Incremental counters match a full recount")
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Regression test: the SQL guild analytics match the original Python computation.
+
+Syncs a synthetic guild from the local mock Battle.net server, blanks a few
+fields the analytics bucket as 'Unknown', and compares
+compute_guild_analytics() (GROUP BY queries, app/analytics.py) with a
+reference that counts every Character in Python the way get_guild_analytics
+used to.
+
+Usage:
+    python test_guild_analytics.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_bnet_server import MockBattleNetServer, generate_guild, make_app_config
+
+MEMBERS = 150
+UNINDEXED_RATE = 0.2
+
+
+def python_analytics(characters):
+    """The analytics values computed per character in Python (the pre-SQL implementation)"""
+    class_distribution = {}
+    race_distribution = {}
+    level_distribution = {}
+    level_class_distribution = {}
+    all_classes = set()
+    spec_distribution = {}
+    for char in characters:
+        level = char.level or 0
+        class_name = char.character_class or 'Unknown'
+        class_distribution[class_name] = class_distribution.get(class_name, 0) + 1
+        race_name = char.race or 'Unknown'
+        race_distribution[race_name] = race_distribution.get(race_name, 0) + 1
+        level_distribution[level] = level_distribution.get(level, 0) + 1
+        if level != 60:
+            all_classes.add(class_name)
+            level_class_distribution.setdefault(level, {})
+            level_class_distribution[level][class_name] = level_class_distribution[level].get(class_name, 0) + 1
+        if char.spec_name:
+            spec_distribution[char.spec_name] = spec_distribution.get(char.spec_name, 0) + 1
+
+    level_60_chars = [char for char in characters if char.level == 60]
+    level_60_by_class = {}
+    level_60_class_spec = {}
+    for char in level_60_chars:
+        class_name = char.character_class or 'Unknown'
+        level_60_by_class[class_name] = level_60_by_class.get(class_name, 0) + 1
+        spec_name = char.spec_name or 'Unknown'
+        level_60_class_spec.setdefault(class_name, {})
+        level_60_class_spec[class_name][spec_name] = level_60_class_spec[class_name].get(spec_name, 0) + 1
+    level_60_percentages = {
+        class_name: round((count / len(level_60_chars)) * 100, 1)
+        for class_name, count in level_60_by_class.items()
+    }
+
+    item_levels = [char.average_item_level for char in characters if char.average_item_level]
+    chars_with_profiles = sum(1 for char in characters if char.average_item_level or char.gender)
+    top_pvp_60 = sorted(
+        (char for char in level_60_chars if char.honorable_kills and char.honorable_kills > 0),
+        key=lambda char: (-char.honorable_kills, char.id)
+    )[:5]
+
+    return {
+        'total_members': len(characters),
+        'class_distribution': class_distribution,
+        'race_distribution': race_distribution,
+        'level_distribution': level_distribution,
+        'level_class_distribution': level_class_distribution,
+        'all_classes': sorted(all_classes),
+        'level_60_count': len(level_60_chars),
+        'level_60_by_class': level_60_by_class,
+        'level_60_percentages': level_60_percentages,
+        'level_60_class_spec': level_60_class_spec,
+        'average_item_level': round(sum(item_levels) / len(item_levels), 2) if item_levels else 0,
+        'top_pvp_60': [char.id for char in top_pvp_60],
+        'spec_distribution': spec_distribution,
+        'data_completeness': round((chars_with_profiles / len(characters) * 100), 1) if characters else 0,
+        'chars_with_profiles': chars_with_profiles,
+    }
+
+
+def check_sql_analytics_match_python():
+    """Return the number of members compared"""
+    from app import create_app, db
+    from app.models import Character
+    from app.analytics import compute_guild_analytics
+    from app.services import GuildService
+
+    server = MockBattleNetServer(generate_guild(MEMBERS, unindexed_rate=UNINDEXED_RATE)).start()
+    try:
+        app = create_app(make_app_config(server.url, REDIS_URL=None))
+        with app.app_context():
+            service = GuildService()
+            guild, _, _, _ = service.sync_guild_roster('mock-realm', 'mock-guild')
+            service.sync_character_details(guild.id)
+
+            # NULL and empty strings are both bucketed as 'Unknown' (or left out of the spec chart)
+            characters = Character.query.filter_by(guild_id=guild.id).order_by(Character.id).all()
+            for character in characters[:3]:
+                character.character_class = None
+            for character in characters[3:6]:
+                character.race = ''
+            for character in characters[6:9]:
+                character.spec_name = ''
+            for character in characters[9:12]:
+                character.level = None
+            db.session.commit()
+
+            # Count from scratch with the GROUP BY queries, not the stored counters
+            guild.counters_rebuilt_at = None
+            analytics = compute_guild_analytics(guild)
+            db.session.rollback()
+
+            expected = python_analytics(Character.query.filter_by(guild_id=guild.id).all())
+            assert expected['level_60_count'] and expected['top_pvp_60'], "Mock guild has no level 60 PvP characters"
+            actual = {key: analytics[key] for key in expected}
+            actual['top_pvp_60'] = [char.id for char in analytics['top_pvp_60']]
+            for key in expected:
+                assert actual[key] == expected[key], f"{key}: SQL {actual[key]!r} != Python {expected[key]!r}"
+            assert analytics['characters'].count() == len(characters), "'characters' query does not cover the guild"
+            return len(characters)
+    finally:
+        server.stop()
+
+
+def test_sql_analytics_match_python():
+    check_sql_analytics_match_python()
+
+
+if __name__ == '__main__':
+    print("SQL guild analytics vs Python computation")
+    print("=" * 50)
+    try:
+        members = check_sql_analytics_match_python()
+        print(f"{members} members, every analytics value identical")
+        print("✅ SQL analytics match the Python computation")
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Regression test: the API token buckets enforce their per-second and per-hour limits.
+
+Drains the per-second and per-hour windows of a bucket and checks that the next
+token is refused with the wait the refill rate implies, that a refused call
+takes no token from either window, and that acquire() gives up after
+API_RATE_LIMIT_MAX_WAIT. Runs against the in-process fallback and, when the
+fakeredis package (with lupa) is installed, against the Redis Lua script,
+where two RateLimiter instances stand in for two worker processes sharing
+one quota.
+
+Usage:
+    python test_rate_limiter.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_bnet_server import make_app_config
+
+PER_SECOND = 5
+PER_HOUR = 8
+
+
+def make_app():
+    from app import create_app
+    return create_app(make_app_config(
+        'http://127.0.0.1:9',
+        REDIS_URL=None,
+        API_RATE_LIMIT_PROFILE_PER_SECOND=PER_SECOND,
+        API_RATE_LIMIT_PROFILE_PER_HOUR=PER_HOUR,
+        API_RATE_LIMIT_MAX_WAIT=0.5,
+    ))
+
+
+def check_bucket_limits(first, second):
+    """
+    Drain the 'profile' bucket through two limiters (the same one for the local
+    fallback, two instances sharing Redis for the Lua script).
+    Returns the refusal waits in seconds: (per-second window, per-hour window).
+    """
+    from app.rate_limiter import RateLimitWaitExceeded
+
+    limits = first._limits('profile')
+    for _ in range(PER_SECOND):
+        assert first._try_acquire('profile', limits) == 0, "Token refused below the per-second limit"
+    second_wait = second._try_acquire('profile', limits)
+    assert 0 < second_wait <= 1.0 / PER_SECOND + 0.01, f"Per-second window: expected a wait of ~{1.0 / PER_SECOND}s, got {second_wait}s"
+
+    # The data bucket has its own quota
+    assert second._try_acquire('data', second._limits('data')) == 0, "Profile calls drained the data bucket"
+
+    # Refusals take no token from either window: exactly PER_HOUR - PER_SECOND are left in the hour
+    taken = PER_SECOND
+    while taken < PER_HOUR:
+        wait = second._try_acquire('profile', limits)
+        if wait:
+            assert wait <= 1.0 / PER_SECOND + 0.01, f"Per-hour window refused early ({taken} of {PER_HOUR} tokens)"
+            time.sleep(wait)
+        else:
+            taken += 1
+    hour_wait = first._try_acquire('profile', limits)
+    assert hour_wait > 3600.0 / PER_HOUR * 0.9, f"Per-hour window: expected a wait of ~{3600.0 / PER_HOUR}s, got {hour_wait}s"
+
+    try:
+        second.acquire('profile')
+        raise AssertionError("acquire() did not give up after API_RATE_LIMIT_MAX_WAIT")
+    except RateLimitWaitExceeded:
+        pass
+    return second_wait, hour_wait
+
+
+def check_local_buckets():
+    from app.rate_limiter import RateLimiter
+
+    with make_app().app_context():
+        limiter = RateLimiter()
+        return check_bucket_limits(limiter, limiter)
+
+
+def check_redis_buckets():
+    """Same checks against the Lua script; returns None when fakeredis is not installed"""
+    try:
+        import fakeredis
+        import lupa  # noqa: F401 - fakeredis needs it for EVAL
+    except ImportError:
+        return None
+    from app import redis_client
+    from app.rate_limiter import RateLimiter
+
+    app = make_app()
+    app.config['REDIS_URL'] = 'redis://fake'
+    saved = redis_client._client, redis_client._client_pid
+    redis_client._client, redis_client._client_pid = fakeredis.FakeRedis(), os.getpid()
+    try:
+        with app.app_context():
+            first, second = RateLimiter(), RateLimiter()
+            waits = check_bucket_limits(first, second)
+            acquired = first.get_metrics()['all_processes']['profile']['acquired']
+            assert acquired == PER_HOUR, f"Shared metrics counted {acquired} tokens, expected {PER_HOUR}"
+            return waits
+    finally:
+        redis_client._client, redis_client._client_pid = saved
+
+
+def test_local_token_buckets():
+    check_local_buckets()
+
+
+def test_redis_token_buckets():
+    check_redis_buckets()
+
+
+if __name__ == '__main__':
+    print("API rate limiter token buckets")
+    print("=" * 50)
+    try:
+        second_wait, hour_wait = check_local_buckets()
+        print(f"In-process: refused after {PER_SECOND}/s (wait {second_wait:.2f}s) and {PER_HOUR}/h (wait {hour_wait:.0f}s)")
+        waits = check_redis_buckets()
+        if waits is None:
+            print("Redis Lua script: skipped (fakeredis not installed)")
+        else:
+            print(f"Redis Lua script: refused after {PER_SECOND}/s (wait {waits[0]:.2f}s) and {PER_HOUR}/h (wait {waits[1]:.0f}s) across two limiters")
+        print("✅ Token buckets enforce their limits")
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Regression test: characters the API does not index cannot starve the refresh budget.
+
+Syncs a synthetic guild in which some members answer 404 from the local mock
+Battle.net server, ages the fetched members so they are due for a refresh, and
+checks that select_characters_for_refresh() hands the budget to those members
+instead of the unindexed ones (which a detail sync skips without an API call).
+
+Usage:
+    python test_refresh_policy.py
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_bnet_server import MockBattleNetServer, generate_guild, make_app_config
+
+MEMBERS = 120
+UNINDEXED_RATE = 0.4
+BUDGET = 20
+
+
+def check_unindexed_characters_do_not_starve_budget():
+    """Return (selected, unindexed) character ID sets after aging the fetched members"""
+    from app import create_app, db
+    from app.models import Character, UnindexedCharacter
+    from app.services import GuildService
+
+    server = MockBattleNetServer(generate_guild(MEMBERS, unindexed_rate=UNINDEXED_RATE)).start()
+    try:
+        app = create_app(make_app_config(server.url, REDIS_URL=None))
+        with app.app_context():
+            service = GuildService()
+            guild, _, _, _ = service.sync_guild_roster('mock-realm', 'mock-guild')
+            service.sync_character_details(guild.id)
+            # A second run skips the 404 characters via the unindexed cache
+            service.sync_character_details(guild.id)
+
+            unindexed_names = {entry.name for entry in UnindexedCharacter.query.all()}
+            characters = Character.query.filter_by(guild_id=guild.id).all()
+            unindexed = {c.id for c in characters if c.name.lower() in unindexed_names}
+            assert unindexed, "Mock guild has no unindexed characters"
+            assert all(c.details_checked_at is not None for c in characters), "Some characters were never stamped"
+
+            # Everyone who was fetched is now long overdue
+            stale = datetime.utcnow() - timedelta(days=30)
+            for character in characters:
+                if character.id not in unindexed:
+                    character.details_checked_at = stale
+            db.session.commit()
+
+            due = service.select_characters_for_refresh(guild.id, limit=BUDGET)
+            selected = set(due.get(guild.id, []))
+            assert len(selected) == BUDGET, f"Expected {BUDGET} due characters, got {len(selected)}"
+            assert not selected & unindexed, f"Unindexed characters took {len(selected & unindexed)} of {BUDGET} slots"
+            return selected, unindexed
+    finally:
+        server.stop()
+
+
+def test_unindexed_characters_do_not_starve_refresh_budget():
+    check_unindexed_characters_do_not_starve_budget()
+
+
+if __name__ == '__main__':
+    print("Refresh budget with unindexed characters")
+    print("=" * 50)
+    try:
+        selected, unindexed = check_unindexed_characters_do_not_starve_budget()
+        print(f"{len(unindexed)} unindexed characters, {len(selected)} budget slots, none taken by unindexed")
+        print("✅ Unindexed characters cannot starve the refresh budget")
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Regression test: RetryPolicy backs off exponentially with jitter and honours Retry-After.
+
+Samples RetryPolicy.delay_for() for every attempt and checks the full-jitter
+bounds, the give-up rules (attempts exhausted, non-retryable status, a
+Retry-After longer than API_RETRY_AFTER_MAX) and Retry-After parsing. Then
+fetches character profiles from the local mock Battle.net server with injected
+429s, recording every retry delay instead of sleeping, and checks that each 429
+was retried once and never before its Retry-After.
+
+Usage:
+    python test_retry_policy.py
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_bnet_server import MockBattleNetServer, generate_guild, make_app_config
+
+BASE_DELAY = 0.5
+MAX_DELAY = 3.0
+MAX_ATTEMPTS = 5
+MAX_RETRY_AFTER = 10.0
+SAMPLES = 400
+RETRY_AFTER = 2
+
+
+def check_backoff_and_give_up():
+    """Return the largest sampled delay per attempt"""
+    from app.bnet_api import (RetryPolicy, BattleNetAPIError, BattleNetNotFoundError, BattleNetAuthError,
+                              BattleNetRateLimitError, BattleNetServerError, BattleNetConnectionError)
+
+    policy = RetryPolicy(MAX_ATTEMPTS, BASE_DELAY, MAX_DELAY, MAX_RETRY_AFTER)
+    transient = BattleNetServerError('503', 503, retryable=True)
+
+    largest = []
+    for attempt in range(MAX_ATTEMPTS - 1):
+        cap = min(MAX_DELAY, BASE_DELAY * 2 ** attempt)
+        delays = [policy.delay_for(attempt, transient) for _ in range(SAMPLES)]
+        assert all(0 <= delay <= cap for delay in delays), f"Attempt {attempt}: delay outside [0, {cap}]"
+        # Full jitter spreads retries over the whole window
+        assert max(delays) > cap * 0.8 and min(delays) < cap * 0.2, f"Attempt {attempt}: delays not spread over [0, {cap}]"
+        largest.append(max(delays))
+    assert policy.delay_for(MAX_ATTEMPTS - 1, transient) is None, "Retried after the last attempt"
+
+    for error in (BattleNetNotFoundError('404', 404), BattleNetAuthError('403', 403), BattleNetAPIError('400', 400)):
+        assert policy.delay_for(0, error) is None, f"Retried non-retryable {error.status_code}"
+    for error in (BattleNetAuthError('401', 401, retryable=True), BattleNetConnectionError('timeout', retryable=True)):
+        assert policy.delay_for(0, error) is not None, f"Did not retry {error}"
+
+    throttled = BattleNetRateLimitError('429', 429, retryable=True, retry_after=RETRY_AFTER)
+    assert all(policy.delay_for(0, throttled) >= RETRY_AFTER for _ in range(SAMPLES)), "Retried before Retry-After"
+    too_long = BattleNetRateLimitError('429', 429, retryable=True, retry_after=MAX_RETRY_AFTER + 1)
+    assert policy.delay_for(0, too_long) is None, "Waited for a Retry-After above API_RETRY_AFTER_MAX"
+    return largest
+
+
+def check_retry_after_parsing():
+    from app.bnet_api import _parse_retry_after
+
+    assert _parse_retry_after('7') == 7.0
+    assert _parse_retry_after('-3') == 0.0
+    assert _parse_retry_after(None) is None and _parse_retry_after('soon') is None
+    http_date = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 <= _parse_retry_after(http_date) <= 30, f"HTTP date Retry-After parsed as {_parse_retry_after(http_date)}"
+
+
+def check_retries_against_mock_server():
+    """Return (injected errors, retry delays)"""
+    from app import create_app
+    from app.bnet_api import BattleNetAPI
+
+    server = MockBattleNetServer(
+        generate_guild(40), rate_limit_rate=0.3, retry_after=RETRY_AFTER, seed=3
+    ).start()
+    delays = []
+    real_sleep = time.sleep
+    try:
+        app = create_app(make_app_config(
+            server.url, REDIS_URL=None, API_RATE_LIMIT_ENABLED=False, API_MAX_RETRIES=20,
+            API_RETRY_DELAY=BASE_DELAY, API_RETRY_MAX_DELAY=MAX_DELAY, API_RETRY_AFTER_MAX=MAX_RETRY_AFTER
+        ))
+        with app.app_context():
+            api = BattleNetAPI()
+            api.get_access_token()
+            time.sleep = delays.append  # Record retry delays instead of waiting
+            for member in server.guild['members']:
+                profile = api.get_character_profile('mock-realm', member['name'].lower())
+                assert profile['name'] == member['name'], f"Wrong profile for {member['name']}"
+    finally:
+        time.sleep = real_sleep
+        server.stop()
+
+    assert server.injected_errors, "Mock server injected no errors"
+    assert len(delays) == server.injected_errors, f"{server.injected_errors} injected errors, {len(delays)} retries"
+    assert all(delay >= RETRY_AFTER for delay in delays), f"Retried a 429 after {min(delays):.2f}s, before its Retry-After"
+    assert all(delay <= max(MAX_DELAY, RETRY_AFTER) for delay in delays), "Retry delay above its cap"
+    return server.injected_errors, delays
+
+
+def test_backoff_and_give_up():
+    check_backoff_and_give_up()
+
+
+def test_retry_after_parsing():
+    check_retry_after_parsing()
+
+
+def test_retries_against_mock_server():
+    check_retries_against_mock_server()
+
+
+if __name__ == '__main__':
+    print("Battle.net API retry policy")
+    print("=" * 50)
+    try:
+        largest = check_backoff_and_give_up()
+        print("Largest sampled delay per attempt: " + ", ".join(f"{delay:.2f}s" for delay in largest))
+        check_retry_after_parsing()
+        injected, delays = check_retries_against_mock_server()
+        print(f"Mock server: {injected} injected 429s, {len(delays)} retries, none before Retry-After")
+        print("✅ Retry policy backs off and honours Retry-After")
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
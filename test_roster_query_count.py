@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Regression test: SQL statements issued by GuildService.sync_guild_roster.
+
+Syncs synthetic guilds of different sizes from the local mock Battle.net server
+into an in-memory database and checks that the number of statements does not
+grow with the roster size (no per-member queries or flushes), both for the
+initial sync and for a re-sync of existing members (progression tracking).
+
+Usage:
+    python test_roster_query_count.py
+"""
+import os
+import sys
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_bnet_server import MockBattleNetServer, generate_guild, make_app_config
+
+ROSTER_SIZES = (50, 500)
+
+
+class StatementCounter:
+    """
+    Counts statements executed on an engine while active.
+    
+    Uses before_execute, so a flush that inserts many rows with one executemany
+    counts once even where the driver sends the rows in several batches.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, conn, clauseelement, multiparams, params, execution_options):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_execute', self._on_execute)
+
+
+def count_roster_sync_statements(member_count):
+    """Statements issued by (initial sync, re-sync) of a guild with `member_count` members"""
+    from app import create_app, db
+    from app.services import GuildService
+
+    server = MockBattleNetServer(generate_guild(member_count)).start()
+    try:
+        app = create_app(make_app_config(server.url))
+        with app.app_context():
+            service = GuildService()
+            with StatementCounter(db.engine) as initial:
+                service.sync_guild_roster('mock-realm', 'mock-guild')
+            
+            # Promote everyone so the roster fingerprint changes; every member now exists
+            # without progression history, so the re-sync looks up and records a first
+            # progression entry for each of them
+            for member in server.guild['members']:
+                member['rank'] = (member['rank'] + 1) % 10
+            server.roster_cache = None
+            with StatementCounter(db.engine) as resync:
+                service.sync_guild_roster('mock-realm', 'mock-guild')
+            return initial.count, resync.count
+    finally:
+        server.stop()
+
+
+def check_statement_counts():
+    """Return {roster size: statements}, asserting the count is the same for every size"""
+    counts = {size: count_roster_sync_statements(size) for size in ROSTER_SIZES}
+    assert len(set(counts.values())) == 1, f"Statement count grows with roster size: {counts}"
+    return counts
+
+
+def test_roster_sync_statement_count_is_constant():
+    check_statement_counts()
+
+
+if __name__ == '__main__':
+    print("Roster sync statement count")
+    print("=" * 50)
+    try:
+        counts = check_statement_counts()
+        for size, count in counts.items():
+            print(f"{size:>6} members: {count[0]} statements (initial sync), {count[1]} (re-sync)")
+        print("✅ Statement count is independent of roster size")
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
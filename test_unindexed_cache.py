@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Regression test: the unindexed character cache skips 404 characters until their
+entry expires or their level changes.
+
+Syncs a synthetic guild in which some members answer 404 from the local mock
+Battle.net server, then checks that the next detail sync skips exactly the
+cached characters without an API call, that an expired entry or a changed
+roster level makes the character be probed again, that a character which
+became indexed loses its entry, and that prune_unindexed_characters() only
+deletes expired entries.
+
+Usage:
+    python test_unindexed_cache.py
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_bnet_server import MockBattleNetServer, generate_guild, make_app_config
+
+MEMBERS = 60
+UNINDEXED_RATE = 0.3
+
+
+def check_negative_cache():
+    """Return the number of unindexed characters"""
+    from app import create_app, db
+    from app.models import Character, UnindexedCharacter
+    from app.services import GuildService
+
+    server = MockBattleNetServer(generate_guild(MEMBERS, unindexed_rate=UNINDEXED_RATE)).start()
+    try:
+        app = create_app(make_app_config(server.url, REDIS_URL=None))
+        with app.app_context():
+            service = GuildService()
+            guild, _, _, _ = service.sync_guild_roster('mock-realm', 'mock-guild')
+            service.sync_character_details(guild.id)
+
+            def entries():
+                return {entry.name: entry for entry in UnindexedCharacter.query.all()}
+
+            def sync():
+                server.reset_stats()
+                result = service.sync_character_details(guild.id)
+                return result, server.requests
+
+            unindexed = {m['name'].lower() for m in server.guild['members'] if not m['indexed']}
+            assert unindexed and set(entries()) == unindexed, "404 characters were not all cached"
+
+            # Every cached character is skipped without a request
+            result, requests_all_skipped = sync()
+            assert result['unindexed_skipped'] == len(unindexed), f"Skipped {result['unindexed_skipped']} of {len(unindexed)}"
+
+            # An expired entry and a changed roster level are each probed once more
+            names = sorted(unindexed)
+            expired, leveled = names[0], names[1]
+            entries()[expired].expires_at = datetime.utcnow() - timedelta(minutes=1)
+            character = Character.query.filter(Character.guild_id == guild.id, db.func.lower(Character.name) == leveled).one()
+            character.level = (character.level or 0) + 1
+            db.session.commit()
+            result, requests = sync()
+            assert result['unindexed_skipped'] == len(unindexed) - 2, "Expired or re-leveled entry was still skipped"
+            assert requests > requests_all_skipped, "Re-probe made no API request"
+            refreshed = entries()
+            assert refreshed[expired].expires_at > datetime.utcnow(), "Second 404 did not renew the entry"
+            assert refreshed[leveled].level == character.level, "Entry does not record the new level"
+
+            # A character that became indexed loses its entry once it is probed again
+            indexed_now = names[2]
+            server.characters[indexed_now]['indexed'] = True
+            refreshed[indexed_now].expires_at = datetime.utcnow() - timedelta(minutes=1)
+            db.session.commit()
+            result, _ = sync()
+            assert indexed_now not in entries(), "Entry of a now indexed character was kept"
+            assert result['unindexed_skipped'] == len(unindexed) - 1
+
+            # The prune task drops expired entries only
+            stale = names[3]
+            entries()[stale].expires_at = datetime.utcnow() - timedelta(minutes=1)
+            db.session.commit()
+            assert service.prune_unindexed_characters() == 1, "Prune did not delete exactly the expired entry"
+            db.session.commit()
+            assert set(entries()) == unindexed - {indexed_now, stale}
+            return len(unindexed)
+    finally:
+        server.stop()
+
+
+def test_negative_cache_ttl_and_level_reprobe():
+    check_negative_cache()
+
+
+if __name__ == '__main__':
+    print("Unindexed character cache")
+    print("=" * 50)
+    try:
+        unindexed = check_negative_cache()
+        print(f"{unindexed} unindexed characters skipped until expiry or a level change")
+        print("✅ Negative cache honours its TTL and re-probes on level changes")
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)